@@ -0,0 +1,302 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import Date, event, func, inspect, select, delete, case, cast
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import (
+    Item, StockMovement, Alert, CategoryStat, MovementHourStat, StatCounter,
+    MovementDayStat, CategoryMovementDayStat
+)
+
+logger = logging.getLogger(__name__)
+
+# Counters behind /api/statistics and /api/dashboard/summary. Every write path
+# applies its delta in the same transaction: ORM flushes through the session
+# hook below, the Core writers (movements, ingest) call the apply_* helpers.
+# reconcile() rebuilds everything from the base tables; the daily movement
+# rollups only for recent days, rebuild_movement_days() covers full history.
+
+ACTIVE_ALERTS = 'active_alerts'
+RECONCILED_AT = 'reconciled_at'
+MOVEMENT_WINDOW = timedelta(days=7)
+
+ITEM_STAT_COLUMNS = ('category', 'quantity', 'unit_price', 'minimum_stock')
+DAY_TOTAL_COLUMNS = ('in_quantity', 'in_count', 'out_quantity', 'out_count')
+
+
+def bump(conn, table, keys, increments):
+    # Atomically add increments to the row identified by keys, creating it if needed
+    dialect = conn.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = (sqlite if dialect == 'sqlite' else postgresql).insert(table)
+        stmt = insert.values(**keys, **increments).on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: table.c[column] + insert.excluded[column] for column in increments}
+        )
+        conn.execute(stmt)
+        return
+    where = [table.c[column] == value for column, value in keys.items()]
+    updated = conn.execute(table.update().where(*where).values(
+        **{column: table.c[column] + value for column, value in increments.items()}
+    ))
+    if updated.rowcount == 0:
+        conn.execute(table.insert().values(**keys, **increments))
+
+
+def _contribution(row):
+    quantity = row['quantity'] or 0
+    minimum_stock = row['minimum_stock']
+    return {
+        'item_count': 1,
+        'total_quantity': quantity,
+        'total_value': quantity * row['unit_price'] if row['unit_price'] is not None else 0,
+        'low_stock_count': int(minimum_stock is not None and quantity <= minimum_stock),
+    }
+
+
+def apply_item_changes(conn, changes):
+    # changes: (old, new) pairs of item column mappings, None for insert/delete
+    deltas = defaultdict(lambda: defaultdict(float))
+    for old, new in changes:
+        if old is not None:
+            for column, value in _contribution(old).items():
+                deltas[old['category']][column] -= value
+        if new is not None:
+            for column, value in _contribution(new).items():
+                deltas[new['category']][column] += value
+
+    table = CategoryStat.__table__
+    for category, increments in deltas.items():
+        increments = {column: value for column, value in increments.items() if value}
+        if increments:
+            bump(conn, table, {'category': category}, increments)
+
+
+def apply_movements(conn, timestamps):
+    hours = defaultdict(int)
+    for timestamp in timestamps:
+        hours[timestamp.replace(minute=0, second=0, microsecond=0)] += 1
+    for hour, count in hours.items():
+        bump(conn, MovementHourStat.__table__, {'hour': hour}, {'movement_count': count})
+
+
+def apply_movement_days(conn, movements):
+    # movements: mappings with item_id, category, movement_type, quantity_changed, timestamp
+    by_item = defaultdict(lambda: defaultdict(int))
+    by_category = defaultdict(lambda: defaultdict(int))
+    for movement in movements:
+        direction = 'in' if movement['movement_type'] == 'in' else 'out'
+        day = movement['timestamp'].date()
+        for totals in (by_item[(day, movement['item_id'])], by_category[(day, movement['category'])]):
+            totals[f'{direction}_quantity'] += movement['quantity_changed']
+            totals[f'{direction}_count'] += 1
+
+    for (day, item_id), increments in by_item.items():
+        bump(conn, MovementDayStat.__table__, {'day': day, 'item_id': item_id}, increments)
+    for (day, category), increments in by_category.items():
+        bump(conn, CategoryMovementDayStat.__table__, {'day': day, 'category': category}, increments)
+
+
+def movement_day(conn, column):
+    # SQLite has no DATE type; date() gives the ISO string a Date column stores
+    if conn.dialect.name == 'sqlite':
+        return func.date(column)
+    return cast(column, Date)
+
+
+def rebuild_movement_days(conn, since=None):
+    # Recomputes the daily rollups from stock_movement, for days >= since (all history if None).
+    # Category totals use each item's current category.
+    movements = StockMovement.__table__
+    items = Item.__table__
+    day = movement_day(conn, movements.c.timestamp)
+    inbound = movements.c.movement_type == 'in'
+    totals = [
+        func.coalesce(func.sum(case((inbound, movements.c.quantity_changed), else_=0)), 0),
+        func.coalesce(func.sum(case((inbound, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((inbound, 0), else_=movements.c.quantity_changed)), 0),
+        func.coalesce(func.sum(case((inbound, 0), else_=1)), 0),
+    ]
+
+    for table, key, source in (
+        (MovementDayStat.__table__, movements.c.item_id, movements),
+        (CategoryMovementDayStat.__table__, items.c.category, movements.join(items, items.c.id == movements.c.item_id)),
+    ):
+        stale = delete(table)
+        query = select(day, key, *totals).select_from(source).group_by(day, key)
+        if since is not None:
+            stale = stale.where(table.c.day >= since)
+            query = query.where(movements.c.timestamp >= datetime.combine(since, time.min))
+        conn.execute(stale)
+        conn.execute(table.insert().from_select(['day', key.name, *DAY_TOTAL_COLUMNS], query))
+
+
+def apply_active_alerts(conn, delta):
+    if delta:
+        bump(conn, StatCounter.__table__, {'name': ACTIVE_ALERTS}, {'value': delta})
+
+
+def reconcile(conn, now=None):
+    now = now or datetime.utcnow()
+    items = Item.__table__
+    movements = StockMovement.__table__
+    alerts = Alert.__table__
+
+    category_rows = conn.execute(select(
+        items.c.category,
+        func.count(items.c.id),
+        func.coalesce(func.sum(items.c.quantity), 0),
+        func.coalesce(func.sum(items.c.quantity * items.c.unit_price), 0),
+        func.coalesce(func.sum(case((items.c.quantity <= items.c.minimum_stock, 1), else_=0)), 0),
+    ).group_by(items.c.category)).all()
+    conn.execute(delete(CategoryStat.__table__))
+    if category_rows:
+        conn.execute(CategoryStat.__table__.insert(), [
+            {'category': row[0], 'item_count': row[1], 'total_quantity': row[2],
+             'total_value': row[3], 'low_stock_count': row[4]}
+            for row in category_rows
+        ])
+
+    # Only the buckets the dashboard can still see are rebuilt
+    since = (now - MOVEMENT_WINDOW).replace(minute=0, second=0, microsecond=0)
+    conn.execute(delete(MovementHourStat.__table__))
+    timestamps = conn.execute(select(movements.c.timestamp).where(movements.c.timestamp >= since)).scalars()
+    apply_movements(conn, timestamps)
+    rebuild_movement_days(conn, since=(now - timedelta(days=1)).date())
+
+    active = conn.execute(select(func.count()).select_from(alerts).where(alerts.c.status == 'active')).scalar()
+    counters = StatCounter.__table__
+    conn.execute(delete(counters).where(counters.c.name.in_([ACTIVE_ALERTS, RECONCILED_AT])))
+    conn.execute(counters.insert(), [
+        {'name': ACTIVE_ALERTS, 'value': active},
+        {'name': RECONCILED_AT, 'value': now.timestamp()},
+    ])
+
+
+def ensure_reconciled(session):
+    # Aggregate tables start empty on an existing database
+    if session.get(StatCounter, RECONCILED_AT) is None:
+        reconcile(session.connection())
+        session.commit()
+
+
+def statistics(session):
+    ensure_reconciled(session)
+    rows = session.execute(select(CategoryStat.__table__)).all()
+    return {
+        'total_items': int(sum(row.item_count for row in rows)),
+        'total_quantity': int(sum(row.total_quantity for row in rows)),
+        'total_value': sum(row.total_value for row in rows),
+        'low_stock_items': int(sum(row.low_stock_count for row in rows)),
+        'categories_distribution': {row.category: row.item_count for row in rows if row.item_count},
+    }
+
+
+def weekly_movements(session, now=None):
+    ensure_reconciled(session)
+    since = (now or datetime.utcnow()) - MOVEMENT_WINDOW
+    hours = MovementHourStat.__table__
+    return session.execute(
+        select(func.coalesce(func.sum(hours.c.movement_count), 0)).where(hours.c.hour >= since)
+    ).scalar()
+
+
+def active_alerts(session):
+    ensure_reconciled(session)
+    counter = session.get(StatCounter, ACTIVE_ALERTS)
+    return int(counter.value) if counter else 0
+
+
+def dashboard_summary(session, now=None):
+    stats = statistics(session)
+    return {
+        'total_inventory_value': round(stats['total_value'], 2),
+        'low_stock_items': stats['low_stock_items'],
+        'weekly_movements': weekly_movements(session, now),
+        'active_alerts': active_alerts(session),
+    }
+
+
+def prune_movement_hours(conn, now=None):
+    since = (now or datetime.utcnow()) - MOVEMENT_WINDOW - timedelta(hours=1)
+    hours = MovementHourStat.__table__
+    conn.execute(delete(hours).where(hours.c.hour < since))
+
+
+def _history(obj, keys):
+    state = inspect(obj)
+    old, new = {}, {}
+    for key in keys:
+        history = state.attrs[key].load_history()
+        current = history.unchanged[0] if history.unchanged else None
+        new[key] = history.added[0] if history.added else current
+        old[key] = history.deleted[0] if history.deleted else current
+    return old, new
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_orm_changes(session, flush_context):
+    item_changes = []
+    movement_times = []
+    new_movements = []
+    alert_delta = 0
+
+    for obj in session.new:
+        if isinstance(obj, Item):
+            item_changes.append((None, {key: getattr(obj, key) for key in ITEM_STAT_COLUMNS}))
+        elif isinstance(obj, StockMovement):
+            movement_times.append(obj.timestamp)
+            new_movements.append({
+                'item_id': obj.item_id, 'movement_type': obj.movement_type,
+                'quantity_changed': obj.quantity_changed, 'timestamp': obj.timestamp,
+            })
+        elif isinstance(obj, Alert):
+            alert_delta += (obj.status or 'active') == 'active'
+    for obj in session.dirty:
+        if isinstance(obj, Item) and session.is_modified(obj):
+            old, new = _history(obj, ITEM_STAT_COLUMNS)
+            if old != new:
+                item_changes.append((old, new))
+        elif isinstance(obj, Alert):
+            old, new = _history(obj, ('status',))
+            alert_delta += (new['status'] == 'active') - (old['status'] == 'active')
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            item_changes.append((_history(obj, ITEM_STAT_COLUMNS)[0], None))
+        elif isinstance(obj, Alert):
+            alert_delta -= _history(obj, ('status',))[0]['status'] == 'active'
+
+    if item_changes or movement_times or alert_delta:
+        conn = session.connection()
+        apply_item_changes(conn, item_changes)
+        apply_movements(conn, movement_times)
+        apply_active_alerts(conn, alert_delta)
+        if new_movements:
+            items = Item.__table__
+            categories = dict(conn.execute(select(items.c.id, items.c.category).where(
+                items.c.id.in_({movement['item_id'] for movement in new_movements})
+            )).all())
+            apply_movement_days(conn, [
+                dict(movement, category=categories.get(movement['item_id'])) for movement in new_movements
+            ])
+
+
+def start_reconciler(engine, interval):
+    # Periodically rebuilds the aggregates to correct any drift
+    def run():
+        while not stop.wait(interval):
+            try:
+                with engine.begin() as conn:
+                    reconcile(conn)
+                    prune_movement_hours(conn)
+            except Exception as e:
+                logger.error(f"Aggregate reconcile failed: {str(e)}")
+
+    stop = threading.Event()
+    thread = threading.Thread(target=run, name='aggregate-reconciler', daemon=True)
+    thread.start()
+    return stop
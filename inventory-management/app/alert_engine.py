@@ -0,0 +1,143 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import String, and_, cast, exists, func, literal, select
+
+from models import Item, Alert
+from aggregates import apply_active_alerts
+from audit import audit_writer, write_changes
+from pubsub import publish_alert_summary
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_HORIZON = timedelta(days=30)
+SYSTEM_USER = 'system'
+
+ALERT_TYPES = ('low_stock', 'overstock', 'expiring')
+
+# An ignored alert stays open, so it keeps suppressing new alerts of its type
+OPEN_STATUSES = ('active', 'ignored')
+
+
+def _rules(items, now):
+    # alert_type -> (condition on item, message expression)
+    quantity = cast(items.c.quantity, String)
+    return {
+        'low_stock': (
+            and_(items.c.minimum_stock.isnot(None), items.c.quantity <= items.c.minimum_stock),
+            literal('Low stock alert for ') + items.c.name + '. Current quantity: ' + quantity,
+        ),
+        'overstock': (
+            and_(items.c.maximum_stock.isnot(None), items.c.quantity >= items.c.maximum_stock),
+            literal('Overstock alert for ') + items.c.name + '. Current quantity: ' + quantity,
+        ),
+        'expiring': (
+            and_(items.c.expiration_date.isnot(None), items.c.expiration_date <= now + EXPIRY_HORIZON),
+            literal('Expiration alert for ') + items.c.name + '. Expires on: '
+            + func.substr(cast(items.c.expiration_date, String), 1, 10),
+        ),
+    }
+
+
+def rule(items, alert_type, now=None):
+    return _rules(items, now or datetime.utcnow())[alert_type]
+
+
+def alert_summary(raised=None, resolved=None):
+    # The alerts.evaluated payload: every alert type in both maps, 0 if untouched
+    return {
+        'raised': {alert_type: (raised or {}).get(alert_type, 0) for alert_type in ALERT_TYPES},
+        'resolved': {alert_type: (resolved or {}).get(alert_type, 0) for alert_type in ALERT_TYPES},
+    }
+
+
+def alerts_to_resolve(conn, *where):
+    # Open alerts about to be resolved, read first so the change can be audited
+    alerts = Alert.__table__
+    if not audit_writer.enabled:
+        return []
+    return [dict(row._mapping) for row in conn.execute(
+        select(alerts).where(alerts.c.status.in_(OPEN_STATUSES), *where)
+    )]
+
+
+def audit_resolved(conn, rows, now):
+    write_changes(conn, 'alert', [
+        (row, dict(row, status='resolved', resolved_at=now, resolved_by=SYSTEM_USER)) for row in rows
+    ], user=SYSTEM_USER)
+
+
+def audit_raised(conn, now, *where):
+    # Alerts raised by this evaluation are the active ones created at `now`
+    alerts = Alert.__table__
+    if not audit_writer.enabled:
+        return
+    rows = conn.execute(select(alerts).where(alerts.c.created_at == now, alerts.c.status == 'active', *where))
+    write_changes(conn, 'alert', [(None, dict(row._mapping)) for row in rows], user=SYSTEM_USER)
+
+
+def evaluate_alerts(conn, now=None, item_ids=None, alert_types=None):
+    # Raise and resolve alerts for the whole catalog (or item_ids) in a few set-based statements
+    now = now or datetime.utcnow()
+    items = Item.__table__
+    alerts = Alert.__table__
+    raised = {}
+    resolved = {}
+    active_delta = 0
+
+    for alert_type, (condition, message) in _rules(items, now).items():
+        if alert_types and alert_type not in alert_types:
+            continue
+        scope = [items.c.id.in_(item_ids)] if item_ids is not None else []
+        alert_scope = [alerts.c.item_id.in_(item_ids)] if item_ids is not None else []
+        open_alert = exists().where(
+            alerts.c.item_id == items.c.id,
+            alerts.c.alert_type == alert_type,
+            alerts.c.status.in_(OPEN_STATUSES),
+        )
+        new_alerts = select(
+            items.c.id, literal(alert_type), message, literal('active'), literal(now)
+        ).where(condition, ~open_alert, *scope)
+        result = conn.execute(alerts.insert().from_select(
+            ['item_id', 'alert_type', 'message', 'status', 'created_at'], new_alerts
+        ))
+        raised[alert_type] = max(result.rowcount, 0)
+        if raised[alert_type]:
+            audit_raised(conn, now, alerts.c.alert_type == alert_type, *alert_scope)
+
+        # Close open alerts whose item no longer meets the condition
+        still_true = exists().where(items.c.id == alerts.c.item_id, condition)
+        resolving = alerts_to_resolve(conn, alerts.c.alert_type == alert_type, ~still_true, *alert_scope)
+        resolved[alert_type] = 0
+        for status in OPEN_STATUSES:
+            result = conn.execute(alerts.update().where(
+                alerts.c.alert_type == alert_type,
+                alerts.c.status == status,
+                ~still_true,
+                *alert_scope
+            ).values(status='resolved', resolved_at=now, resolved_by=SYSTEM_USER))
+            resolved[alert_type] += result.rowcount
+            if status == 'active':
+                active_delta -= result.rowcount
+        audit_resolved(conn, resolving, now)
+        active_delta += raised[alert_type]
+
+    apply_active_alerts(conn, active_delta)
+    return alert_summary(raised, resolved)
+
+
+def start_alert_sweeper(engine, interval):
+    def run():
+        while not stop.wait(interval):
+            try:
+                with engine.begin() as conn:
+                    summary = evaluate_alerts(conn)
+                publish_alert_summary(summary)
+            except Exception as e:
+                logger.error(f"Alert sweep failed: {str(e)}")
+
+    stop = threading.Event()
+    thread = threading.Thread(target=run, name='alert-sweeper', daemon=True)
+    thread.start()
+    return stop
@@ -1,22 +1,52 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, url_for, send_file
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
 import os
-from models import db, Item
-from datetime import datetime
+import shutil
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeout
 import logging
 from models import db, Item, Category, Location, Supplier
-from models import StockMovement, Alert, AuditLog
+from models import StockTransfer, Alert, AuditLog
 import json
-from sqlalchemy import func
-from datetime import datetime, timedelta
-from flask_jwt_extended import (
-    JWTManager, create_access_token, get_jwt_identity, 
-    jwt_required, get_jwt
-)
+from sqlalchemy import select
+from datetime import date, datetime, timedelta
+import click
+from flask_jwt_extended import JWTManager, create_access_token, get_jwt_identity, jwt_required
 from models import User, UserPermission
 from functools import wraps
+from permissions import (
+    permission_cache, load_permissions, is_allowed,
+    default_permissions, METHOD_ACTIONS
+)
+from pagination import CursorError, parse_limit, keyset_page, count_rows
+from search_index import ensure_search_index, rebuild_search_index, text_filter, ranked_matches
+from ingest import ItemIngestor
+from movements import MovementWriter, MOVEMENT_TYPES, parse_movement_quantity
+import aggregates
+from database import configure_database
+from migrations import migrate
+from alert_engine import evaluate_alerts, start_alert_sweeper
+from serializers import (
+    FieldError, parse_fields, item_serializer, category_serializer,
+    location_serializer, supplier_serializer, alert_serializer, audit_log_serializer
+)
+from refcache import reference_cache
+from exporter import EXPORT_FORMATS, EXPORT_RESOURCES, export_query, parse_timestamp
+import metrics
+from reports import ReportError, build_report
+from audit import audit_writer
+from jobs import job_runner, job_status
+from database import BASE_DIR
+from expirations import expiration_index, start_expiration_scheduler
+from reorder import PlanError, reorder_suggestions
+from pubsub import (HubFull, dashboard_publisher, hub, open_stream, parse_topics, publish_alert_summary,
+                    publish_transfer)
+from file_import import IMPORT_FORMATS, file_importer
+from changefeed import CursorExpired, changes_since, parse_change_limit, parse_since, prune_tombstones
+from snapshots import prune_snapshots, start_snapshot_scheduler, stock_as_of, take_snapshot
+from lookup import MAX_LOOKUP_BATCH, item_lookup, start_lookup_sync
+from stock_ledger import InsufficientStock, ItemNotFound, LedgerError, item_stock, stocked_at, transfer_stock
 
 
 
@@ -31,9 +61,7 @@ def create_app():
     app = Flask(__name__)  # Remove static_folder and static_url_path for API-only server
     
     # Configure the Flask application
-    base_dir = '/workspaces/inventorymgt/inventory-management'
-    db_path = os.path.join(base_dir, 'inventory.db')
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    configure_database(app)  # DATABASE_URL, pool settings, SQLite pragmas
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'default-secret-key')
     
@@ -49,22 +77,131 @@ app = create_app()
 # Initialize JWT
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
+
+# Stock movement group commits
+app.config['MOVEMENT_BATCH_WINDOW_MS'] = float(os.getenv('MOVEMENT_BATCH_WINDOW_MS', 5))
+app.config['MOVEMENT_BATCH_SIZE'] = int(os.getenv('MOVEMENT_BATCH_SIZE', 256))
+
+# Dashboard aggregates are rebuilt from the base tables this often
+app.config['AGGREGATE_RECONCILE_SECONDS'] = int(os.getenv('AGGREGATE_RECONCILE_SECONDS', 900))
+
+# Reference data caching (categories, locations, suppliers)
+app.config['REFERENCE_CACHE_MAX_AGE'] = int(os.getenv('REFERENCE_CACHE_MAX_AGE', 0))
+reference_cache.ttl = int(os.getenv('REFERENCE_CACHE_TTL', 300))
+
+# Full-catalog alert sweep interval
+app.config['ALERT_SWEEP_SECONDS'] = int(os.getenv('ALERT_SWEEP_SECONDS', 300))
 jwt = JWTManager(app)
 
+# Request/SQL instrumentation; thresholds of 0 disable the slow logs
+app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 0))
+app.config['SLOW_REQUEST_MS'] = float(os.getenv('SLOW_REQUEST_MS', 0))
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+metrics.init_app(app)
+
+# Audit rows are captured on commit and written in batches by a background thread
+app.config['AUDIT_ENABLED'] = os.getenv('AUDIT_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+app.config['AUDIT_FLUSH_INTERVAL_MS'] = float(os.getenv('AUDIT_FLUSH_INTERVAL_MS', 200))
+app.config['AUDIT_BATCH_SIZE'] = int(os.getenv('AUDIT_BATCH_SIZE', 500))
+app.config['AUDIT_QUEUE_SIZE'] = int(os.getenv('AUDIT_QUEUE_SIZE', 10000))
+audit_writer.enabled = app.config['AUDIT_ENABLED']
+with app.app_context():
+    audit_writer.configure(
+        db.engine,
+        interval=app.config['AUDIT_FLUSH_INTERVAL_MS'] / 1000.0,
+        batch_size=app.config['AUDIT_BATCH_SIZE'],
+        max_queue=app.config['AUDIT_QUEUE_SIZE'],
+    )
+
+# Expiration alerts fire this many days ahead; the in-memory index is reloaded periodically
+app.config['EXPIRATION_HORIZONS'] = [
+    int(days) for days in os.getenv('EXPIRATION_HORIZONS', '30,7,1').split(',') if days.strip()
+]
+app.config['EXPIRATION_RESYNC_SECONDS'] = int(os.getenv('EXPIRATION_RESYNC_SECONDS', 3600))
+expiration_index.set_horizons(app.config['EXPIRATION_HORIZONS'])
+
+# Background jobs: how many run at once and where their result files go
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 2))
+app.config['JOB_RESULT_DIR'] = os.getenv('JOB_RESULT_DIR', os.path.join(BASE_DIR, 'job_results'))
+app.config['JOB_RETENTION_HOURS'] = int(os.getenv('JOB_RETENTION_HOURS', 24))
+with app.app_context():
+    job_runner.configure(db.engine, workers=app.config['JOB_WORKERS'], result_dir=app.config['JOB_RESULT_DIR'])
+
+# Inventory snapshots: how often one is taken, and how long they are kept (every
+# snapshot for SNAPSHOT_RETENTION_DAYS, then one per month for SNAPSHOT_MONTHLY_RETENTION_MONTHS)
+app.config['SNAPSHOT_INTERVAL_HOURS'] = float(os.getenv('SNAPSHOT_INTERVAL_HOURS', 24))
+app.config['SNAPSHOT_RETENTION_DAYS'] = int(os.getenv('SNAPSHOT_RETENTION_DAYS', 90))
+app.config['SNAPSHOT_MONTHLY_RETENTION_MONTHS'] = int(os.getenv('SNAPSHOT_MONTHLY_RETENTION_MONTHS', 24))
+
+# Tombstones in the item change feed are kept this long; older cursors must resync
+app.config['ITEM_CHANGE_RETENTION_DAYS'] = int(os.getenv('ITEM_CHANGE_RETENTION_DAYS', 30))
+
+# Server-sent event streams: open streams allowed, events buffered per client
+# before it is cut off, heartbeat period and how often dashboard counters are pushed
+app.config['STREAM_MAX_CLIENTS'] = int(os.getenv('STREAM_MAX_CLIENTS', 500))
+app.config['STREAM_QUEUE_SIZE'] = int(os.getenv('STREAM_QUEUE_SIZE', 256))
+app.config['STREAM_HEARTBEAT_SECONDS'] = float(os.getenv('STREAM_HEARTBEAT_SECONDS', 15))
+app.config['STREAM_DASHBOARD_INTERVAL_MS'] = float(os.getenv('STREAM_DASHBOARD_INTERVAL_MS', 1000))
+hub.configure(
+    max_clients=app.config['STREAM_MAX_CLIENTS'],
+    max_queue=app.config['STREAM_QUEUE_SIZE'],
+    heartbeat=app.config['STREAM_HEARTBEAT_SECONDS'],
+)
+with app.app_context():
+    dashboard_publisher.configure(db.engine, interval=app.config['STREAM_DASHBOARD_INTERVAL_MS'] / 1000.0)
+
+# Bulk file imports: rows per validation/load chunk and validation threads
+app.config['IMPORT_CHUNK_SIZE'] = int(os.getenv('IMPORT_CHUNK_SIZE', 2000))
+app.config['IMPORT_WORKERS'] = int(os.getenv('IMPORT_WORKERS', 4))
+file_importer.configure(chunk_size=app.config['IMPORT_CHUNK_SIZE'], workers=app.config['IMPORT_WORKERS'])
+
+# Barcode/SKU lookups are served from memory; this is how often writes made by
+# other processes are picked up (writes in this process apply on commit)
+app.config['LOOKUP_SYNC_SECONDS'] = float(os.getenv('LOOKUP_SYNC_SECONDS', 2))
+
+def wants_async():
+    return request.args.get('async', '').lower() in ('1', 'true', 'yes')
+
+def job_accepted(kind, params=None, payload=None):
+    job_id = job_runner.submit(kind, params, payload, user=str(get_jwt_identity()))
+    status_url = url_for('get_job', job_id=job_id)
+    return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': status_url}), 202, {'Location': status_url}
+
+# Permissions are served from an in-process cache, so authorization costs no queries
+permission_cache.ttl = int(os.getenv('PERMISSION_CACHE_TTL', 60))
+
+def current_permissions():
+    user_id = get_jwt_identity()
+    return permission_cache.get(user_id, lambda: load_permissions(db.session, user_id))
+
 # Role-based access control decorator
 def role_required(required_role):
     def decorator(fn):
         @wraps(fn)
         @jwt_required()
         def wrapper(*args, **kwargs):
-            current_user_id = get_jwt_identity()
-            user = User.query.get(current_user_id)
-            if user.role != required_role and user.role != 'admin':
+            permissions = current_permissions()
+            if permissions is None or not permissions['is_active']:
+                return jsonify({"error": "Insufficient permissions"}), 403
+            if permissions['role'] != required_role and permissions['role'] != 'admin':
                 return jsonify({"error": "Insufficient permissions"}), 403
             return fn(*args, **kwargs)
         return wrapper
     return decorator
 
+# Per-resource access control; the action defaults to the one implied by the HTTP method
+def permission_required(resource, action=None, locations=None):
+    def decorator(fn):
+        @wraps(fn)
+        @jwt_required(locations=locations)
+        def wrapper(*args, **kwargs):
+            required = action or METHOD_ACTIONS[request.method]
+            if not is_allowed(current_permissions(), resource, required):
+                return jsonify({"error": f"Not allowed to {required} {resource}"}), 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
 # Root route returns current API info
 @app.route('/')
 def home():
@@ -77,19 +214,25 @@ def home():
         "message": "Inventory Management System API"
     })
 
+# Prometheus scrape endpoint; guarded by a static bearer token when METRICS_TOKEN is set
+@app.route('/api/metrics')
+def get_metrics():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(metrics.metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # Update timestamp in statistics endpoint
 @app.route('/api/statistics')
 def get_statistics():
     try:
-        total_items = Item.query.count()
-        total_quantity = db.session.query(db.func.sum(Item.quantity)).scalar() or 0
-        categories_count = db.session.query(Item.category, db.func.count(Item.id))\
-            .group_by(Item.category).all()
+        # Read from the maintained aggregates rather than scanning item
+        stats = aggregates.statistics(db.session)
         
         return jsonify({
-            "total_items": total_items,
-            "total_quantity": total_quantity,
-            "categories_distribution": dict(categories_count),
+            "total_items": stats['total_items'],
+            "total_quantity": stats['total_quantity'],
+            "categories_distribution": stats['categories_distribution'],
             "timestamp": "2025-01-05 05:44:16",  # Updated timestamp
             "generated_by": "npcrecruit"
         })
@@ -100,23 +243,80 @@ def get_statistics():
 
 # Batch Operations
 @app.route('/api/items/batch', methods=['POST'])
+@permission_required('items', 'create')
 def batch_add_items():
     try:
         items = request.json.get('items', [])
-        for item_data in items:
-            new_item = Item(**item_data)
-            db.session.add(new_item)
-        db.session.commit()
-        return jsonify({"message": "Batch items added successfully"}), 201
+        if not isinstance(items, list):
+            return jsonify({"error": "items must be a list"}), 400
+        if wants_async():
+            return job_accepted('item_import', {'rows': len(items), 'user': 'npcrecruit'}, items)
+
+        # Rows are validated up front, then upserted on sku in chunks
+        ingestor = ItemIngestor(db.session, db.engine.dialect.name)
+        results = ingestor.ingest(items)
+
+        summary = {status: 0 for status in ('created', 'updated', 'error')}
+        for result in results:
+            summary[result['status']] += 1
+        loaded = summary['created'] + summary['updated']
+        return jsonify({
+            "message": f"Batch processed: {loaded} loaded, {summary['error']} failed",
+            "created": summary['created'],
+            "updated": summary['updated'],
+            "failed": summary['error'],
+            "results": results
+        }), 201 if loaded or not results else 400
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 400
 
+# Bulk import of a CSV/XLSX file (multipart field "file", or the raw request body
+# with ?format=). Always runs as a job; rejected rows are in the job's download.
+@app.route('/api/items/import', methods=['POST'])
+@permission_required('items', 'create')
+def import_items_file():
+    upload = request.files.get('file')
+    format_type = request.args.get('format')
+    if format_type is None and upload is not None and upload.filename:
+        format_type = os.path.splitext(upload.filename)[1].lstrip('.').lower()
+    if format_type not in IMPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(IMPORT_FORMATS)}"}), 400
+
+    # Copied to disk in blocks, never held in memory whole
+    os.makedirs(app.config['JOB_RESULT_DIR'], exist_ok=True)
+    path = os.path.join(app.config['JOB_RESULT_DIR'], f'upload-{uuid.uuid4().hex}.{format_type}')
+    if upload is not None:
+        upload.save(path)
+    else:
+        with open(path, 'wb') as target:
+            shutil.copyfileobj(request.stream, target, 1024 * 1024)
+    if not os.path.getsize(path):
+        os.unlink(path)
+        return jsonify({"error": "No file uploaded"}), 400
+    return job_accepted('file_import', {'path': path, 'format': format_type, 'user': 'npcrecruit'})
+
+# Reference data is served from a versioned in-process cache with ETags,
+# so a repeat load costs no queries and a matching If-None-Match gets a 304
+def reference_response(resource, serializer):
+    fields = parse_fields(request.args.get('fields'))
+    columns = serializer.columns(fields)
+
+    def load():
+        rows = db.session.execute(select(*columns))
+        return json.dumps(serializer.to_dicts(rows, columns)).encode()
+
+    etag, body = reference_cache.get(resource, tuple(fields or ()), load)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"private, max-age={app.config['REFERENCE_CACHE_MAX_AGE']}, must-revalidate"
+    return response.make_conditional(request)
+
 @app.route('/api/categories', methods=['GET', 'POST'])
+@permission_required('categories')
 def manage_categories():
     if request.method == 'GET':
-        categories = Category.query.all()
-        return jsonify([category.to_dict() for category in categories])
+        return reference_response('categories', category_serializer)
     else:
         try:
             data = request.json
@@ -129,10 +329,10 @@ def manage_categories():
             return jsonify({"error": str(e)}), 400
 
 @app.route('/api/locations', methods=['GET', 'POST'])
+@permission_required('locations')
 def manage_locations():
     if request.method == 'GET':
-        locations = Location.query.all()
-        return jsonify([location.to_dict() for location in locations])
+        return reference_response('locations', location_serializer)
     else:
         try:
             data = request.json
@@ -145,10 +345,10 @@ def manage_locations():
             return jsonify({"error": str(e)}), 400
 
 @app.route('/api/suppliers', methods=['GET', 'POST'])
+@permission_required('suppliers')
 def manage_suppliers():
     if request.method == 'GET':
-        suppliers = Supplier.query.all()
-        return jsonify([supplier.to_dict() for supplier in suppliers])
+        return reference_response('suppliers', supplier_serializer)
     else:
         try:
             data = request.json
@@ -164,69 +364,183 @@ def manage_suppliers():
 @app.route('/api/dashboard/summary')
 def dashboard_summary():
     try:
-        current_time = datetime.utcnow()
-        
-        # Get total inventory value
-        inventory_value = db.session.query(
-            func.sum(Item.quantity * Item.unit_price)
-        ).scalar() or 0
+        summary = aggregates.dashboard_summary(db.session, datetime.utcnow())
+        return jsonify(dict(summary, timestamp="2025-01-05 06:18:51"))
+    except Exception as e:
+        logger.error(f"Dashboard error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-        # Get low stock items
-        low_stock_items = Item.query.filter(
-            Item.quantity <= Item.minimum_stock
-        ).count()
+# Push channel (server-sent events) for movements, alerts and dashboard counters.
+# EventSource cannot set headers, so the token may also be passed as ?jwt=
+@app.route('/api/stream')
+@permission_required('items', 'view', locations=('headers', 'query_string'))
+def event_stream():
+    try:
+        subscription = open_stream(parse_topics(request.args.get('topics')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except HubFull as e:
+        return jsonify({'error': str(e)}), 503
+    return Response(hub.stream(subscription), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
 
-        # Get items movement for last 7 days
-        week_ago = current_time - timedelta(days=7)
-        movements = StockMovement.query.filter(
-            StockMovement.timestamp >= week_ago
-        ).count()
+# Time-range reports answered from the daily rollups
+@app.route('/api/reports/<report_type>')
+@permission_required('items', 'view')
+def get_report(report_type):
+    try:
+        item_id = request.args.get('item_id', type=int)
+        if wants_async():
+            return job_accepted('report', {
+                'report_type': report_type, 'range': request.args.get('range', 'week'),
+                'category': request.args.get('category'), 'item_id': item_id,
+                'location': request.args.get('location'),
+            })
+        report = build_report(db.session, report_type, request.args.get('range', 'week'),
+                              category=request.args.get('category'), item_id=item_id,
+                              location=request.args.get('location'))
+        return jsonify(report)
+    except ReportError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Report error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-        # Get active alerts
-        active_alerts = Alert.query.filter_by(status='active').count()
+# Reorder plan for the whole catalog (or one supplier), grouped into per-supplier purchase lists
+@app.route('/api/reorder/suggestions')
+@permission_required('items', 'view')
+def get_reorder_suggestions():
+    try:
+        values = {key: request.args.get(key) for key in (
+            'lead_time_days', 'review_days', 'service_level', 'history_days', 'half_life_days', 'supplier_id'
+        )}
+        values['include_all'] = request.args.get('include_all', '').lower() in ('1', 'true', 'yes')
+        if wants_async():
+            return job_accepted('reorder_plan', values)
+        return jsonify(reorder_suggestions(db.session.connection(), values))
+    except PlanError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Reorder planning error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-        return jsonify({
-            'timestamp': "2025-01-05 06:18:51",
-            'total_inventory_value': round(inventory_value, 2),
-            'low_stock_items': low_stock_items,
-            'weekly_movements': movements,
-            'active_alerts': active_alerts
-        })
+# Stock and valuation at a point in time, rebuilt from the nearest snapshot
+@app.route('/api/inventory/as-of')
+@permission_required('items', 'view')
+def get_inventory_as_of():
+    try:
+        ts = parse_timestamp(request.args.get('ts'))
+        if ts is None:
+            return jsonify({'error': 'ts is required'}), 400
+        item_id = request.args.get('item_id', type=int)
+        return jsonify(stock_as_of(
+            db.session.connection(), ts,
+            category=request.args.get('category'),
+            item_id=item_id,
+            include_items=item_id is not None or request.args.get('include_items', '').lower() in ('1', 'true', 'yes'),
+        ))
+    except ValueError as e:
+        # Bad timestamp or SnapshotError
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logger.error(f"Dashboard error: {str(e)}")
+        logger.error(f"As-of inventory error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # Stock Movement Tracking
+def get_movement_writer():
+    writer = app.extensions.get('movement_writer')
+    if writer is None:
+        writer = MovementWriter(
+            db.engine,
+            window=app.config['MOVEMENT_BATCH_WINDOW_MS'] / 1000.0,
+            batch_size=app.config['MOVEMENT_BATCH_SIZE']
+        )
+        app.extensions['movement_writer'] = writer
+    return writer
+
 @app.route('/api/stock/movement', methods=['POST'])
+@permission_required('items', 'edit')
 def record_stock_movement():
     try:
         data = request.json
-        movement = StockMovement(
-            item_id=data['item_id'],
-            quantity_changed=data['quantity_changed'],
+        if data.get('movement_type') not in MOVEMENT_TYPES:
+            return jsonify({'error': 'movement_type must be in or out'}), 400
+        try:
+            quantity = parse_movement_quantity(data.get('quantity_changed'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Queued for the next group commit, which also raises any stock alerts
+        movement = get_movement_writer().record(
+            item_id=int(data['item_id']),
+            quantity_changed=quantity,
             movement_type=data['movement_type'],
             reason=data.get('reason'),
-            created_by="npcrecruit"
+            created_by="npcrecruit",
+            location=data.get('location')
         )
         
-        # Update item quantity
-        item = Item.query.get_or_404(data['item_id'])
-        if movement.movement_type == 'in':
-            item.quantity += movement.quantity_changed
-        else:
-            item.quantity -= movement.quantity_changed
-        
-        db.session.add(movement)
-        db.session.commit()
-        
-        # Check for alerts
-        check_stock_alerts(item)
-        
         return jsonify(movement.to_dict()), 201
+    except FutureTimeout:
+        # Still queued or being written; it may yet be recorded, so a retry could duplicate it
+        return jsonify({
+            'status': 'pending',
+            'error': 'Movement not confirmed in time; it may still be recorded, check before retrying',
+        }), 202
+    except ItemNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except InsufficientStock as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
-        db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+# Moves stock between two locations of an item in one transaction; the item's total is unchanged
+@app.route('/api/stock/transfer', methods=['POST'])
+@permission_required('items', 'edit')
+def transfer_stock_route():
+    try:
+        data = request.json
+        with db.engine.begin() as conn:
+            transfer = transfer_stock(
+                conn,
+                item_id=int(data['item_id']),
+                from_location=data['from_location'],
+                to_location=data['to_location'],
+                quantity=int(data['quantity']),
+                reason=data.get('reason'),
+                created_by="npcrecruit"
+            )
+        transfer = StockTransfer(**transfer).to_dict()
+        publish_transfer(transfer)
+        return jsonify(transfer), 201
+    except ItemNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except InsufficientStock as e:
+        return jsonify({'error': str(e)}), 409
+    except LedgerError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+# Where an item's stock is, per location
+@app.route('/api/items/<int:item_id>/stock')
+@permission_required('items', 'view')
+def get_item_stock(item_id):
+    item = db.session.get(Item, item_id)
+    if item is None:
+        return jsonify({'error': f"Item {item_id} not found"}), 404
+    return jsonify({
+        'item_id': item_id,
+        'location': item.location,
+        'quantity': item.quantity,
+        'locations': [
+            {'location': location, 'quantity': quantity}
+            for location, quantity in item_stock(db.session.connection(), item_id)
+        ]
+    })
+
 # Authentication routes
 @app.route('/api/auth/login', methods=['POST'])
 def login():
@@ -241,6 +555,8 @@ def login():
             user.last_login = datetime.utcnow()
             db.session.commit()
             
+            # Authorization is looked up per request (PermissionCache), so
+            # the token carries no permission claims that could go stale
             access_token = create_access_token(identity=user.id)
             return jsonify({
                 "token": access_token,
@@ -273,15 +589,16 @@ def create_user():
         db.session.commit()
         
         # Create default permissions
-        default_permissions = UserPermission(
+        defaults = default_permissions(user.role)
+        item_permissions = UserPermission(
             user_id=user.id,
             resource='items',
-            can_view=True,
-            can_create=user.role in ['admin', 'manager'],
-            can_edit=user.role in ['admin', 'manager'],
-            can_delete=user.role == 'admin'
+            can_view=defaults['view'],
+            can_create=defaults['create'],
+            can_edit=defaults['edit'],
+            can_delete=defaults['delete']
         )
-        db.session.add(default_permissions)
+        db.session.add(item_permissions)
         db.session.commit()
         
         return jsonify(user.to_dict()), 201
@@ -290,8 +607,13 @@ def create_user():
         return jsonify({"error": str(e)}), 400
 
 # Enhanced Search & Filtering
+SEARCH_SORT_COLUMNS = (
+    'name', 'sku', 'quantity', 'category', 'location', 'unit_price',
+    'expiration_date', 'created_at', 'updated_at', 'id'
+)
+
 @app.route('/api/search')
-@jwt_required()
+@permission_required('items', 'view')
 def search():
     try:
         query = request.args.get('q', '')
@@ -302,71 +624,194 @@ def search():
         supplier = request.args.get('supplier')
         sort_by = request.args.get('sort_by', 'name')
         order = request.args.get('order', 'asc')
-        
-        # Base query
-        item_query = Item.query
+        cursor = request.args.get('cursor')
+        limit = parse_limit(request.args.get('limit'))
+        count_mode = request.args.get('count', 'none')
+
+        if sort_by not in SEARCH_SORT_COLUMNS:
+            return jsonify({"error": f"Cannot sort by {sort_by}"}), 400
+        if order not in ('asc', 'desc'):
+            return jsonify({"error": "order must be asc or desc"}), 400
+
+        # Base query, fetched as column tuples rather than Item entities;
+        # the sort key and id are always read so the cursor can be built
+        items = Item.__table__.c
+        columns = item_serializer.columns(
+            parse_fields(request.args.get('fields')), required=('id', sort_by)
+        )
+        item_query = select(*columns)
         
         # Apply filters
         if query:
-            item_query = item_query.filter(
-                (Item.name.ilike(f'%{query}%')) |
-                (Item.sku.ilike(f'%{query}%')) |
-                (Item.description.ilike(f'%{query}%'))
-            )
+            item_query = item_query.where(text_filter(db.engine, items, query))
         
         if category:
-            item_query = item_query.filter(Item.category == category)
+            item_query = item_query.where(items.category == category)
         if location:
-            item_query = item_query.filter(Item.location == location)
+            # Items stocked at the location, from the stock ledger
+            item_query = item_query.where(items.id.in_(stocked_at(location)))
         if min_quantity is not None:
-            item_query = item_query.filter(Item.quantity >= min_quantity)
+            item_query = item_query.where(items.quantity >= min_quantity)
         if max_quantity is not None:
-            item_query = item_query.filter(Item.quantity <= max_quantity)
+            item_query = item_query.where(items.quantity <= max_quantity)
         if supplier:
-            item_query = item_query.filter(Item.supplier_id == supplier)
-            
-        # Apply sorting
-        sort_column = getattr(Item, sort_by)
-        if order == 'desc':
-            sort_column = sort_column.desc()
-        item_query = item_query.order_by(sort_column)
-        
-        # Execute query
-        items = item_query.all()
+            item_query = item_query.where(items.supplier_id == supplier)
+
+        total, total_exact = count_rows(db.session, item_query, count_mode)
+
+        # Fetch one page ordered by (sort_by, id)
+        rows, next_cursor = keyset_page(
+            db.session, item_query, items[sort_by], items.id,
+            sort_by, order, cursor, limit
+        )
         
         return jsonify({
             "timestamp": "2025-01-05 06:27:03",
-            "total": len(items),
-            "items": [item.to_dict() for item in items]
+            "total": total,
+            "total_exact": total_exact,
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "items": item_serializer.to_dicts(rows, columns)
         })
+    except CursorError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+# Items expiring within N days (expired ones included), soonest first, from the in-memory index
+@app.route('/api/items/expiring')
+@permission_required('items', 'view')
+def expiring_items():
+    try:
+        within = request.args.get('within', 30, type=float)
+        include_expired = request.args.get('include_expired', 'true').lower() in ('1', 'true', 'yes')
+        limit = parse_limit(request.args.get('limit'))
+        columns = item_serializer.columns(parse_fields(request.args.get('fields')), required=('id',))
+
+        expiration_index.ensure_loaded(db.engine)
+        now = datetime.utcnow()
+        entries = expiration_index.expiring(now + timedelta(days=within))
+        if not include_expired:
+            entries = [entry for entry in entries if entry[0] >= now]
+
+        ids = [item_id for _, item_id in entries[:limit]]
+        rows = {row.id: row for row in db.session.execute(select(*columns).where(Item.__table__.c.id.in_(ids)))}
+        return jsonify({
+            "within_days": within,
+            "total": len(entries),
+            "limit": limit,
+            "items": item_serializer.to_dicts([rows[item_id] for item_id in ids if item_id in rows], columns)
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+# Scanner lookup by barcode or sku, served from the in-memory index. Several
+# items can share a barcode; that answers 409 with all of them.
+@app.route('/api/items/lookup')
+@permission_required('items', 'view')
+def lookup_item():
+    barcode = request.args.get('barcode')
+    sku = request.args.get('sku')
+    if bool(barcode) == bool(sku):
+        return jsonify({"error": "Pass exactly one of barcode or sku"}), 400
+    item_lookup.ensure_loaded(db.engine)
+    if sku:
+        item = item_lookup.by_sku(sku)
+        matches = [item] if item else []
+    else:
+        matches = item_lookup.by_barcode(barcode)
+    if not matches:
+        return jsonify({"error": "Item not found"}), 404
+    if len(matches) > 1:
+        return jsonify({"error": "Barcode matches several items", "items": matches}), 409
+    return jsonify(matches[0])
+
+# Batch variant: {"barcodes": [...], "skus": [...]}; unknown codes are listed under "missing"
+@app.route('/api/items/lookup/batch', methods=['POST'])
+@permission_required('items', 'view')
+def lookup_items():
+    body = request.get_json(silent=True) or {}
+    barcodes = body.get('barcodes') or []
+    skus = body.get('skus') or []
+    if not isinstance(barcodes, list) or not isinstance(skus, list):
+        return jsonify({"error": "barcodes and skus must be lists"}), 400
+    if len(barcodes) + len(skus) > MAX_LOOKUP_BATCH:
+        return jsonify({"error": f"At most {MAX_LOOKUP_BATCH} codes per request"}), 400
+    item_lookup.ensure_loaded(db.engine)
+    items = {}
+    missing = {'barcodes': [], 'skus': []}
+    for barcode in barcodes:
+        matches = item_lookup.by_barcode(str(barcode))
+        if not matches:
+            missing['barcodes'].append(barcode)
+        items.update((item['id'], item) for item in matches)
+    for sku in skus:
+        item = item_lookup.by_sku(str(sku))
+        if item is None:
+            missing['skus'].append(sku)
+        else:
+            items[item['id']] = item
+    return jsonify({"items": list(items.values()), "missing": missing})
+
+# Delta sync: items changed and deleted since a cursor from a previous call (0 = everything)
+@app.route('/api/items/changes')
+@permission_required('items', 'view')
+def get_item_changes():
+    try:
+        columns = item_serializer.columns(parse_fields(request.args.get('fields')), required=('id',))
+        page = changes_since(
+            db.session.connection(), parse_since(request.args.get('since')),
+            parse_change_limit(request.args.get('limit')), columns
+        )
+        page['updated'] = item_serializer.to_dicts(page['updated'], columns)
+        return jsonify(page)
+    except CursorExpired as e:
+        return jsonify({"error": str(e), "resync": True}), 410
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+# Typeahead over the search index, best matches first
+@app.route('/api/search/suggest')
+@permission_required('items', 'view')
+def search_suggest():
+    try:
+        query = request.args.get('q', '')
+        limit = min(request.args.get('limit', 10, type=int), 50)
+        rows = ranked_matches(db.engine, db.session, Item.__table__.c, query, limit)
+        return jsonify([{'id': row.id, 'name': row.name, 'sku': row.sku} for row in rows])
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 # Export data
 @app.route('/api/export')
-@jwt_required()
+@permission_required('items', 'view')
 def export_data():
     try:
         format_type = request.args.get('format', 'json')
         resource = request.args.get('resource', 'items')
+        since = parse_timestamp(request.args.get('since'))
+        until = parse_timestamp(request.args.get('until'))
         
-        if resource == 'items':
-            data = [item.to_dict() for item in Item.query.all()]
-        elif resource == 'stock_movements':
-            data = [movement.to_dict() for movement in StockMovement.query.all()]
-        elif resource == 'alerts':
-            data = [alert.to_dict() for alert in Alert.query.all()]
-        else:
+        if resource not in EXPORT_RESOURCES:
             return jsonify({"error": "Invalid resource type"}), 400
-            
-        if format_type == 'json':
-            return jsonify({
-                "timestamp": "2025-01-05 06:27:03",
-                "type": resource,
-                "data": data
-            })
-        else:
+        if format_type not in EXPORT_FORMATS:
             return jsonify({"error": "Unsupported format"}), 400
+
+        fields = parse_fields(request.args.get('fields'))
+        if wants_async():
+            return job_accepted('export', {
+                'resource': resource, 'format': format_type, 'fields': fields,
+                'since': since.isoformat() if since else None, 'until': until.isoformat() if until else None,
+            })
+
+        # Rows are read in chunks and written out as they arrive
+        generate, mimetype = EXPORT_FORMATS[format_type]
+        body = generate(db.session, resource, export_query(resource, since, until, fields),
+                        "2025-01-05 06:27:03")
+        headers = {}
+        if format_type != 'json':
+            headers['Content-Disposition'] = f'attachment; filename={resource}.{format_type}'
+        return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -374,8 +819,10 @@ def export_data():
 @app.route('/api/alerts')
 def get_alerts():
     status = request.args.get('status', 'active')
-    alerts = Alert.query.filter_by(status=status).all()
-    return jsonify([alert.to_dict() for alert in alerts])
+    columns = alert_serializer.columns(parse_fields(request.args.get('fields')))
+    alerts = Alert.__table__.c
+    rows = db.session.execute(select(*columns).where(alerts.status == status))
+    return jsonify(alert_serializer.to_dicts(rows, columns))
 
 @app.route('/api/alerts/<int:alert_id>', methods=['PUT'])
 def update_alert(alert_id):
@@ -395,50 +842,96 @@ def update_alert(alert_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
-# Audit Log
+@app.route('/api/alerts/evaluate', methods=['POST'])
+@permission_required('items', 'edit')
+def evaluate_stock_alerts():
+    if wants_async():
+        return job_accepted('alert_sweep')
+    try:
+        # Sweeps the whole catalog; alerts are deduplicated and auto-resolved
+        with db.engine.begin() as conn:
+            summary = evaluate_alerts(conn)
+        publish_alert_summary(summary)
+        return jsonify(summary)
+    except Exception as e:
+        logger.error(f"Alert evaluation error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Audit Log, newest first, one keyset page at a time; admins only, since it
+# carries user and permission changes
 @app.route('/api/audit-logs')
+@role_required('admin')
 def get_audit_logs():
-    days = request.args.get('days', 7, type=int)
-    start_date = datetime.utcnow() - timedelta(days=days)
-    
-    logs = AuditLog.query.filter(
-        AuditLog.timestamp >= start_date
-    ).order_by(AuditLog.timestamp.desc()).all()
-    
-    return jsonify([log.to_dict() for log in logs])
-
-# Helper function for stock alerts
-def check_stock_alerts(item):
-    if item.quantity <= item.minimum_stock:
-        alert = Alert(
-            item_id=item.id,
-            alert_type='low_stock',
-            message=f'Low stock alert for {item.name}. Current quantity: {item.quantity}',
-            status='active'
-        )
-        db.session.add(alert)
-    
-    if item.quantity >= item.maximum_stock:
-        alert = Alert(
-            item_id=item.id,
-            alert_type='overstock',
-            message=f'Overstock alert for {item.name}. Current quantity: {item.quantity}',
-            status='active'
+    try:
+        since = parse_timestamp(request.args.get('since'))
+        until = parse_timestamp(request.args.get('until'))
+        if since is None:
+            since = datetime.utcnow() - timedelta(days=request.args.get('days', 7, type=int))
+        cursor = request.args.get('cursor')
+        limit = parse_limit(request.args.get('limit'))
+
+        logs = AuditLog.__table__.c
+        columns = audit_log_serializer.columns(
+            parse_fields(request.args.get('fields')), required=('id', 'timestamp')
         )
-        db.session.add(alert)
-    
-    if item.expiration_date and item.expiration_date <= datetime.utcnow() + timedelta(days=30):
-        alert = Alert(
-            item_id=item.id,
-            alert_type='expiring',
-            message=f'Expiration alert for {item.name}. Expires on: {item.expiration_date.date()}',
-            status='active'
+        log_query = select(*columns).where(logs.timestamp >= since)
+        if until is not None:
+            log_query = log_query.where(logs.timestamp < until)
+        for name in ('table_name', 'action', 'user'):
+            if request.args.get(name):
+                log_query = log_query.where(logs[name] == request.args[name])
+        if request.args.get('record_id') is not None:
+            log_query = log_query.where(logs.record_id == request.args.get('record_id', type=int))
+
+        rows, next_cursor = keyset_page(
+            db.session, log_query, logs.timestamp, logs.id, 'timestamp', 'desc', cursor, limit
         )
-        db.session.add(alert)
-    
-    db.session.commit()
+        return jsonify({
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "logs": audit_log_serializer.to_dicts(rows, columns)
+        })
+    except (CursorError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+# Background job status and results, visible to their submitter and admins
+def visible_job(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return None
+    permissions = current_permissions()
+    if job['created_by'] != str(get_jwt_identity()) and (permissions is None or permissions['role'] != 'admin'):
+        return None
+    return job
+
+@app.route('/api/jobs/<job_id>')
+@jwt_required()
+def get_job(job_id):
+    job = visible_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    status = job_status(job)
+    if job['status'] == 'done' and job['result_path']:
+        status['download_url'] = url_for('download_job_result', job_id=job_id)
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/download')
+@jwt_required()
+def download_job_result(job_id):
+    job = visible_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job['status'] != 'done' or not job['result_path'] or not os.path.exists(job['result_path']):
+        return jsonify({"error": f"Job is {job['status']}, no result to download"}), 409
+    extension = os.path.splitext(job['result_path'])[1]
+    return send_file(job['result_path'], mimetype=job['result_mimetype'], as_attachment=True,
+                     download_name=f"{job['kind']}-{job_id}{extension}")
 
 # Error handlers
+@app.errorhandler(FieldError)
+def field_error(error):
+    return jsonify({"error": str(error)}), 400
+
 @app.errorhandler(404)
 def not_found_error(error):
     return jsonify({
@@ -455,7 +948,65 @@ def internal_error(error):
         "timestamp": "2025-01-05 06:11:11"
     }), 500
 
+@app.cli.command('migrate')
+def migrate_command():
+    version = migrate(db.engine)
+    print(f"Database schema at version {version}")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    ensure_search_index(db.engine)
+    rebuild_search_index(db.engine)
+
+@app.cli.command('reconcile-aggregates')
+def reconcile_aggregates_command():
+    with db.engine.begin() as conn:
+        aggregates.reconcile(conn)
+
+@app.cli.command('prune-jobs')
+@click.option('--hours', type=int, help='Delete finished jobs older than this (default JOB_RETENTION_HOURS)')
+def prune_jobs_command(hours):
+    pruned = job_runner.prune(timedelta(hours=hours or app.config['JOB_RETENTION_HOURS']))
+    print(f"Pruned {pruned} jobs")
+
+@app.cli.command('rebuild-rollups')
+@click.option('--since', help='Only rebuild days on or after this date (YYYY-MM-DD)')
+def rebuild_rollups_command(since):
+    with db.engine.begin() as conn:
+        aggregates.rebuild_movement_days(conn, date.fromisoformat(since) if since else None)
+
+@app.cli.command('take-snapshot')
+def take_snapshot_command():
+    with db.engine.begin() as conn:
+        snapshot = take_snapshot(conn)
+    print(f"Snapshot {snapshot['id']}: {snapshot['item_count']} items, value {snapshot['total_value']}")
+
+@app.cli.command('prune-snapshots')
+def prune_snapshots_command():
+    with db.engine.begin() as conn:
+        pruned = prune_snapshots(conn, app.config['SNAPSHOT_RETENTION_DAYS'],
+                                 app.config['SNAPSHOT_MONTHLY_RETENTION_MONTHS'])
+    print(f"Pruned {pruned} snapshots")
+
+@app.cli.command('prune-item-changes')
+@click.option('--days', type=int, help='Delete tombstones older than this (default ITEM_CHANGE_RETENTION_DAYS)')
+def prune_item_changes_command(days):
+    with db.engine.begin() as conn:
+        pruned = prune_tombstones(conn, timedelta(days=days or app.config['ITEM_CHANGE_RETENTION_DAYS']))
+    print(f"Pruned {pruned} item tombstones")
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()  # Create database tables
+        migrate(db.engine)  # Create or upgrade database tables
+        job_runner.recover()
+        job_runner.prune(timedelta(hours=app.config['JOB_RETENTION_HOURS']))
+        with db.engine.begin() as conn:
+            aggregates.reconcile(conn)
+            prune_tombstones(conn, timedelta(days=app.config['ITEM_CHANGE_RETENTION_DAYS']))
+    aggregates.start_reconciler(db.engine, app.config['AGGREGATE_RECONCILE_SECONDS'])
+    start_alert_sweeper(db.engine, app.config['ALERT_SWEEP_SECONDS'])
+    start_expiration_scheduler(db.engine, resync_interval=app.config['EXPIRATION_RESYNC_SECONDS'])
+    start_snapshot_scheduler(db.engine, timedelta(hours=app.config['SNAPSHOT_INTERVAL_HOURS']),
+                             app.config['SNAPSHOT_RETENTION_DAYS'], app.config['SNAPSHOT_MONTHLY_RETENTION_MONTHS'])
+    start_lookup_sync(db.engine, app.config['LOOKUP_SYNC_SECONDS'])
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,271 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import date, datetime
+
+from flask import has_request_context
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import Item, Category, Location, Supplier, Alert, User, UserPermission, AuditLog
+
+logger = logging.getLogger(__name__)
+
+# Automatic audit trail. The session hooks turn every flushed insert, update
+# (with a column diff) and delete of an audited model into an audit_log row,
+# hold them until the transaction commits and hand them to a background
+# writer that bulk-inserts them. Rolled-back work is never audited. Core
+# write paths that bypass the ORM call record_changes() (with a session) or
+# write_changes() (with a connection) themselves: bulk ingest audits the
+# items it writes, the movement writer the item quantities it changes, and
+# the alert engine and expiration scheduler the alerts they raise and
+# resolve. The per-location stock ledger (item_stock) is not audited; stock
+# movements and transfers are recorded in their own tables.
+
+AUDITED_MODELS = {
+    Item: 'item',
+    Category: 'category',
+    Location: 'location',
+    Supplier: 'supplier',
+    Alert: 'alert',
+    User: 'user',
+    UserPermission: 'user_permission',
+}
+
+# Never copied into the audit trail
+REDACTED_COLUMNS = {'password_hash'}
+# Bookkeeping columns that change on every update and add nothing to a diff
+IGNORED_COLUMNS = {'updated_at', 'updated_by'}
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _dumps(changes):
+    return json.dumps(changes, default=str, separators=(',', ':'))
+
+
+def current_actor():
+    if has_request_context():
+        try:
+            identity = get_jwt_identity()
+        except RuntimeError:
+            identity = None
+        if identity is not None:
+            return str(identity)
+    return 'system'
+
+
+def _entry(action, table_name, record_id, changes, user):
+    return {
+        'action': action,
+        'table_name': table_name,
+        'record_id': record_id,
+        'changes': _dumps(changes) if changes else None,
+        'timestamp': datetime.utcnow(),
+        'user': user,
+    }
+
+
+def _record_id(obj, state):
+    return state.mapper.primary_key_from_instance(obj)[0]
+
+
+def _column_values(obj, state, previous=False):
+    # Current values, or the values as last loaded from the database
+    values = {}
+    for column in state.mapper.columns:
+        if column.key in REDACTED_COLUMNS:
+            continue
+        if previous:
+            history = state.attrs[column.key].history
+            value = (history.deleted or history.unchanged or [None])[0]
+        else:
+            value = getattr(obj, column.key)
+        if value is not None:
+            values[column.key] = _json_value(value)
+    return values
+
+
+def _diff(state):
+    changes = {}
+    for column in state.mapper.columns:
+        if column.key in IGNORED_COLUMNS:
+            continue
+        history = state.attrs[column.key].history
+        if not history.added and not history.deleted:
+            continue
+        old = history.deleted[0] if history.deleted else None
+        new = history.added[0] if history.added else None
+        if old == new:
+            continue
+        if column.key in REDACTED_COLUMNS:
+            changes[column.key] = '[redacted]'
+        else:
+            changes[column.key] = [_json_value(old), _json_value(new)]
+    return changes
+
+
+def stage(session, entries):
+    session.info.setdefault('audit_entries', []).extend(entries)
+
+
+def _change_entries(table_name, pairs, user):
+    # pairs: (old, new) row mappings with an 'id', None for insert/delete
+    entries = []
+    for old, new in pairs:
+        if old is None:
+            entries.append(_entry('insert', table_name, new['id'], {
+                key: _json_value(value) for key, value in new.items() if value is not None
+            }, user))
+        elif new is None:
+            entries.append(_entry('delete', table_name, old['id'], {
+                key: _json_value(value) for key, value in old.items() if value is not None
+            }, user))
+        else:
+            changes = {
+                key: [_json_value(old.get(key)), _json_value(value)] for key, value in new.items()
+                if key not in IGNORED_COLUMNS and old.get(key) != value
+            }
+            if changes:
+                entries.append(_entry('update', table_name, new['id'], changes, user))
+    return entries
+
+
+def record_changes(session, table_name, pairs, user=None):
+    stage(session, _change_entries(table_name, pairs, user or current_actor()))
+
+
+def write_changes(conn, table_name, pairs, user=None):
+    # For Core writers with no session: the entries are inserted in the
+    # writer's own transaction and commit or roll back with the change
+    if not audit_writer.enabled:
+        return
+    entries = _change_entries(table_name, pairs, user or current_actor())
+    if entries:
+        conn.execute(AuditLog.__table__.insert(), entries)
+
+
+class AuditWriter:
+    def __init__(self, interval=0.2, batch_size=500, max_queue=10000, put_timeout=1.0):
+        self.engine = None
+        self.enabled = True
+        self.interval = interval
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def configure(self, engine, interval=None, batch_size=None, max_queue=None):
+        self.engine = engine
+        if interval is not None:
+            self.interval = interval
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if max_queue is not None and max_queue != self._queue.maxsize:
+            self._queue = queue.Queue(maxsize=max_queue)
+
+    def submit(self, entries):
+        if not entries or not self.enabled or self.engine is None:
+            return
+        self._ensure_started()
+        for index, entry in enumerate(entries):
+            try:
+                # A full queue blocks the committing request: that is the backpressure
+                self._queue.put(entry, timeout=self.put_timeout)
+            except queue.Full:
+                # The writer is falling behind; write the rest inline rather than drop them
+                logger.warning(f"Audit queue full, writing {len(entries) - index} entries synchronously")
+                self._write(entries[index:])
+                return
+
+    def flush(self, timeout=None):
+        # Blocks until everything queued so far has been written
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"Audit batch of {len(batch)} entries failed: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, entries):
+        with self.engine.begin() as conn:
+            conn.execute(AuditLog.__table__.insert(), entries)
+
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.flush, 5)
+
+
+@event.listens_for(Session, 'after_flush')
+def _capture_orm_changes(session, flush_context):
+    if not audit_writer.enabled:
+        return
+    user = current_actor()
+    entries = []
+    for obj in session.new:
+        table_name = AUDITED_MODELS.get(type(obj))
+        if table_name:
+            state = inspect(obj)
+            entries.append(_entry('insert', table_name, _record_id(obj, state), _column_values(obj, state), user))
+    for obj in session.dirty:
+        table_name = AUDITED_MODELS.get(type(obj))
+        if table_name and session.is_modified(obj):
+            state = inspect(obj)
+            changes = _diff(state)
+            if changes:
+                entries.append(_entry('update', table_name, _record_id(obj, state), changes, user))
+    for obj in session.deleted:
+        table_name = AUDITED_MODELS.get(type(obj))
+        if table_name:
+            state = inspect(obj)
+            entries.append(_entry('delete', table_name, _record_id(obj, state),
+                                  _column_values(obj, state, previous=True), user))
+    if entries:
+        stage(session, entries)
+
+
+@event.listens_for(Session, 'after_commit')
+def _submit_committed(session):
+    audit_writer.submit(session.info.pop('audit_entries', None))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_uncommitted(session):
+    session.info.pop('audit_entries', None)
@@ -0,0 +1,335 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+# API benchmark harness. For every data scale it seeds a scratch database
+# with datagen, then drives each endpoint in a fresh process and reports
+# latency percentiles, throughput and peak RSS. Results are written as JSON
+# and can be compared against an earlier run.
+#
+#   python app/benchmark.py --scales small,medium --output bench.json
+#   python app/benchmark.py --scales small --compare bench.json
+#   python app/benchmark.py --url http://localhost:5000 --token <jwt>   # running server
+
+SCALES = {
+    'small': {'items': 1000, 'movements': 10000, 'alerts': 300, 'audit_logs': 2000, 'suppliers': 50},
+    'medium': {'items': 10000, 'movements': 100000, 'alerts': 2000, 'audit_logs': 20000, 'suppliers': 200},
+    'large': {'items': 100000, 'movements': 1000000, 'alerts': 20000, 'audit_logs': 200000, 'suppliers': 1000},
+}
+
+
+def _search(rng, scale):
+    return rng.choice([
+        ('GET', f"/api/search?category=category-{1 + rng.randrange(10):03d}&limit=50", None),
+        ('GET', f"/api/search?q={rng.choice(('valve', 'steel', 'bracket', 'sensor'))}&limit=50", None),
+        ('GET', '/api/search?sort_by=name&limit=50', None),
+        ('GET', '/api/search?sort_by=created_at&order=desc&limit=50', None),
+    ])
+
+
+def _export(rng, scale):
+    since = (datetime.utcnow() - timedelta(days=1)).isoformat()
+    return 'GET', f'/api/export?resource=stock_movements&format=ndjson&since={since}', None
+
+
+def _movement(rng, scale):
+    return 'POST', '/api/stock/movement', {
+        'item_id': 1 + rng.randrange(scale['items']),
+        'quantity_changed': 1 + rng.randrange(5),
+        'movement_type': 'in',
+        'reason': 'benchmark',
+    }
+
+
+ENDPOINTS = {
+    'search': _search,
+    'export': _export,
+    'stock_movement': _movement,
+    'dashboard_summary': lambda rng, scale: ('GET', '/api/dashboard/summary', None),
+    'statistics': lambda rng, scale: ('GET', '/api/statistics', None),
+}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def current_rss():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RssSampler:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+class TestClientTransport:
+    def __init__(self, app, headers):
+        self.app = app
+        self.headers = headers
+        self._local = threading.local()
+
+    def request(self, method, path, body):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, headers=self.headers, json=body)
+        size = len(response.get_data())
+        return response.status_code, size
+
+
+class HttpTransport:
+    def __init__(self, base_url, headers):
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers
+
+    def request(self, method, path, body):
+        data = json.dumps(body).encode() if body is not None else None
+        headers = dict(self.headers, **({'Content-Type': 'application/json'} if data else {}))
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, len(error.read())
+
+
+def run_endpoint(transport, name, scale, requests, concurrency, warmup, seed, measure_rss=True):
+    factory = ENDPOINTS[name]
+    rng = random.Random(seed)
+    plan = [factory(rng, scale) for _ in range(warmup + requests)]
+    for method, path, body in plan[:warmup]:
+        transport.request(method, path, body)
+
+    latencies = []
+    errors = 0
+    sizes = 0
+    lock = threading.Lock()
+    work = iter(plan[warmup:])
+
+    def worker():
+        nonlocal errors, sizes
+        while True:
+            with lock:
+                step = next(work, None)
+            if step is None:
+                return
+            started = time.perf_counter()
+            status, size = transport.request(*step)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                sizes += size
+                if status >= 400:
+                    errors += 1
+
+    sampler = RssSampler() if measure_rss else None
+    if sampler:
+        sampler.__enter__()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    if sampler:
+        sampler.__exit__(None, None, None)
+
+    ms = [value * 1000 for value in latencies]
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'concurrency': concurrency,
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'mean_ms': round(sum(ms) / len(ms), 3),
+        'throughput_rps': round(len(latencies) / wall, 2),
+        'bytes_per_request': sizes // max(1, len(latencies)),
+        'peak_rss_mb': round(sampler.peak / 2 ** 20, 1) if sampler else None,
+    }
+
+
+def bench_in_process(scale_name, args):
+    # Runs in a child process whose DATABASE_URL already points at a scratch file
+    import app as api
+    from datagen import seed
+    from flask_jwt_extended import create_access_token
+    from models import db, User
+
+    scale = SCALES[scale_name]
+    with api.app.app_context():
+        started = time.perf_counter()
+        seed(db.engine, seed=args.seed, **scale)
+        seed_seconds = time.perf_counter() - started
+        admin = User(username='benchmark', email='benchmark@example.com', role='admin')
+        admin.set_password('benchmark')
+        db.session.add(admin)
+        db.session.commit()
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity=admin.id)}
+
+    transport = TestClientTransport(api.app, headers)
+    results = {}
+    for name in args.endpoints:
+        results[name] = run_endpoint(transport, name, scale, args.requests, args.concurrency, args.warmup, args.seed)
+    return {'scale': scale_name, 'data': scale, 'seed_seconds': round(seed_seconds, 2), 'endpoints': results}
+
+
+def bench_remote(args):
+    headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+    transport = HttpTransport(args.url, headers)
+    scale = {'items': args.remote_items}
+    results = {}
+    for name in args.endpoints:
+        results[name] = run_endpoint(transport, name, scale, args.requests, args.concurrency, args.warmup,
+                                     args.seed, measure_rss=False)
+    return {'scale': 'remote', 'url': args.url, 'endpoints': results}
+
+
+def spawn_scale(scale_name, args):
+    scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    scratch.close()
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{scratch.name}', PYTHONUNBUFFERED='1')
+    command = [sys.executable, os.path.abspath(__file__), '--worker', scale_name,
+               '--requests', str(args.requests), '--concurrency', str(args.concurrency),
+               '--warmup', str(args.warmup), '--seed', str(args.seed),
+               '--endpoints', ','.join(args.endpoints)]
+    try:
+        output = subprocess.run(command, env=env, check=True, stdout=subprocess.PIPE,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(scratch.name + suffix):
+                os.unlink(scratch.name + suffix)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def compare(current, baseline):
+    previous = {(run['scale'], name): stats for run in baseline['runs'] for name, stats in run['endpoints'].items()}
+    for run in current['runs']:
+        for name, stats in run['endpoints'].items():
+            before = previous.get((run['scale'], name))
+            if not before:
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'peak_rss_mb'):
+                if before.get(key) and stats.get(key) is not None:
+                    changes.append(f'{key} {(stats[key] - before[key]) / before[key] * 100:+.1f}%')
+            print(f"{run['scale']:>8} {name:<18} " + ', '.join(changes))
+
+
+def report(results):
+    for run in results['runs']:
+        for name, stats in run['endpoints'].items():
+            rss = f"{stats['peak_rss_mb']:.1f}MB" if stats['peak_rss_mb'] is not None else '-'
+            print(f"{run['scale']:>8} {name:<18} p50 {stats['p50_ms']:>8.2f}ms  p95 {stats['p95_ms']:>8.2f}ms  "
+                  f"p99 {stats['p99_ms']:>8.2f}ms  {stats['throughput_rps']:>8.1f} req/s  rss {rss}"
+                  + (f"  errors {stats['errors']}" if stats['errors'] else ''))
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the inventory API')
+    parser.add_argument('--scales', default='small,medium')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--url', help='benchmark a running server instead of the test client')
+    parser.add_argument('--token', help='bearer token for --url')
+    parser.add_argument('--remote-items', type=int, default=1000, help='item id range used with --url')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.endpoints = [name for name in args.endpoints.split(',') if name]
+    unknown = [name for name in args.endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoint(s): {', '.join(unknown)}")
+
+    if args.worker:
+        print(json.dumps(bench_in_process(args.worker, args)))
+        return 0
+
+    if args.url:
+        runs = [bench_remote(args)]
+    else:
+        scales = [name for name in args.scales.split(',') if name]
+        unknown = [name for name in scales if name not in SCALES]
+        if unknown:
+            parser.error(f"unknown scale(s): {', '.join(unknown)}")
+        runs = [spawn_scale(name, args) for name in scales]
+
+    results = {
+        'meta': {
+            'started_at': datetime.utcnow().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+        },
+        'runs': runs,
+    }
+    report(results)
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+from datetime import datetime
+
+from sqlalchemy import event, exists, func, literal, select
+from sqlalchemy.orm import Session
+
+from models import Item, ItemChange, StatCounter
+
+# Change feed behind /api/items/changes. Every item write stamps the item's
+# row in item_change with the next value of a global sequence; deletes leave
+# a tombstone row. There is one row per item, so a client that syncs from
+# cursor N reads each changed item once, however often it changed. Taking the
+# next sequence value updates (and so locks) the counter row until commit,
+# which makes commits land in sequence order: a reader never sees seq N+1
+# before N. Tombstones are pruned after a retention period; a cursor older
+# than the pruned range has to resync from 0.
+
+SEQUENCE = 'item_change_seq'
+PRUNED_SEQUENCE = 'item_change_pruned_seq'
+DEFAULT_CHANGE_LIMIT = 500
+MAX_CHANGE_LIMIT = 5000
+
+
+class ChangeFeedError(ValueError):
+    pass
+
+
+class CursorExpired(ChangeFeedError):
+    pass
+
+
+def _counter(conn, name):
+    counters = StatCounter.__table__
+    return conn.execute(select(counters.c.value).where(counters.c.name == name)).scalar()
+
+
+def current_sequence(conn):
+    return int(_counter(conn, SEQUENCE) or 0)
+
+
+def _next_sequence(conn, count):
+    # Reserves `count` sequence values and returns the last one
+    counters = StatCounter.__table__
+    updated = conn.execute(counters.update().where(counters.c.name == SEQUENCE)
+                           .values(value=counters.c.value + count))
+    if updated.rowcount == 0:
+        conn.execute(counters.insert().values(name=SEQUENCE, value=count))
+    return int(_counter(conn, SEQUENCE))
+
+
+def record_item_changes(conn, item_ids, deleted_ids=()):
+    deleted_ids = list(dict.fromkeys(deleted_ids))
+    item_ids = [item_id for item_id in dict.fromkeys(item_ids) if item_id not in set(deleted_ids)]
+    if not item_ids and not deleted_ids:
+        return
+    changes = ItemChange.__table__
+    last = _next_sequence(conn, len(item_ids) + len(deleted_ids))
+    now = datetime.utcnow()
+    rows = [
+        {'item_id': item_id, 'seq': seq, 'deleted': deleted, 'changed_at': now}
+        for seq, (item_id, deleted) in enumerate(
+            [(item_id, False) for item_id in item_ids] + [(item_id, True) for item_id in deleted_ids],
+            start=last - len(item_ids) - len(deleted_ids) + 1,
+        )
+    ]
+    for start in range(0, len(rows), 500):
+        chunk = rows[start:start + 500]
+        conn.execute(changes.delete().where(changes.c.item_id.in_([row['item_id'] for row in chunk])))
+        conn.execute(changes.insert(), chunk)
+
+
+def backfill(conn):
+    # One change for each item without one, so syncing from 0 returns the
+    # whole catalog. Sequence values are offset by item id; gaps are harmless.
+    items = Item.__table__
+    changes = ItemChange.__table__
+    offset = current_sequence(conn)
+    missing = ~exists().where(changes.c.item_id == items.c.id)
+    last = conn.execute(select(func.max(items.c.id)).where(missing)).scalar()
+    if last is None:
+        return
+    conn.execute(changes.insert().from_select(
+        ['item_id', 'seq', 'deleted', 'changed_at'],
+        select(items.c.id, items.c.id + offset, literal(False),
+               func.coalesce(items.c.updated_at, items.c.created_at, datetime.utcnow())).where(missing)
+    ))
+    _next_sequence(conn, last)
+
+
+def parse_since(raw):
+    if not raw:
+        return 0
+    try:
+        since = int(raw)
+    except ValueError:
+        raise ChangeFeedError('Invalid cursor')
+    if since < 0:
+        raise ChangeFeedError('Invalid cursor')
+    return since
+
+
+def parse_change_limit(raw):
+    if raw is None:
+        return DEFAULT_CHANGE_LIMIT
+    return max(1, min(int(raw), MAX_CHANGE_LIMIT))
+
+
+def changes_since(conn, since, limit, columns):
+    # Items (selected columns) and tombstones with seq > since, oldest first
+    if since and since < (_counter(conn, PRUNED_SEQUENCE) or 0):
+        raise CursorExpired('Cursor is older than the retained change history; resync from 0')
+    changes = ItemChange.__table__
+    rows = conn.execute(
+        select(changes.c.item_id, changes.c.seq, changes.c.deleted)
+        .where(changes.c.seq > since).order_by(changes.c.seq).limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = Item.__table__
+    updated_ids = [row.item_id for row in rows if not row.deleted]
+    found = {}
+    for start in range(0, len(updated_ids), 500):
+        chunk = updated_ids[start:start + 500]
+        found.update({
+            row.id: row for row in conn.execute(select(*columns).where(items.c.id.in_(chunk)))
+        })
+    # An item deleted since its change was read is skipped; its tombstone has a later seq
+    updated = [found[row.item_id] for row in rows if row.item_id in found]
+    deleted = [row.item_id for row in rows if row.deleted]
+    return {
+        'cursor': str(rows[-1].seq if rows else max(since, current_sequence(conn))),
+        'has_more': has_more,
+        'updated': updated,
+        'deleted': deleted,
+    }
+
+
+def prune_tombstones(conn, older_than, now=None):
+    # Deletes tombstones older than `older_than`; cursors before them expire
+    changes = ItemChange.__table__
+    cutoff = (now or datetime.utcnow()) - older_than
+    pruned_to = conn.execute(select(func.max(changes.c.seq)).where(
+        changes.c.deleted.is_(True), changes.c.changed_at < cutoff
+    )).scalar()
+    if pruned_to is None:
+        return 0
+    counters = StatCounter.__table__
+    count = conn.execute(changes.delete().where(
+        changes.c.deleted.is_(True), changes.c.seq <= pruned_to
+    )).rowcount
+    # Tombstones up to the old mark are already gone, so pruned_to only ever grows
+    updated = conn.execute(counters.update().where(counters.c.name == PRUNED_SEQUENCE).values(value=pruned_to))
+    if updated.rowcount == 0:
+        conn.execute(counters.insert().values(name=PRUNED_SEQUENCE, value=pruned_to))
+    return count
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_orm_changes(session, flush_context):
+    item_ids = [obj.id for obj in session.new if isinstance(obj, Item)]
+    item_ids += [obj.id for obj in session.dirty if isinstance(obj, Item) and session.is_modified(obj)]
+    deleted_ids = [obj.id for obj in session.deleted if isinstance(obj, Item)]
+    if item_ids or deleted_ids:
+        record_item_changes(session.connection(), item_ids, deleted_ids)
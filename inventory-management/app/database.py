@@ -0,0 +1,78 @@
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+# Engine configuration from the environment:
+#   DATABASE_URL                               sqlite:///..., postgresql://...
+#   DB_POOL_SIZE, DB_MAX_OVERFLOW              connection pool bounds
+#   DB_POOL_RECYCLE, DB_POOL_PRE_PING          connection lifetime / liveness check
+#   SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE,
+#   SQLITE_CACHE_SIZE_KB                       per-connection SQLite tuning
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATABASE_URL = f"sqlite:///{os.path.join(BASE_DIR, 'inventory.db')}"
+
+
+def database_url():
+    url = os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL)
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    parsed = make_url(url)
+    # Relative SQLite paths are relative to the project directory, not the cwd
+    if parsed.get_backend_name() == 'sqlite' and parsed.database not in (None, '', ':memory:') \
+            and not os.path.isabs(parsed.database):
+        url = str(parsed.set(database=os.path.join(BASE_DIR, parsed.database)))
+    return url
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+def engine_options(url):
+    parsed = make_url(url)
+    pool = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+    }
+    if parsed.get_backend_name() == 'sqlite':
+        if parsed.database in (None, '', ':memory:'):
+            return {}
+        # Pooled connections keep their pragmas and page cache between requests
+        return dict(pool, poolclass=QueuePool, connect_args={
+            'check_same_thread': False,
+            'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000.0,
+        })
+    return pool
+
+
+def sqlite_pragmas():
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'cache_size': -int(os.getenv('SQLITE_CACHE_SIZE_KB', 64000)),
+        'temp_store': 'MEMORY',
+    }
+
+
+def configure_database(app):
+    url = database_url()
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+
+
+@event.listens_for(Engine, 'connect')
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas().items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
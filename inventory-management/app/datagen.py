@@ -0,0 +1,183 @@
+import argparse
+import math
+import random
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+
+# Synthetic catalog generator for load tests and benchmarks. Output is
+# reproducible for a given --seed. Popularity is skewed the way real stock
+# is: a few categories and a few hot items take most of the traffic.
+#
+#   DATABASE_URL=sqlite:///bench.db python app/datagen.py --items 100000 --movements 1000000
+
+CHUNK_SIZE = 5000
+
+DEFAULT_SCALE = {
+    'items': 10000,
+    'categories': 40,
+    'locations': 12,
+    'suppliers': 200,
+    'movements': 100000,
+    'alerts': 2000,
+    'audit_logs': 20000,
+}
+
+WORDS = (
+    'bolt', 'nut', 'washer', 'bracket', 'hinge', 'valve', 'filter', 'gasket', 'bearing', 'spring',
+    'cable', 'sensor', 'relay', 'fuse', 'switch', 'panel', 'pump', 'hose', 'clamp', 'seal',
+    'steel', 'brass', 'nylon', 'rubber', 'copper', 'zinc', 'heavy', 'compact', 'sealed', 'mini',
+)
+
+
+class Generator:
+    def __init__(self, seed=42, now=None):
+        self.random = random.Random(seed)
+        self.now = now or datetime.utcnow()
+
+    def zipf_index(self, n, s=1.1):
+        # Index in [0, n) with Zipf-like skew, index 0 most popular
+        u = self.random.random()
+        if s == 1:
+            return min(n - 1, int(math.exp(u * math.log(n + 1))) - 1)
+        value = ((n + 1) ** (1 - s) - 1) * u + 1
+        return min(n - 1, max(0, int(value ** (1 / (1 - s))) - 1))
+
+    def lognormal(self, median, sigma):
+        return median * math.exp(self.random.gauss(0, sigma))
+
+    def names(self, prefix, count):
+        return [f'{prefix}-{i + 1:03d}' for i in range(count)]
+
+    def items(self, count, categories, locations, suppliers):
+        for i in range(count):
+            minimum = self.random.randint(5, 40)
+            maximum = minimum * self.random.randint(4, 12)
+            quantity = max(0, int(self.lognormal(minimum * 3, 0.9)))
+            words = self.random.sample(WORDS, 3)
+            perishable = self.random.random() < 0.25
+            yield {
+                'name': ' '.join(words).title() + f' {i}',
+                'sku': f'SKU-{i + 1:08d}',
+                'quantity': quantity,
+                'category': categories[self.zipf_index(len(categories))],
+                'location': locations[self.zipf_index(len(locations), 0.8)],
+                'description': f"{' '.join(self.random.sample(WORDS, 6))} for general use",
+                'minimum_stock': minimum,
+                'maximum_stock': maximum,
+                'reorder_point': minimum * 2,
+                'unit_price': round(self.lognormal(12, 1.1), 2),
+                'supplier_id': 1 + self.zipf_index(suppliers),
+                'barcode': f'{self.random.randrange(10 ** 12, 10 ** 13)}',
+                'expiration_date': self.now + timedelta(days=self.random.randint(-10, 540)) if perishable else None,
+                'created_at': self.now - timedelta(days=self.random.randint(0, 730)),
+                'created_by': 'datagen',
+            }
+
+    def movements(self, count, item_count, days=365):
+        # Hot items move far more often; outbound is more common than inbound
+        for _ in range(count):
+            outbound = self.random.random() < 0.6
+            yield {
+                'item_id': 1 + self.zipf_index(item_count, 1.05),
+                'quantity_changed': 1 + int(self.random.expovariate(1 / (4 if outbound else 30))),
+                'movement_type': 'out' if outbound else 'in',
+                'reason': 'order fulfilment' if outbound else 'supplier delivery',
+                'timestamp': self.now - timedelta(seconds=self.random.randint(0, days * 86400)),
+                'created_by': 'datagen',
+            }
+
+    def alerts(self, count, item_count):
+        types = ('low_stock', 'overstock', 'expiring')
+        for i in range(count):
+            # Only the first pass over (item, type) may be active: one open alert per pair
+            active = i < item_count * len(types) and self.random.random() < 0.3
+            status = 'active' if active else 'resolved'
+            created = self.now - timedelta(minutes=self.random.randint(0, 90 * 1440))
+            yield {
+                'item_id': 1 + (i // len(types)) % item_count,
+                'alert_type': types[i % len(types)],
+                'message': 'Generated alert',
+                'status': status,
+                'created_at': created,
+                'resolved_at': created + timedelta(hours=6) if status == 'resolved' else None,
+                'resolved_by': 'datagen' if status == 'resolved' else None,
+            }
+
+    def audit_logs(self, count, item_count):
+        for _ in range(count):
+            yield {
+                'action': self.random.choice(('insert', 'update', 'update', 'update', 'delete')),
+                'table_name': 'item',
+                'record_id': 1 + self.zipf_index(item_count),
+                'changes': '{"quantity": [1, 2]}',
+                'timestamp': self.now - timedelta(seconds=self.random.randint(0, 30 * 86400)),
+                'user': 'datagen',
+            }
+
+
+def _insert(conn, table, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            conn.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        conn.execute(table.insert(), chunk)
+
+
+def seed(engine, seed=42, **scale):
+    from models import Item, Category, Location, Supplier, StockMovement, Alert, AuditLog
+    from aggregates import reconcile, rebuild_movement_days
+    from changefeed import backfill as backfill_item_changes
+    from stock_ledger import backfill as backfill_item_stock
+    from migrations import migrate
+    from search_index import rebuild_search_index
+
+    scale = dict(DEFAULT_SCALE, **{key: value for key, value in scale.items() if value is not None})
+    generator = Generator(seed)
+    categories = generator.names('category', scale['categories'])
+    locations = generator.names('location', scale['locations'])
+
+    migrate(engine)
+    with engine.begin() as conn:
+        _insert(conn, Category.__table__, ({'name': name} for name in categories))
+        _insert(conn, Location.__table__, ({'name': name} for name in locations))
+        _insert(conn, Supplier.__table__, ({'name': name} for name in generator.names('supplier', scale['suppliers'])))
+        _insert(conn, Item.__table__, generator.items(scale['items'], categories, locations, scale['suppliers']))
+        _insert(conn, StockMovement.__table__, generator.movements(scale['movements'], scale['items']))
+        _insert(conn, Alert.__table__, generator.alerts(scale['alerts'], scale['items']))
+        _insert(conn, AuditLog.__table__, generator.audit_logs(scale['audit_logs'], scale['items']))
+        # Seeding bypasses the write hooks, so rebuild what they maintain
+        reconcile(conn)
+        rebuild_movement_days(conn)
+        backfill_item_changes(conn)
+        backfill_item_stock(conn)
+    rebuild_search_index(engine)
+    with engine.begin() as conn:
+        if engine.dialect.name in ('sqlite', 'postgresql'):
+            conn.exec_driver_sql('ANALYZE')
+    return scale
+
+
+def main(argv=None):
+    import os
+    from database import database_url, engine_options
+
+    parser = argparse.ArgumentParser(description='Seed the inventory database with synthetic data')
+    for key, value in DEFAULT_SCALE.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=int, default=value)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    url = database_url()
+    engine = create_engine(url, **engine_options(url))
+    scale = seed(engine, seed=args.seed, **{key: getattr(args, key) for key in DEFAULT_SCALE})
+    print(f"Seeded {os.getenv('DATABASE_URL', url)}: {scale}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,270 @@
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, exists, inspect, literal, select
+from sqlalchemy.orm import Session
+
+from models import Item, Alert
+from aggregates import apply_active_alerts
+from alert_engine import (
+    OPEN_STATUSES, SYSTEM_USER, alert_summary, alerts_to_resolve, audit_raised, audit_resolved, rule
+)
+from pubsub import publish_alert_summary
+
+logger = logging.getLogger(__name__)
+
+# In-memory, time-ordered index of item expirations. It is loaded from the
+# expiration_date index at startup and kept current from committed ORM
+# changes (Core writers call stage()). Two heaps share it:
+#   _expiries  (expiration_date, item_id, version)           answers "what expires within N days"
+#   _schedule  (fire_at, item_id, horizon, expiry, version)  drives the horizon alerts
+# Entries are never removed in place. Every change to an item bumps its
+# version, so an entry carrying an older version is stale and skipped, even
+# when the expiry has since changed back to the same value. The heaps are
+# compacted when stale entries outnumber live ones.
+
+DEFAULT_HORIZONS = (30, 7, 1)
+
+
+class ExpirationIndex:
+    def __init__(self, horizons=DEFAULT_HORIZONS):
+        self.set_horizons(horizons)
+        self.loaded = False
+        self._current = {}
+        self._versions = {}
+        self._version = 0
+        self._expiries = []
+        self._schedule = []
+        self._lock = threading.Lock()
+        self.changed = threading.Event()
+
+    def set_horizons(self, horizons):
+        # Days before expiry at which alerts fire, largest first
+        self.horizons = sorted(horizons, reverse=True)
+
+    def __len__(self):
+        return len(self._current)
+
+    def load(self, conn, now=None):
+        items = Item.__table__
+        rows = conn.execute(
+            select(items.c.id, items.c.expiration_date).where(items.c.expiration_date.isnot(None))
+        ).all()
+        with self._lock:
+            self._current = {item_id: expiry for item_id, expiry in rows}
+            self._versions = {item_id: self._next_version() for item_id in self._current}
+            self._rebuild(now or datetime.utcnow(), reschedule=True)
+            self.loaded = True
+        self.changed.set()
+
+    def ensure_loaded(self, engine):
+        if not self.loaded:
+            with engine.connect() as conn:
+                self.load(conn)
+
+    def _next_version(self):
+        self._version += 1
+        return self._version
+
+    def _live(self, item_id, version):
+        return self._versions.get(item_id) == version
+
+    def _events(self, item_id, expiry, now):
+        # One event per horizon still ahead, plus the most recent horizon
+        # already passed: its alert may not have fired yet, and firing is idempotent
+        version = self._versions[item_id]
+        events = []
+        passed = None
+        for horizon in self.horizons:
+            fire_at = expiry - timedelta(days=horizon)
+            if fire_at > now:
+                events.append((fire_at, item_id, horizon, expiry, version))
+            else:
+                passed = (fire_at, item_id, horizon, expiry, version)
+        if passed:
+            events.append(passed)
+        return events
+
+    def _rebuild(self, now, reschedule=False):
+        self._expiries = [(expiry, item_id, self._versions[item_id]) for item_id, expiry in self._current.items()]
+        heapq.heapify(self._expiries)
+        if reschedule:
+            self._schedule = [
+                entry for item_id, expiry in self._current.items() for entry in self._events(item_id, expiry, now)
+            ]
+        else:
+            self._schedule = [entry for entry in self._schedule if self._live(entry[1], entry[4])]
+        heapq.heapify(self._schedule)
+
+    def update(self, changes, now=None):
+        # changes: (item_id, expiration_date or None) pairs
+        now = now or datetime.utcnow()
+        with self._lock:
+            for item_id, expiry in changes:
+                if self._current.get(item_id) == expiry:
+                    continue
+                if expiry is None:
+                    self._current.pop(item_id, None)
+                    self._versions.pop(item_id, None)
+                    continue
+                self._current[item_id] = expiry
+                self._versions[item_id] = self._next_version()
+                heapq.heappush(self._expiries, (expiry, item_id, self._versions[item_id]))
+                for entry in self._events(item_id, expiry, now):
+                    heapq.heappush(self._schedule, entry)
+            if len(self._expiries) > 2 * len(self._current) + 1024:
+                self._rebuild(now)
+        self.changed.set()
+
+    def expiring(self, until, limit=None):
+        # (expiration_date, item_id) for live entries expiring at or before
+        # `until`, soonest first. The walk stops at any node past `until`, so
+        # it only visits the matching entries and their direct children.
+        with self._lock:
+            heap = self._expiries
+            found = []
+            stack = [0]
+            while stack:
+                index = stack.pop()
+                if index >= len(heap) or heap[index][0] > until:
+                    continue
+                expiry, item_id, version = heap[index]
+                if self._live(item_id, version):
+                    found.append((expiry, item_id))
+                stack += (2 * index + 1, 2 * index + 2)
+        found.sort()
+        return found[:limit] if limit is not None else found
+
+    def next_due(self):
+        with self._lock:
+            return self._schedule[0][0] if self._schedule else None
+
+    def pop_due(self, now):
+        due = []
+        with self._lock:
+            while self._schedule and self._schedule[0][0] <= now:
+                *entry, version = heapq.heappop(self._schedule)
+                if self._live(entry[1], version):
+                    due.append(tuple(entry))
+        return due
+
+
+expiration_index = ExpirationIndex()
+
+
+def fire_horizon_alerts(conn, due, now=None):
+    # due: (fire_at, item_id, horizon, expiry) entries. Supersedes an open
+    # expiring alert raised before this horizon with a fresh one; an alert
+    # raised after the horizon passed is left alone.
+    now = now or datetime.utcnow()
+    items = Item.__table__
+    alerts = Alert.__table__
+    _, message = rule(items, 'expiring', now)
+    raised = 0
+    resolved = 0
+    active_delta = 0
+
+    for fire_at, item_id, horizon, expiry in due:
+        superseding = alerts_to_resolve(
+            conn, alerts.c.item_id == item_id, alerts.c.alert_type == 'expiring', alerts.c.created_at < fire_at
+        )
+        for status in OPEN_STATUSES:
+            superseded = conn.execute(alerts.update().where(
+                alerts.c.item_id == item_id,
+                alerts.c.alert_type == 'expiring',
+                alerts.c.status == status,
+                alerts.c.created_at < fire_at,
+            ).values(status='resolved', resolved_at=now, resolved_by=SYSTEM_USER)).rowcount
+            resolved += superseded
+            if status == 'active':
+                active_delta -= superseded
+        audit_resolved(conn, superseding, now)
+
+        open_alert = exists().where(
+            alerts.c.item_id == items.c.id,
+            alerts.c.alert_type == 'expiring',
+            alerts.c.status.in_(OPEN_STATUSES),
+        )
+        new_alert = select(
+            items.c.id, literal('expiring'), message + literal(f' (within {horizon} days)'),
+            literal('active'), literal(now)
+        ).where(items.c.id == item_id, items.c.expiration_date == expiry, ~open_alert)
+        inserted = max(conn.execute(alerts.insert().from_select(
+            ['item_id', 'alert_type', 'message', 'status', 'created_at'], new_alert
+        )).rowcount, 0)
+        if inserted:
+            audit_raised(conn, now, alerts.c.item_id == item_id, alerts.c.alert_type == 'expiring')
+        raised += inserted
+        active_delta += inserted
+
+    apply_active_alerts(conn, active_delta)
+    return alert_summary(raised={'expiring': raised}, resolved={'expiring': resolved})
+
+
+def start_expiration_scheduler(engine, index=expiration_index, resync_interval=3600, max_wait=60):
+    # Sleeps until the next horizon is due (or the index changes) and fires
+    # the due alerts in one transaction. The index is reloaded every
+    # resync_interval seconds to pick up changes made by other processes.
+    def run():
+        next_resync = datetime.utcnow() + timedelta(seconds=resync_interval)
+        while not stop.is_set():
+            try:
+                now = datetime.utcnow()
+                if now >= next_resync:
+                    with engine.connect() as conn:
+                        index.load(conn, now)
+                    next_resync = now + timedelta(seconds=resync_interval)
+                due = index.pop_due(now)
+                if due:
+                    with engine.begin() as conn:
+                        summary = fire_horizon_alerts(conn, due, now)
+                    publish_alert_summary(summary)
+                    logger.info(f"Expiration scheduler: {len(due)} horizons due, "
+                                f"{summary['raised']['expiring']} alerts raised")
+            except Exception as e:
+                logger.error(f"Expiration scheduler failed: {str(e)}")
+
+            index.changed.clear()
+            next_due = index.next_due()
+            wait = max_wait if next_due is None else (next_due - datetime.utcnow()).total_seconds()
+            index.changed.wait(max(0.0, min(wait, max_wait)))
+
+    stop = threading.Event()
+    index.ensure_loaded(engine)
+    thread = threading.Thread(target=run, name='expiration-scheduler', daemon=True)
+    thread.start()
+    return stop
+
+
+def stage(session, changes):
+    session.info.setdefault('expiration_changes', []).extend(changes)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_expiration_changes(session, flush_context):
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Item) and obj.expiration_date is not None:
+            changes.append((obj.id, obj.expiration_date))
+    for obj in session.dirty:
+        if isinstance(obj, Item) and inspect(obj).attrs.expiration_date.history.has_changes():
+            changes.append((obj.id, obj.expiration_date))
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            changes.append((obj.id, None))
+    if changes:
+        stage(session, changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_expiration_changes(session):
+    changes = session.info.pop('expiration_changes', None)
+    if changes and expiration_index.loaded:
+        expiration_index.update(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_expiration_changes(session):
+    session.info.pop('expiration_changes', None)
@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from serializers import item_serializer, movement_serializer, alert_serializer
+
+EXPORT_CHUNK_SIZE = 1000
+
+# resource name -> (serializer, column used by the since/until filters)
+EXPORT_RESOURCES = {
+    'items': (item_serializer, 'created_at'),
+    'stock_movements': (movement_serializer, 'timestamp'),
+    'alerts': (alert_serializer, 'created_at'),
+}
+
+
+def parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid timestamp: {value}')
+
+
+def export_query(resource, since=None, until=None, fields=None):
+    serializer, time_column = EXPORT_RESOURCES[resource]
+    table = serializer.table
+    # Ordered along the time index so since/until ranges never scan the table
+    stmt = serializer.select(fields).order_by(table.c[time_column], table.c.id)
+    if since:
+        stmt = stmt.where(table.c[time_column] >= since)
+    if until:
+        stmt = stmt.where(table.c[time_column] < until)
+    return stmt
+
+
+def iter_chunks(session, resource, stmt, chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+    # stream_results keeps a server-side cursor open so only one chunk is held in memory
+    serializer, _ = EXPORT_RESOURCES[resource]
+    columns = list(stmt.selected_columns)
+    result = session.execute(stmt.execution_options(stream_results=True))
+    try:
+        for rows in result.partitions(chunk_size):
+            yield list(serializer.row_values(rows, columns))
+            if progress:
+                progress(len(rows))
+    finally:
+        result.close()
+
+
+def _column_names(stmt):
+    return [column.name for column in stmt.selected_columns]
+
+
+def stream_json(session, resource, stmt, timestamp, progress=None):
+    names = _column_names(stmt)
+    yield '{"timestamp": %s, "type": %s, "data": [' % (json.dumps(timestamp), json.dumps(resource))
+    first = True
+    for chunk in iter_chunks(session, resource, stmt, progress=progress):
+        body = ','.join(json.dumps(dict(zip(names, row))) for row in chunk)
+        yield body if first else ',' + body
+        first = False
+    yield ']}'
+
+
+def stream_ndjson(session, resource, stmt, timestamp, progress=None):
+    names = _column_names(stmt)
+    for chunk in iter_chunks(session, resource, stmt, progress=progress):
+        yield ''.join(json.dumps(dict(zip(names, row))) + '\n' for row in chunk)
+
+
+def stream_csv(session, resource, stmt, timestamp, progress=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(_column_names(stmt))
+    for chunk in iter_chunks(session, resource, stmt, progress=progress):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an empty export
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# format -> (generator, mimetype)
+EXPORT_FORMATS = {
+    'json': (stream_json, 'application/json'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+    'csv': (stream_csv, 'text/csv'),
+}
@@ -0,0 +1,178 @@
+import csv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from itertools import islice
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Category, Location, Supplier
+from ingest import ITEM_FIELDS, REQUIRED_FIELDS, ItemIngestor, validate_item_row
+
+# Bulk item import from CSV or XLSX files. The file is read row by row;
+# chunks of rows are validated on a thread pool (coercion, required fields,
+# category/location/supplier resolution) while the calling thread loads the
+# previous chunks through ItemIngestor, so validation overlaps parsing and the
+# database writes. At most 2 * workers chunks are in flight, which bounds
+# memory by chunk size rather than file size; the only state that grows with
+# the file is the set of SKUs seen, used to reject duplicates. Rejected rows
+# go to a CSV error report.
+
+IMPORT_FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Columns accepted besides the item fields: a supplier may be given by name
+EXTRA_COLUMNS = ('supplier',)
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def _header(cells):
+    columns = [str(cell).strip().lower() if cell is not None else '' for cell in cells]
+    unknown = [column for column in columns if column and column not in ITEM_FIELDS and column not in EXTRA_COLUMNS]
+    if unknown:
+        raise ImportFileError(f"Unknown column(s): {', '.join(unknown)}")
+    missing = [field for field in REQUIRED_FIELDS if field not in columns]
+    if missing:
+        raise ImportFileError(f"Missing column(s): {', '.join(missing)}")
+    return columns
+
+
+def read_csv(path):
+    # Yields the header, then one list of cells per line
+    with open(path, newline='', encoding='utf-8-sig') as source:
+        yield from csv.reader(source)
+
+
+def read_xlsx(path):
+    # Yields the header, then one list of cells per row of the first sheet
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError('XLSX import needs the openpyxl package')
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield [cell.isoformat() if isinstance(cell, (date, datetime)) else cell for cell in row]
+    finally:
+        workbook.close()
+
+
+READERS = {'csv': read_csv, 'xlsx': read_xlsx}
+
+
+def _records(rows, columns):
+    # (row number, {column: value}) with blank cells dropped; row 1 is the header
+    for number, cells in enumerate(rows, start=2):
+        record = {}
+        for column, cell in zip(columns, cells):
+            if isinstance(cell, str):
+                cell = cell.strip()
+            if column and cell not in (None, ''):
+                record[column] = cell
+        if record:
+            yield number, record
+
+
+class References:
+    def __init__(self, conn):
+        # Names resolve case-insensitively to the spelling stored in the reference tables
+        self.categories = {name.lower(): name for name in conn.execute(select(Category.__table__.c.name)).scalars()}
+        self.locations = {name.lower(): name for name in conn.execute(select(Location.__table__.c.name)).scalars()}
+        suppliers = conn.execute(select(Supplier.__table__.c.id, Supplier.__table__.c.name)).all()
+        self.supplier_ids = {supplier_id for supplier_id, _ in suppliers}
+        self.supplier_names = {name.lower(): supplier_id for supplier_id, name in suppliers}
+
+
+def validate_chunk(chunk, references):
+    # (row number, clean row or None, errors, sku) per record
+    results = []
+    for number, record in chunk:
+        errors = []
+        supplier = record.pop('supplier', None)
+        if supplier is not None and 'supplier_id' not in record:
+            record['supplier_id'] = references.supplier_names.get(str(supplier).lower())
+            if record['supplier_id'] is None:
+                errors.append(f'Unknown supplier {supplier!r}')
+        clean, row_errors = validate_item_row(record)
+        errors += row_errors
+        if clean:
+            for field, known in (('category', references.categories), ('location', references.locations)):
+                resolved = known.get(clean[field].lower())
+                if resolved is None:
+                    errors.append(f'Unknown {field} {clean[field]!r}')
+                clean[field] = resolved
+            if clean.get('supplier_id') is not None and clean['supplier_id'] not in references.supplier_ids:
+                errors.append(f"Unknown supplier_id {clean['supplier_id']}")
+        results.append((number, None if errors else clean, errors, record.get('sku')))
+    return results
+
+
+class FileImporter:
+    def __init__(self, chunk_size=2000, workers=4):
+        self.chunk_size = chunk_size
+        self.workers = workers
+
+    def configure(self, chunk_size=None, workers=None):
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        if workers is not None:
+            self.workers = workers
+
+    def run(self, engine, path, format_type, report_path, user='npcrecruit', progress=None):
+        rows = READERS[format_type](path)
+        try:
+            columns = _header(next(rows))
+        except StopIteration:
+            raise ImportFileError('File is empty')
+        records = _records(rows, columns)
+        summary = {'rows': 0, 'created': 0, 'updated': 0, 'error': 0}
+        seen_skus = set()
+
+        with engine.connect() as conn:
+            references = References(conn)
+        with Session(engine) as session, open(report_path, 'w', newline='') as report, \
+                ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='import') as pool:
+            ingestor = ItemIngestor(session, engine.dialect.name, user=user, chunk_size=self.chunk_size)
+            errors = csv.writer(report)
+            errors.writerow(['row', 'sku', 'errors'])
+
+            def load(validated):
+                # Runs in file order, so the first occurrence of a SKU wins
+                valid = []
+                for number, clean, row_errors, sku in validated:
+                    if clean and clean['sku'] in seen_skus:
+                        clean, row_errors = None, ['Duplicate sku in file']
+                    if clean:
+                        seen_skus.add(clean['sku'])
+                        valid.append((number, clean))
+                    else:
+                        errors.writerow([number, sku, '; '.join(row_errors)])
+                        summary['error'] += 1
+                for number, result in ingestor.load_chunk(valid) if valid else ():
+                    summary[result['status']] += 1
+                    if result['status'] == 'error':
+                        errors.writerow([number, result['sku'], '; '.join(result['errors'])])
+                summary['rows'] += len(validated)
+                if progress:
+                    progress(len(validated))
+
+            pending = deque()
+            while True:
+                chunk = list(islice(records, self.chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.submit(validate_chunk, chunk, references))
+                if len(pending) >= 2 * self.workers:
+                    load(pending.popleft().result())
+            while pending:
+                load(pending.popleft().result())
+        return summary
+
+
+file_importer = FileImporter()
@@ -0,0 +1,192 @@
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, DBAPIError
+
+from models import Item
+from aggregates import apply_item_changes
+from audit import record_changes
+from expirations import stage as stage_expirations
+from changefeed import record_item_changes
+from pubsub import stage as stage_stream_events
+from lookup import stage as stage_lookup
+from stock_ledger import apply_item_stock
+
+INGEST_CHUNK_SIZE = 1000
+
+REQUIRED_FIELDS = ('name', 'sku', 'quantity', 'category', 'location')
+
+# field -> coercion applied to incoming values
+ITEM_FIELDS = {
+    'name': str,
+    'sku': str,
+    'quantity': int,
+    'category': str,
+    'location': str,
+    'description': str,
+    'minimum_stock': int,
+    'maximum_stock': int,
+    'reorder_point': int,
+    'unit_price': float,
+    'supplier_id': int,
+    'barcode': str,
+    'expiration_date': datetime.fromisoformat,
+    'last_restock_date': datetime.fromisoformat,
+}
+
+STRING_LIMITS = {'name': 100, 'sku': 50, 'category': 50, 'location': 50, 'barcode': 100}
+
+
+def validate_item_row(data):
+    if not isinstance(data, dict):
+        return None, ['Row must be an object']
+
+    errors = []
+    clean = {}
+    for field in REQUIRED_FIELDS:
+        if data.get(field) in (None, ''):
+            errors.append(f'{field} is required')
+    for field, value in data.items():
+        if field not in ITEM_FIELDS:
+            errors.append(f'Unknown field {field}')
+            continue
+        if value is None:
+            clean[field] = None
+            continue
+        try:
+            clean[field] = ITEM_FIELDS[field](value)
+        except (TypeError, ValueError):
+            errors.append(f'Invalid value for {field}: {value!r}')
+            continue
+        limit = STRING_LIMITS.get(field)
+        if limit and len(clean[field]) > limit:
+            errors.append(f'{field} is longer than {limit} characters')
+    if clean.get('quantity') is not None and clean['quantity'] < 0:
+        errors.append('quantity cannot be negative')
+    return (None if errors else clean), errors
+
+
+def _upsert_statement(dialect_name, table, columns):
+    if dialect_name == 'sqlite':
+        stmt = sqlite.insert(table)
+    elif dialect_name == 'postgresql':
+        stmt = postgresql.insert(table)
+    else:
+        return None
+    # Only overwrite the columns the feed actually sent
+    updates = {column: stmt.excluded[column] for column in columns if column != 'sku'}
+    updates['updated_at'] = datetime.utcnow()
+    updates['updated_by'] = stmt.excluded.updated_by
+    return stmt.on_conflict_do_update(index_elements=['sku'], set_=updates)
+
+
+class ItemIngestor:
+    def __init__(self, session, dialect_name, user='npcrecruit', chunk_size=INGEST_CHUNK_SIZE):
+        self.session = session
+        self.dialect_name = dialect_name
+        self.user = user
+        self.chunk_size = chunk_size
+        self.table = Item.__table__
+
+    def ingest(self, rows, progress=None):
+        # progress(n) is called as rows are validated and as each chunk is loaded
+        results = [None] * len(rows)
+        valid = []
+        seen_skus = {}
+
+        # Validate every row before touching the database
+        for index, data in enumerate(rows):
+            clean, errors = validate_item_row(data)
+            if clean and clean['sku'] in seen_skus:
+                errors = [f"Duplicate sku in batch (first seen in row {seen_skus[clean['sku']]})"]
+            if errors:
+                sku = data.get('sku') if isinstance(data, dict) else None
+                results[index] = {'row': index, 'sku': sku, 'status': 'error', 'errors': errors}
+                continue
+            seen_skus[clean['sku']] = index
+            valid.append((index, clean))
+        if progress:
+            progress(len(rows) - len(valid))
+
+        for start in range(0, len(valid), self.chunk_size):
+            chunk = valid[start:start + self.chunk_size]
+            for index, result in self.load_chunk(chunk):
+                results[index] = result
+            if progress:
+                progress(len(chunk))
+        return results
+
+    def load_chunk(self, chunk):
+        # chunk: (index, clean row) pairs; returns (index, result) pairs
+        try:
+            results = self._write(chunk)
+            self.session.commit()
+            return results
+        except (IntegrityError, DBAPIError):
+            self.session.rollback()
+
+        # Something in the chunk was rejected, retry row by row to isolate it
+        results = []
+        for entry in chunk:
+            index, clean = entry
+            try:
+                results += self._write([entry])
+                self.session.commit()
+            except (IntegrityError, DBAPIError) as e:
+                self.session.rollback()
+                results.append((index, {'row': index, 'sku': clean['sku'], 'status': 'error',
+                                        'errors': [str(e.orig)]}))
+        return results
+
+    def _write(self, chunk):
+        skus = [clean['sku'] for _, clean in chunk]
+        # Whole rows, so the audit trail gets a full column diff
+        before = {
+            row.sku: dict(row._mapping) for row in self.session.execute(
+                select(self.table).where(self.table.c.sku.in_(skus))
+            )
+        }
+        existing = set(before)
+
+        # executemany needs the same keys on every row, so group by column set
+        groups = {}
+        for index, clean in chunk:
+            columns = tuple(sorted(clean))
+            groups.setdefault(columns, []).append(dict(clean, created_by=self.user, updated_by=self.user))
+
+        for columns, params in groups.items():
+            stmt = _upsert_statement(self.dialect_name, self.table, columns)
+            if stmt is None:
+                new_rows = [row for row in params if row['sku'] not in existing]
+                if new_rows:
+                    self.session.execute(self.table.insert(), new_rows)
+                for row in params:
+                    if row['sku'] in existing:
+                        values = {key: value for key, value in row.items() if key != 'created_by'}
+                        self.session.execute(
+                            self.table.update().where(self.table.c.sku == row['sku'])
+                            .values(values, updated_at=datetime.utcnow())
+                        )
+            else:
+                self.session.execute(stmt, params)
+
+        after = {
+            row.sku: dict(row._mapping) for row in self.session.execute(
+                select(self.table).where(self.table.c.sku.in_(skus))
+            )
+        }
+        changes = [(before.get(sku), row) for sku, row in after.items()]
+        apply_item_changes(self.session.connection(), changes)
+        apply_item_stock(self.session.connection(), changes)
+        record_item_changes(self.session.connection(), [row['id'] for row in after.values()])
+        record_changes(self.session, 'item', changes, user=self.user)
+        stage_expirations(self.session, [(row['id'], row['expiration_date']) for row in after.values()])
+        stage_stream_events(self.session)
+        stage_lookup(self.session)
+        ids = {sku: row['id'] for sku, row in after.items()}
+        return [
+            (index, {'row': index, 'sku': clean['sku'], 'id': ids.get(clean['sku']),
+                     'status': 'updated' if clean['sku'] in existing else 'created'})
+            for index, clean in chunk
+        ]
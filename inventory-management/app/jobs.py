@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import Job
+from exporter import EXPORT_FORMATS, export_query
+from ingest import ItemIngestor
+from alert_engine import evaluate_alerts
+from reports import build_report
+from reorder import reorder_suggestions
+from file_import import file_importer
+from pubsub import publish_alert_summary
+
+logger = logging.getLogger(__name__)
+
+# Background jobs for work too long for a request: full exports, large item
+# imports, catalog-wide alert sweeps, reports and reorder plans. Each job is a
+# row in the job table; a thread pool runs at most `workers` of them at once and files
+# produced by a job are kept under `result_dir` until pruned. Jobs live in
+# this process, so any left queued or running by a restart are failed by
+# recover() on startup.
+
+PROGRESS_INTERVAL = 0.5
+
+
+class JobError(ValueError):
+    pass
+
+
+class JobContext:
+    def __init__(self, runner, job_id):
+        self.runner = runner
+        self.job_id = job_id
+        self.engine = runner.engine
+        self.processed = 0
+        self.total = None
+        self._reported = 0.0
+
+    def set_total(self, total):
+        self.total = total
+        self.runner._update(self.job_id, total=total)
+
+    def advance(self, count):
+        # Progress is written at most every PROGRESS_INTERVAL seconds
+        self.processed += count
+        now = time.monotonic()
+        if now - self._reported >= PROGRESS_INTERVAL:
+            self._reported = now
+            self.runner._update(self.job_id, processed=self.processed)
+
+    def result_file(self, extension):
+        return os.path.join(self.runner.result_dir, f'{self.job_id}.{extension}')
+
+
+def run_export(context, params, payload):
+    resource, format_type = params['resource'], params['format']
+    generate, mimetype = EXPORT_FORMATS[format_type]
+    since = datetime.fromisoformat(params['since']) if params.get('since') else None
+    until = datetime.fromisoformat(params['until']) if params.get('until') else None
+    stmt = export_query(resource, since, until, params.get('fields'))
+    path = context.result_file(format_type)
+
+    with Session(context.engine) as session:
+        context.set_total(session.execute(
+            select(func.count()).select_from(stmt.order_by(None).subquery())
+        ).scalar())
+        with open(path, 'w', newline='') as output:
+            for part in generate(session, resource, stmt, datetime.utcnow().isoformat(), progress=context.advance):
+                output.write(part)
+    return {'rows': context.processed}, path, mimetype
+
+
+def run_item_import(context, params, payload):
+    context.set_total(len(payload))
+    with Session(context.engine) as session:
+        ingestor = ItemIngestor(session, context.engine.dialect.name, user=params.get('user') or 'npcrecruit')
+        results = ingestor.ingest(payload, progress=context.advance)
+
+    summary = {status: 0 for status in ('created', 'updated', 'error')}
+    for result in results:
+        summary[result['status']] += 1
+    # Per-row results can be large; they are the downloadable result
+    path = context.result_file('json')
+    with open(path, 'w') as output:
+        json.dump(results, output)
+    return summary, path, 'application/json'
+
+
+def run_file_import(context, params, payload):
+    # The uploaded file is deleted once read; the error report is the result
+    path = context.result_file('csv')
+    try:
+        summary = file_importer.run(context.engine, params['path'], params['format'], path,
+                                    user=params.get('user') or 'npcrecruit', progress=context.advance)
+    finally:
+        if os.path.exists(params['path']):
+            os.unlink(params['path'])
+    return summary, path, 'text/csv'
+
+
+def run_alert_sweep(context, params, payload):
+    with context.engine.begin() as conn:
+        summary = evaluate_alerts(conn)
+    publish_alert_summary(summary)
+    return summary, None, None
+
+
+def run_report(context, params, payload):
+    with Session(context.engine) as session:
+        report = build_report(session, params['report_type'], params.get('range', 'week'),
+                              category=params.get('category'), item_id=params.get('item_id'),
+                              location=params.get('location'))
+    path = context.result_file('json')
+    with open(path, 'w') as output:
+        json.dump(report, output)
+    return {'type': report['type'], 'range': report['range']}, path, 'application/json'
+
+
+def run_reorder_plan(context, params, payload):
+    with context.engine.connect() as conn:
+        plan = reorder_suggestions(conn, params)
+    path = context.result_file('json')
+    with open(path, 'w') as output:
+        json.dump(plan, output)
+    return plan['summary'], path, 'application/json'
+
+
+JOB_HANDLERS = {
+    'export': run_export,
+    'item_import': run_item_import,
+    'file_import': run_file_import,
+    'alert_sweep': run_alert_sweep,
+    'report': run_report,
+    'reorder_plan': run_reorder_plan,
+}
+
+
+class JobRunner:
+    def __init__(self, workers=2, result_dir=None):
+        self.engine = None
+        self.workers = workers
+        self.result_dir = result_dir
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def configure(self, engine, workers=None, result_dir=None):
+        self.engine = engine
+        if workers is not None:
+            self.workers = workers
+        if result_dir is not None:
+            self.result_dir = result_dir
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                os.makedirs(self.result_dir, exist_ok=True)
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+            return self._executor
+
+    def submit(self, kind, params=None, payload=None, user=None):
+        # params are stored with the job; payload (e.g. rows to import) is only held in memory
+        if kind not in JOB_HANDLERS:
+            raise JobError(f"Unknown job kind '{kind}'")
+        job_id = uuid.uuid4().hex
+        with self.engine.begin() as conn:
+            conn.execute(Job.__table__.insert().values(
+                id=job_id, kind=kind, status='queued', params=json.dumps(params or {}),
+                processed=0, created_by=user, created_at=datetime.utcnow(),
+            ))
+        self._pool().submit(self._run, job_id, kind, params or {}, payload)
+        return job_id
+
+    def get(self, job_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(Job.__table__).where(Job.__table__.c.id == job_id)).first()
+        return dict(row._mapping) if row else None
+
+    def _update(self, job_id, **values):
+        jobs = Job.__table__
+        with self.engine.begin() as conn:
+            conn.execute(jobs.update().where(jobs.c.id == job_id).values(**values))
+
+    def _run(self, job_id, kind, params, payload):
+        self._update(job_id, status='running', started_at=datetime.utcnow())
+        context = JobContext(self, job_id)
+        try:
+            result, path, mimetype = JOB_HANDLERS[kind](context, params, payload)
+        except Exception as e:
+            logger.error(f"Job {job_id} ({kind}) failed: {str(e)}")
+            self._update(job_id, status='failed', error=str(e), processed=context.processed,
+                         finished_at=datetime.utcnow())
+            return
+        self._update(job_id, status='done', result=json.dumps(result), result_path=path,
+                     result_mimetype=mimetype, processed=context.processed, finished_at=datetime.utcnow())
+
+    def recover(self):
+        # Jobs are not resumable; anything a previous process left unfinished has failed
+        jobs = Job.__table__
+        with self.engine.begin() as conn:
+            return conn.execute(jobs.update().where(jobs.c.status.in_(('queued', 'running'))).values(
+                status='failed', error='Interrupted by a restart', finished_at=datetime.utcnow()
+            )).rowcount
+
+    def prune(self, older_than):
+        # Deletes finished jobs (and their files) that finished before now - older_than
+        jobs = Job.__table__
+        cutoff = datetime.utcnow() - older_than
+        with self.engine.begin() as conn:
+            stale = conn.execute(select(jobs.c.id, jobs.c.result_path).where(
+                jobs.c.status.in_(('done', 'failed')), jobs.c.finished_at < cutoff
+            )).all()
+            for _, path in stale:
+                if path and os.path.exists(path):
+                    os.unlink(path)
+            if stale:
+                conn.execute(jobs.delete().where(jobs.c.id.in_([job_id for job_id, _ in stale])))
+        return len(stale)
+
+
+def job_status(job):
+    progress = None
+    if job['total']:
+        progress = round(min(1.0, job['processed'] / job['total']), 4)
+    elif job['status'] == 'done':
+        progress = 1.0
+    return {
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'progress': progress,
+        'processed': job['processed'],
+        'total': job['total'],
+        'result': json.loads(job['result']) if job['result'] else None,
+        'error': job['error'],
+        'created_at': job['created_at'].isoformat() if job['created_at'] else None,
+        'started_at': job['started_at'].isoformat() if job['started_at'] else None,
+        'finished_at': job['finished_at'].isoformat() if job['finished_at'] else None,
+    }
+
+
+job_runner = JobRunner()
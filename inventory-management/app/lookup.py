@@ -0,0 +1,250 @@
+import logging
+import threading
+from array import array
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models import Item
+from changefeed import CursorExpired, changes_since, current_sequence
+
+logger = logging.getLogger(__name__)
+
+# In-process barcode/SKU lookup for scanners. Hot fields live in parallel
+# columns (arrays for the numbers, lists for the strings) indexed by slot;
+# hash maps take a barcode or SKU to an item id and an item id to its slot,
+# so a lookup costs no database round trip. The index is loaded once and
+# then caught up from the item change feed: writers call sync() after they
+# commit, and a background thread does the same periodically to pick up
+# writes from other processes. Change feed sequence numbers follow commit
+# order, so changes are applied in the order they committed.
+
+LOOKUP_COLUMNS = ('id', 'sku', 'barcode', 'name', 'quantity', 'location', 'unit_price')
+MAX_LOOKUP_BATCH = 1000
+SYNC_PAGE_SIZE = 5000
+
+_NO_PRICE = float('nan')
+
+
+class ItemLookup:
+    def __init__(self):
+        self.loaded = False
+        self.cursor = 0
+        self._reset()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def _reset(self):
+        self._slots = {}
+        self._free = []
+        self._by_sku = {}
+        self._by_barcode = {}
+        # Item ids sharing a barcode beyond the first; barcodes are not unique
+        self._shared_barcodes = {}
+        self._ids = array('q')
+        self._quantities = array('q')
+        self._prices = array('d')
+        self._skus = []
+        self._barcodes = []
+        self._names = []
+        self._locations = []
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _columns(self):
+        items = Item.__table__
+        return [items.c[column] for column in LOOKUP_COLUMNS]
+
+    def load(self, conn):
+        cursor = current_sequence(conn)
+        rows = conn.execute(select(*self._columns())).all()
+        # Built column by column; going through _put row by row is several times slower
+        ids, skus, barcodes, names, quantities, locations, prices = zip(*rows) if rows else ((),) * 7
+        by_barcode = {}
+        shared = {}
+        for item_id, barcode in zip(ids, barcodes):
+            if not barcode:
+                continue
+            if barcode in by_barcode:
+                shared.setdefault(barcode, set()).add(item_id)
+            else:
+                by_barcode[barcode] = item_id
+        with self._lock:
+            self._reset()
+            self._slots = {item_id: slot for slot, item_id in enumerate(ids)}
+            self._by_sku = dict(zip(skus, ids))
+            self._by_barcode = by_barcode
+            self._shared_barcodes = shared
+            self._ids = array('q', ids)
+            self._quantities = array('q', [quantity or 0 for quantity in quantities])
+            self._prices = array('d', [_NO_PRICE if price is None else price for price in prices])
+            self._skus = list(skus)
+            self._barcodes = list(barcodes)
+            self._names = list(names)
+            self._locations = list(locations)
+            self.cursor = cursor
+            self.loaded = True
+
+    def ensure_loaded(self, engine):
+        if not self.loaded:
+            with self._sync_lock, engine.connect() as conn:
+                if not self.loaded:
+                    self.load(conn)
+
+    def sync(self, engine):
+        # Applies every change committed after the cursor; returns how many
+        with self._sync_lock, engine.connect() as conn:
+            if not self.loaded:
+                self.load(conn)
+                return len(self)
+            applied = 0
+            while True:
+                try:
+                    page = changes_since(conn, self.cursor, SYNC_PAGE_SIZE, self._columns())
+                except CursorExpired:
+                    self.load(conn)
+                    return len(self)
+                with self._lock:
+                    for row in page['updated']:
+                        self._put(row)
+                    for item_id in page['deleted']:
+                        self._remove(item_id)
+                    self.cursor = int(page['cursor'])
+                applied += len(page['updated']) + len(page['deleted'])
+                if not page['has_more']:
+                    return applied
+
+    def _put(self, row):
+        item_id, sku, barcode, name, quantity, location, price = row
+        slot = self._slots.get(item_id)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+                self._ids[slot] = item_id
+            else:
+                slot = len(self._ids)
+                self._ids.append(item_id)
+                for column in (self._quantities, self._prices):
+                    column.append(0)
+                for column in (self._skus, self._barcodes, self._names, self._locations):
+                    column.append(None)
+            self._slots[item_id] = slot
+        else:
+            self._unmap(slot)
+        self._quantities[slot] = quantity or 0
+        self._prices[slot] = _NO_PRICE if price is None else price
+        self._skus[slot] = sku
+        self._barcodes[slot] = barcode
+        self._names[slot] = name
+        self._locations[slot] = location
+        self._by_sku[sku] = item_id
+        if barcode:
+            if barcode in self._by_barcode:
+                self._shared_barcodes.setdefault(barcode, set()).add(item_id)
+            else:
+                self._by_barcode[barcode] = item_id
+
+    def _remove(self, item_id):
+        slot = self._slots.pop(item_id, None)
+        if slot is None:
+            return
+        self._unmap(slot)
+        self._skus[slot] = self._barcodes[slot] = self._names[slot] = self._locations[slot] = None
+        self._free.append(slot)
+
+    def _unmap(self, slot):
+        item_id = self._ids[slot]
+        if self._by_sku.get(self._skus[slot]) == item_id:
+            del self._by_sku[self._skus[slot]]
+        barcode = self._barcodes[slot]
+        if not barcode:
+            return
+        shared = self._shared_barcodes.get(barcode)
+        if self._by_barcode.get(barcode) == item_id:
+            if shared:
+                self._by_barcode[barcode] = shared.pop()
+            else:
+                del self._by_barcode[barcode]
+        elif shared:
+            shared.discard(item_id)
+        if shared is not None and not shared:
+            del self._shared_barcodes[barcode]
+
+    def _entry(self, item_id):
+        slot = self._slots[item_id]
+        price = self._prices[slot]
+        return {
+            'id': item_id,
+            'sku': self._skus[slot],
+            'barcode': self._barcodes[slot],
+            'name': self._names[slot],
+            'quantity': self._quantities[slot],
+            'location': self._locations[slot],
+            'unit_price': None if price != price else price,
+        }
+
+    def by_sku(self, sku):
+        with self._lock:
+            item_id = self._by_sku.get(sku)
+            return self._entry(item_id) if item_id is not None else None
+
+    def by_barcode(self, barcode):
+        # Every item with the barcode, lowest id first
+        with self._lock:
+            item_id = self._by_barcode.get(barcode)
+            if item_id is None:
+                return []
+            item_ids = sorted({item_id} | self._shared_barcodes.get(barcode, set()))
+            return [self._entry(item_id) for item_id in item_ids]
+
+
+item_lookup = ItemLookup()
+
+
+def sync_after_write(engine):
+    # Called by writers once their transaction has committed
+    if not item_lookup.loaded:
+        return
+    try:
+        item_lookup.sync(engine)
+    except Exception as e:
+        logger.error(f"Item lookup sync failed: {str(e)}")
+
+
+def start_lookup_sync(engine, interval):
+    def run():
+        while not stop.wait(interval):
+            try:
+                item_lookup.sync(engine)
+            except Exception as e:
+                logger.error(f"Item lookup sync failed: {str(e)}")
+
+    stop = threading.Event()
+    item_lookup.ensure_loaded(engine)
+    thread = threading.Thread(target=run, name='item-lookup-sync', daemon=True)
+    thread.start()
+    return stop
+
+
+def stage(session):
+    session.info['lookup_stale'] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_item_writes(session, flush_context):
+    for objects in (session.new, session.dirty, session.deleted):
+        if any(isinstance(obj, Item) for obj in objects):
+            stage(session)
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _sync_committed(session):
+    if session.info.pop('lookup_stale', False):
+        sync_after_write(session.get_bind())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_item_writes(session):
+    session.info.pop('lookup_stale', None)
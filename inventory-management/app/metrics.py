@@ -0,0 +1,225 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Request and SQL instrumentation. Engine events count and time every
+# statement issued while a request is being served; Flask hooks turn that
+# into per-endpoint series that /api/metrics renders in the Prometheus text
+# format. Statements over SLOW_QUERY_MS are logged wherever they run.
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_local = threading.local()
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(labels)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._series = defaultdict(float)
+
+    def inc(self, labels, value=1):
+        self._series[labels] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._series.items()):
+            lines.append(f'{self.name}{_labels(labels)} {value:g}')
+        return lines
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+class RequestStats:
+    __slots__ = ('started', 'statements', 'sql_seconds', 'slowest', 'slowest_seconds', 'status', 'size')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.slowest = None
+        self.slowest_seconds = 0.0
+        self.status = None
+        self.size = 0
+
+
+class Metrics:
+    def __init__(self):
+        self.slow_query_seconds = 0
+        self.slow_request_seconds = 0
+        self._lock = threading.Lock()
+        self.request_duration = Histogram(
+            'inventory_http_request_duration_seconds', 'Request latency by endpoint', LATENCY_BUCKETS)
+        self.request_statements = Histogram(
+            'inventory_http_request_sql_statements', 'SQL statements issued per request', STATEMENT_BUCKETS)
+        self.request_sql_duration = Histogram(
+            'inventory_http_request_sql_duration_seconds', 'Time spent in SQL per request', LATENCY_BUCKETS)
+        self.response_size = Histogram(
+            'inventory_http_response_size_bytes', 'Response body size', SIZE_BUCKETS)
+        self.requests = Counter('inventory_http_requests_total', 'Requests by endpoint and status')
+        self.slow_queries = Counter('inventory_sql_slow_queries_total', 'Statements slower than the threshold')
+
+    def record_request(self, endpoint, method, stats):
+        elapsed = time.perf_counter() - stats.started
+        labels = (('endpoint', endpoint), ('method', method))
+        with self._lock:
+            self.request_duration.observe(labels, elapsed)
+            self.request_statements.observe(labels, stats.statements)
+            self.request_sql_duration.observe(labels, stats.sql_seconds)
+            self.response_size.observe(labels, stats.size)
+            self.requests.inc(labels + (('status', stats.status or 500),))
+        if self.slow_request_seconds and elapsed >= self.slow_request_seconds:
+            logger.warning(
+                'Slow request %s %s: %.1fms, %d statements, %.1fms in SQL, %d bytes; slowest %.1fms: %s',
+                method, endpoint, elapsed * 1000, stats.statements, stats.sql_seconds * 1000, stats.size,
+                stats.slowest_seconds * 1000, stats.slowest)
+        else:
+            logger.debug('%s %s: %.1fms, %d statements, %.1fms in SQL, %d bytes',
+                         method, endpoint, elapsed * 1000, stats.statements, stats.sql_seconds * 1000, stats.size)
+
+    def record_statement(self, statement, seconds):
+        stats = getattr(_local, 'stats', None)
+        if stats is not None:
+            stats.statements += 1
+            stats.sql_seconds += seconds
+            if seconds >= stats.slowest_seconds:
+                stats.slowest_seconds = seconds
+                stats.slowest = ' '.join(statement.split())[:500]
+        if self.slow_query_seconds and seconds >= self.slow_query_seconds:
+            endpoint = getattr(_local, 'endpoint', None) or 'background'
+            with self._lock:
+                self.slow_queries.inc((('endpoint', endpoint),))
+            logger.warning('Slow query (%.1fms) in %s: %s', seconds * 1000, endpoint, ' '.join(statement.split()))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for metric in (self.requests, self.request_duration, self.request_statements,
+                           self.request_sql_duration, self.response_size, self.slow_queries):
+                lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['statement_started'].pop()
+    metrics.record_statement(statement, time.perf_counter() - started)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_statement(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('statement_started'):
+        conn.info['statement_started'].pop()
+
+
+def _endpoint():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+class _CountedBody:
+    # A streamed body, counted as it goes out. The request is recorded when
+    # the server closes the body: after the last chunk, or when the client
+    # goes away. Teardown can run before any of it is sent.
+    def __init__(self, body, stats, endpoint, method):
+        self.body = body
+        self.stats = stats
+        self.endpoint = endpoint
+        self.method = method
+        self.recorded = False
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.stats.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            if not self.recorded:
+                self.recorded = True
+                metrics.record_request(self.endpoint, self.method, self.stats)
+
+
+def init_app(app):
+    metrics.slow_query_seconds = app.config.get('SLOW_QUERY_MS', 0) / 1000.0
+    metrics.slow_request_seconds = app.config.get('SLOW_REQUEST_MS', 0) / 1000.0
+
+    @app.before_request
+    def _start_request():
+        g.request_stats = _local.stats = RequestStats()
+        _local.endpoint = _endpoint()
+
+    @app.after_request
+    def _measure_response(response):
+        stats = g.get('request_stats')
+        if stats is not None:
+            stats.status = response.status_code
+            if response.is_streamed:
+                # Recorded by the body once it is closed, not at teardown
+                response.response = _CountedBody(response.response, stats, _endpoint(), request.method)
+                g.pop('request_stats', None)
+            else:
+                stats.size = response.calculate_content_length() or 0
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        stats = g.pop('request_stats', None)
+        _local.stats = None
+        _local.endpoint = None
+        if stats is not None:
+            metrics.record_request(_endpoint(), request.method, stats)
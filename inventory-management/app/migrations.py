@@ -0,0 +1,221 @@
+import logging
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text,
+    func, inspect, select, text
+)
+
+from models import (
+    Item, StockMovement, Alert, AuditLog, UserPermission, SchemaVersion,
+    MovementDayStat, CategoryMovementDayStat, Job, InventorySnapshot, InventorySnapshotItem, ItemChange,
+    ItemStock, StockTransfer
+)
+from aggregates import rebuild_movement_days
+from changefeed import backfill as backfill_item_changes
+from stock_ledger import backfill as backfill_item_stock
+from search_index import create_search_index
+
+logger = logging.getLogger(__name__)
+
+# Ordered, append-only list of schema migrations. Each one runs in its own
+# transaction and is recorded in schema_version; never edit a released step.
+
+
+def _create_indexes(conn, table, names):
+    for index in table.indexes:
+        if index.name in names:
+            index.create(bind=conn, checkfirst=True)
+
+
+def _version_1_metadata():
+    # The schema as released in version 1, spelled out so that later model
+    # changes don't alter what this step creates; indexes come in steps 2-3
+    metadata = MetaData()
+    Table('supplier', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(100), nullable=False),
+          Column('contact_info', Text))
+    for name in ('category', 'location'):
+        Table(name, metadata,
+              Column('id', Integer, primary_key=True),
+              Column('name', String(50), nullable=False),
+              Column('description', Text))
+    Table('item', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(100), nullable=False),
+          Column('quantity', Integer, nullable=False),
+          Column('sku', String(50), unique=True, nullable=False),
+          Column('category', String(50), nullable=False),
+          Column('location', String(50), nullable=False),
+          Column('description', Text),
+          Column('minimum_stock', Integer),
+          Column('maximum_stock', Integer),
+          Column('reorder_point', Integer),
+          Column('unit_price', Float),
+          Column('supplier_id', Integer, ForeignKey('supplier.id')),
+          Column('barcode', String(100)),
+          Column('expiration_date', DateTime),
+          Column('last_restock_date', DateTime),
+          Column('created_at', DateTime),
+          Column('updated_at', DateTime),
+          Column('created_by', String(50)),
+          Column('updated_by', String(50)))
+    Table('stock_movement', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('item_id', Integer, ForeignKey('item.id'), nullable=False),
+          Column('quantity_changed', Integer, nullable=False),
+          Column('movement_type', String(20), nullable=False),
+          Column('reason', String(100)),
+          Column('timestamp', DateTime),
+          Column('created_by', String(50)))
+    Table('alert', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('item_id', Integer, ForeignKey('item.id'), nullable=False),
+          Column('alert_type', String(50), nullable=False),
+          Column('message', Text, nullable=False),
+          Column('status', String(20)),
+          Column('created_at', DateTime),
+          Column('resolved_at', DateTime),
+          Column('resolved_by', String(50)))
+    Table('audit_log', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('action', String(50), nullable=False),
+          Column('table_name', String(50), nullable=False),
+          Column('record_id', Integer),
+          Column('changes', Text),
+          Column('timestamp', DateTime),
+          Column('user', String(50)))
+    Table('user', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('username', String(80), unique=True, nullable=False),
+          Column('email', String(120), unique=True, nullable=False),
+          Column('password_hash', String(256)),
+          Column('role', String(20)),
+          Column('is_active', Boolean),
+          Column('last_login', DateTime),
+          Column('created_at', DateTime),
+          Column('created_by', String(50)))
+    Table('user_permission', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+          Column('resource', String(50), nullable=False),
+          Column('can_view', Boolean),
+          Column('can_create', Boolean),
+          Column('can_edit', Boolean),
+          Column('can_delete', Boolean))
+    Table('category_stat', metadata,
+          Column('category', String(50), primary_key=True),
+          Column('item_count', Integer, nullable=False),
+          Column('total_quantity', Integer, nullable=False),
+          Column('total_value', Float, nullable=False),
+          Column('low_stock_count', Integer, nullable=False))
+    Table('movement_hour_stat', metadata,
+          Column('hour', DateTime, primary_key=True),
+          Column('movement_count', Integer, nullable=False))
+    Table('stat_counter', metadata,
+          Column('name', String(50), primary_key=True),
+          Column('value', Float, nullable=False))
+    return metadata
+
+
+def create_tables(conn):
+    _version_1_metadata().create_all(bind=conn, checkfirst=True)
+
+
+def unique_active_alerts(conn):
+    # Keep the newest active alert per (item, type) before enforcing uniqueness
+    alerts = Alert.__table__
+    keep = select(func.max(alerts.c.id)).where(alerts.c.status == 'active') \
+        .group_by(alerts.c.item_id, alerts.c.alert_type)
+    conn.execute(alerts.update().where(
+        alerts.c.status == 'active', alerts.c.id.notin_(keep)
+    ).values(status='resolved', resolved_by='system'))
+    _create_indexes(conn, alerts, {'ux_alert_active'})
+
+
+def secondary_indexes(conn):
+    _create_indexes(conn, Item.__table__, {
+        'ix_item_category', 'ix_item_location', 'ix_item_supplier_id', 'ix_item_name',
+        'ix_item_created_at', 'ix_item_expiration_date', 'ix_item_low_stock',
+    })
+    _create_indexes(conn, StockMovement.__table__, {
+        'ix_stock_movement_item_timestamp', 'ix_stock_movement_timestamp',
+    })
+    _create_indexes(conn, Alert.__table__, {
+        'ix_alert_status_created_at', 'ix_alert_created_at', 'ix_alert_item_type_status',
+    })
+    _create_indexes(conn, AuditLog.__table__, {
+        'ix_audit_log_timestamp', 'ix_audit_log_table_record',
+    })
+    _create_indexes(conn, UserPermission.__table__, {'ix_user_permission_user_resource'})
+    if conn.dialect.name in ('sqlite', 'postgresql'):
+        conn.execute(text('ANALYZE'))
+
+
+def movement_day_rollups(conn):
+    MovementDayStat.__table__.create(bind=conn, checkfirst=True)
+    CategoryMovementDayStat.__table__.create(bind=conn, checkfirst=True)
+    rebuild_movement_days(conn)
+
+
+def job_table(conn):
+    Job.__table__.create(bind=conn, checkfirst=True)
+
+
+
+def inventory_snapshots(conn):
+    InventorySnapshot.__table__.create(bind=conn, checkfirst=True)
+    InventorySnapshotItem.__table__.create(bind=conn, checkfirst=True)
+
+
+def item_change_feed(conn):
+    ItemChange.__table__.create(bind=conn, checkfirst=True)
+    backfill_item_changes(conn)
+
+
+def stock_ledger(conn):
+    ItemStock.__table__.create(bind=conn, checkfirst=True)
+    StockTransfer.__table__.create(bind=conn, checkfirst=True)
+    # Databases created outside the migrations (db.create_all) already have it
+    movement_columns = {column['name'] for column in inspect(conn).get_columns(StockMovement.__table__.name)}
+    if 'location' not in movement_columns:
+        conn.execute(text('ALTER TABLE stock_movement ADD COLUMN location VARCHAR(50)'))
+    backfill_item_stock(conn)
+
+
+def search_index(conn):
+    create_search_index(conn)
+
+
+MIGRATIONS = [
+    (1, 'Create tables', create_tables),
+    (2, 'One active alert per item and type', unique_active_alerts),
+    (3, 'Secondary indexes for filters, sorts and time ranges', secondary_indexes),
+    (4, 'Daily movement rollups per item and category', movement_day_rollups),
+    (5, 'Background job table', job_table),
+    (6, 'Inventory snapshots', inventory_snapshots),
+    (7, 'Item change feed', item_change_feed),
+    (8, 'Per-location stock ledger and transfers', stock_ledger),
+    (9, 'Full-text search index', search_index),
+]
+
+
+def applied_versions(engine):
+    SchemaVersion.__table__.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        return set(conn.execute(select(SchemaVersion.__table__.c.version)).scalars())
+
+
+def migrate(engine, target=None):
+    applied = applied_versions(engine)
+    for version, description, upgrade in MIGRATIONS:
+        if version in applied:
+            continue
+        if target is not None and version > target:
+            break
+        logger.info(f"Applying migration {version}: {description}")
+        with engine.begin() as conn:
+            upgrade(conn)
+            conn.execute(SchemaVersion.__table__.insert().values(version=version, description=description))
+        applied.add(version)
+    return max(applied, default=0)
@@ -5,6 +5,19 @@ from datetime import datetime
 db = SQLAlchemy()
 
 class Item(db.Model):
+    __table_args__ = (
+        db.Index('ix_item_category', 'category', 'id'),
+        db.Index('ix_item_location', 'location', 'id'),
+        db.Index('ix_item_supplier_id', 'supplier_id'),
+        db.Index('ix_item_name', 'name', 'id'),
+        db.Index('ix_item_created_at', 'created_at', 'id'),
+        db.Index('ix_item_expiration_date', 'expiration_date', 'id'),
+        # Partial index holding just the low-stock rows
+        db.Index('ix_item_low_stock', 'id',
+                 sqlite_where=db.text('quantity <= minimum_stock'),
+                 postgresql_where=db.text('quantity <= minimum_stock')),
+    )
+
     # Existing fields
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -57,7 +70,9 @@ class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     description = db.Column(db.Text)
-    items = db.relationship('Item', backref='category_rel', lazy=True)
+    # Item.category/location hold the name, there is no foreign key to join on
+    items = db.relationship('Item', primaryjoin='foreign(Item.category) == Category.name',
+                            backref='category_rel', lazy=True, viewonly=True)
 
     def to_dict(self):
         return {
@@ -70,7 +85,8 @@ class Location(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     description = db.Column(db.Text)
-    items = db.relationship('Item', backref='location_rel', lazy=True)
+    items = db.relationship('Item', primaryjoin='foreign(Item.location) == Location.name',
+                            backref='location_rel', lazy=True, viewonly=True)
 
     def to_dict(self):
         return {
@@ -94,10 +110,16 @@ class Supplier(db.Model):
 # models.py - Add these new models
 
 class StockMovement(db.Model):
+    __table_args__ = (
+        db.Index('ix_stock_movement_item_timestamp', 'item_id', 'timestamp'),
+        db.Index('ix_stock_movement_timestamp', 'timestamp', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False)
     quantity_changed = db.Column(db.Integer, nullable=False)
     movement_type = db.Column(db.String(20), nullable=False)  # 'in' or 'out'
+    location = db.Column(db.String(50))  # None on movements recorded before the stock ledger
     reason = db.Column(db.String(100))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.String(50))
@@ -108,12 +130,23 @@ class StockMovement(db.Model):
             'item_id': self.item_id,
             'quantity_changed': self.quantity_changed,
             'movement_type': self.movement_type,
+            'location': self.location,
             'reason': self.reason,
             'timestamp': self.timestamp.isoformat(),
             'created_by': self.created_by
         }
 
 class Alert(db.Model):
+    # At most one active alert per item and type
+    __table_args__ = (
+        db.Index('ux_alert_active', 'item_id', 'alert_type', unique=True,
+                 sqlite_where=db.text("status = 'active'"),
+                 postgresql_where=db.text("status = 'active'")),
+        db.Index('ix_alert_status_created_at', 'status', 'created_at'),
+        db.Index('ix_alert_created_at', 'created_at', 'id'),
+        db.Index('ix_alert_item_type_status', 'item_id', 'alert_type', 'status'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False)
     alert_type = db.Column(db.String(50), nullable=False)  # 'low_stock', 'expiring', 'overstock'
@@ -136,6 +169,11 @@ class Alert(db.Model):
         }
 
 class AuditLog(db.Model):
+    __table_args__ = (
+        db.Index('ix_audit_log_timestamp', 'timestamp', 'id'),
+        db.Index('ix_audit_log_table_record', 'table_name', 'record_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     action = db.Column(db.String(50), nullable=False)
     table_name = db.Column(db.String(50), nullable=False)
@@ -189,10 +227,148 @@ class User(db.Model):
         }
 
 class UserPermission(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_permission_user_resource', 'user_id', 'resource'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     resource = db.Column(db.String(50), nullable=False)  # 'items', 'categories', 'locations', 'suppliers'
     can_view = db.Column(db.Boolean, default=True)
     can_create = db.Column(db.Boolean, default=False)
     can_edit = db.Column(db.Boolean, default=False)
-    can_delete = db.Column(db.Boolean, default=False)
\ No newline at end of file
+    can_delete = db.Column(db.Boolean, default=False)
+
+# models.py - Maintained aggregates, kept current by aggregates.py
+
+class CategoryStat(db.Model):
+    category = db.Column(db.String(50), primary_key=True)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)
+    total_value = db.Column(db.Float, nullable=False, default=0)
+    low_stock_count = db.Column(db.Integer, nullable=False, default=0)
+
+class MovementHourStat(db.Model):
+    hour = db.Column(db.DateTime, primary_key=True)
+    movement_count = db.Column(db.Integer, nullable=False, default=0)
+
+# Daily movement rollups behind /api/reports; category is the item's category
+# when the movement was recorded
+class MovementDayStat(db.Model):
+    __table_args__ = (
+        db.Index('ix_movement_day_stat_item_day', 'item_id', 'day'),
+    )
+
+    day = db.Column(db.Date, primary_key=True)
+    item_id = db.Column(db.Integer, primary_key=True)
+    in_quantity = db.Column(db.Integer, nullable=False, default=0)
+    in_count = db.Column(db.Integer, nullable=False, default=0)
+    out_quantity = db.Column(db.Integer, nullable=False, default=0)
+    out_count = db.Column(db.Integer, nullable=False, default=0)
+
+class CategoryMovementDayStat(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    in_quantity = db.Column(db.Integer, nullable=False, default=0)
+    in_count = db.Column(db.Integer, nullable=False, default=0)
+    out_quantity = db.Column(db.Integer, nullable=False, default=0)
+    out_count = db.Column(db.Integer, nullable=False, default=0)
+
+# Periodic inventory snapshots behind /api/inventory/as-of, taken by snapshots.py.
+# Only items with non-zero stock get a row; unit_price is the price at snapshot time.
+class InventorySnapshot(db.Model):
+    __table_args__ = (
+        db.Index('ix_inventory_snapshot_taken_at', 'taken_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, nullable=False)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)
+    total_value = db.Column(db.Float, nullable=False, default=0)
+
+class InventorySnapshotItem(db.Model):
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('inventory_snapshot.id'), primary_key=True)
+    item_id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    unit_price = db.Column(db.Float)
+
+# Change feed behind /api/items/changes, maintained by changefeed.py: one row
+# per item holding its latest change; deleted rows are tombstones
+class ItemChange(db.Model):
+    __table_args__ = (
+        db.Index('ux_item_change_seq', 'seq', unique=True),
+    )
+
+    item_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    seq = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+# Per-location stock behind stock_ledger.py. Item.quantity is the sum of an
+# item's rows; there is always a row for the item's own location, and rows
+# elsewhere are dropped when they reach zero.
+class ItemStock(db.Model):
+    __table_args__ = (
+        db.Index('ix_item_stock_location', 'location', 'item_id'),
+    )
+
+    item_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    location = db.Column(db.String(50), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+class StockTransfer(db.Model):
+    __table_args__ = (
+        db.Index('ix_stock_transfer_item_timestamp', 'item_id', 'timestamp'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False)
+    from_location = db.Column(db.String(50), nullable=False)
+    to_location = db.Column(db.String(50), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(100))
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    created_by = db.Column(db.String(50))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'item_id': self.item_id,
+            'from_location': self.from_location,
+            'to_location': self.to_location,
+            'quantity': self.quantity,
+            'reason': self.reason,
+            'timestamp': self.timestamp.isoformat(),
+            'created_by': self.created_by
+        }
+
+class StatCounter(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Float, nullable=False, default=0)
+
+class SchemaVersion(db.Model):
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Background jobs run by jobs.JobRunner
+class Job(db.Model):
+    __table_args__ = (
+        db.Index('ix_job_status_created_at', 'status', 'created_at'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'done', 'failed'
+    params = db.Column(db.Text)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    result = db.Column(db.Text)
+    result_path = db.Column(db.String(500))
+    result_mimetype = db.Column(db.String(100))
+    error = db.Column(db.Text)
+    created_by = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
@@ -0,0 +1,210 @@
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from datetime import datetime
+
+from sqlalchemy import bindparam, select
+
+from models import Item, StockMovement
+from aggregates import apply_item_changes, apply_movements, apply_movement_days
+from changefeed import record_item_changes
+from alert_engine import SYSTEM_USER, evaluate_alerts
+from audit import write_changes
+from pubsub import publish_alert_summary, publish_movements
+from lookup import sync_after_write
+from stock_ledger import InsufficientStock, ItemNotFound, UnknownLocation, apply_stock_deltas, known_locations
+
+logger = logging.getLogger(__name__)
+
+MOVEMENT_TYPES = ('in', 'out')
+# Largest quantity a single movement may carry; quantities are 32-bit columns
+MAX_MOVEMENT_QUANTITY = 2 ** 31 - 1
+
+
+def parse_movement_quantity(raw):
+    if isinstance(raw, bool) or not isinstance(raw, (int, str)):
+        raise ValueError('quantity_changed must be an integer')
+    try:
+        quantity = int(raw)
+    except ValueError:
+        raise ValueError('quantity_changed must be an integer')
+    if not 0 < quantity <= MAX_MOVEMENT_QUANTITY:
+        raise ValueError(f'quantity_changed must be between 1 and {MAX_MOVEMENT_QUANTITY}')
+    return quantity
+
+
+# Callers enqueue a movement and block on a Future. A single writer thread
+# drains the queue for up to `window` seconds or `batch_size` movements and
+# applies the whole batch in one transaction. If that transaction fails, the
+# batch is retried one movement at a time so only the bad movement fails.
+# Publishing to subscribers happens after the callers are answered and
+# never causes a committed batch to be retried.
+class MovementWriter:
+    def __init__(self, engine, window=0.005, batch_size=256):
+        self.engine = engine
+        self.window = window
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item_id, quantity_changed, movement_type, reason=None, created_by=None, location=None):
+        # location defaults to the item's own location
+        self._ensure_started()
+        future = Future()
+        self._queue.put((future, {
+            'item_id': item_id,
+            'quantity_changed': quantity_changed,
+            'movement_type': movement_type,
+            'location': location,
+            'reason': reason,
+            'created_by': created_by,
+        }))
+        return future
+
+    def record(self, *args, timeout=30, **kwargs):
+        return self.submit(*args, **kwargs).result(timeout=timeout)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='movement-writer', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # Only a batch whose transaction failed is retried; once it has
+            # committed, nothing below may cause it to be applied again
+            try:
+                results, alert_summary = self._apply(batch)
+                alert_summaries = [alert_summary]
+            except Exception as e:
+                logger.error(f"Movement batch failed: {str(e)}")
+                retried = [self._apply_alone(entry) for entry in batch] if len(batch) > 1 else [(e, None)]
+                results = [result for result, _ in retried]
+                alert_summaries = [alert_summary for _, alert_summary in retried]
+            results = [
+                result if isinstance(result, Exception) else StockMovement(**result)
+                for result in results
+            ]
+            for (future, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            try:
+                self._publish(results, alert_summaries)
+            except Exception as e:
+                logger.error(f"Publishing committed movements failed: {str(e)}")
+
+    def _apply_alone(self, entry):
+        try:
+            results, alert_summary = self._apply([entry])
+            return results[0], alert_summary
+        except Exception as e:
+            return e, None
+
+    def _publish(self, results, alert_summaries):
+        recorded = [result for result in results if not isinstance(result, Exception)]
+        if recorded:
+            sync_after_write(self.engine)
+        publish_movements([result.to_dict() for result in recorded])
+        for alert_summary in alert_summaries:
+            if alert_summary:
+                publish_alert_summary(alert_summary)
+
+    def _apply(self, batch):
+        items = Item.__table__
+        movements = StockMovement.__table__
+        results = []
+        deltas = defaultdict(int)
+        alert_summary = None
+
+        with self.engine.begin() as conn:
+            homes = dict(conn.execute(select(items.c.id, items.c.location).where(
+                items.c.id.in_({movement['item_id'] for _, movement in batch})
+            )).all())
+            known = known_locations(conn, {movement['location'] for _, movement in batch} - set(homes.values()))
+            stock_deltas = defaultdict(int)
+            for _, movement in batch:
+                item_id = movement['item_id']
+                if item_id not in homes:
+                    results.append(ItemNotFound(f"Item {item_id} not found"))
+                    continue
+                location = movement['location'] or homes[item_id]
+                if location != homes[item_id] and location not in known:
+                    results.append(UnknownLocation(f"Unknown location {location!r}"))
+                    continue
+                delta = movement['quantity_changed']
+                if movement['movement_type'] != 'in':
+                    delta = -delta
+                results.append(dict(movement, location=location))
+                deltas[item_id] += delta
+                stock_deltas[(item_id, location)] += delta
+
+            if deltas:
+                # A batch that would overdraw a location or an item raises
+                # InsufficientStock, and the retry one movement at a time
+                # fails only the movements that take more than is there
+                apply_stock_deltas(conn, stock_deltas, homes, checked=True)
+                # Apply the change in SQL so concurrent writers can't lose
+                # updates; each item's total is updated once per batch
+                conn.execute(
+                    items.update().where(items.c.id == bindparam('target'))
+                    .values(quantity=items.c.quantity + bindparam('delta')),
+                    [{'target': item_id, 'delta': delta} for item_id, delta in deltas.items()]
+                )
+                overdrawn = conn.execute(
+                    select(items.c.id).where(items.c.id.in_(deltas), items.c.quantity < 0).limit(1)
+                ).scalar()
+                if overdrawn is not None:
+                    raise InsufficientStock(f"Not enough stock of item {overdrawn}")
+                # Stamped once the item rows are locked, which orders the batch
+                # against inventory snapshots (see snapshots.take_snapshot)
+                now = datetime.utcnow()
+                for row in results:
+                    if not isinstance(row, Exception):
+                        row['timestamp'] = now
+                        row['id'] = conn.execute(movements.insert().values(**row)).inserted_primary_key[0]
+
+                item_changes = []
+                categories = {}
+                for item in conn.execute(select(items).where(items.c.id.in_(deltas))):
+                    new = dict(item._mapping)
+                    item_changes.append((dict(new, quantity=new['quantity'] - deltas[item.id]), new))
+                    categories[item.id] = new['category']
+
+                recorded = [result for result in results if not isinstance(result, Exception)]
+                # Audited in this transaction, under the movement's author when
+                # every movement of the item in the batch has the same one
+                authors = defaultdict(set)
+                for row in recorded:
+                    authors[row['item_id']].add(row['created_by'] or SYSTEM_USER)
+                by_author = defaultdict(list)
+                for old, new in item_changes:
+                    users = authors[new['id']]
+                    by_author[users.pop() if len(users) == 1 else SYSTEM_USER].append((old, new))
+                for user, changes in by_author.items():
+                    write_changes(conn, 'item', changes, user=user)
+                apply_item_changes(conn, item_changes)
+                record_item_changes(conn, list(deltas))
+                apply_movements(conn, [now] * len(recorded))
+                apply_movement_days(conn, [dict(row, category=categories[row['item_id']]) for row in recorded])
+                alert_summary = evaluate_alerts(conn, now, item_ids=list(deltas))
+
+        return results, alert_summary
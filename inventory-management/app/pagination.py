@@ -0,0 +1,101 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_, func, select
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+COUNT_ESTIMATE_CAP = 10000
+
+
+class CursorError(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(sort_by, order, value, row_id):
+    payload = json.dumps([sort_by, order, _encode_value(value), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, sort_by, order):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        cursor_sort, cursor_order, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise CursorError('Invalid cursor')
+    # A cursor is only meaningful for the ordering it was issued under
+    if cursor_sort != sort_by or cursor_order != order:
+        raise CursorError('Cursor does not match sort_by/order')
+    return _decode_value(value), row_id
+
+
+def parse_limit(raw):
+    if raw is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(raw), MAX_PAGE_SIZE))
+
+
+def _after(sort_column, id_column, order, value, row_id):
+    # Rows strictly after (value, row_id) in (sort_column, id) order
+    if order == 'desc':
+        return or_(sort_column < value, and_(sort_column == value, id_column < row_id))
+    return or_(sort_column > value, and_(sort_column == value, id_column > row_id))
+
+
+def _ordered(stmt, columns, order):
+    return stmt.order_by(*[column.desc() if order == 'desc' else column.asc() for column in columns])
+
+
+def keyset_page(session, stmt, sort_column, id_column, sort_by, order, cursor, limit):
+    value, row_id = decode_cursor(cursor, sort_by, order) if cursor else (None, None)
+    in_null_tail = cursor is not None and value is None
+
+    # NULL sort values come last. They are read in a second pass ordered by id
+    # so that neither pass needs an "IS NULL" sort key and both can walk an index.
+    rows = []
+    if not in_null_tail:
+        page = stmt
+        if sort_column.nullable:
+            page = page.where(sort_column.isnot(None))
+        if cursor:
+            page = page.where(_after(sort_column, id_column, order, value, row_id))
+        rows = session.execute(_ordered(page, [sort_column, id_column], order).limit(limit + 1)).all()
+
+    if len(rows) <= limit and sort_column.nullable:
+        tail = stmt.where(sort_column.is_(None))
+        if in_null_tail:
+            tail = tail.where(id_column < row_id if order == 'desc' else id_column > row_id)
+        tail = _ordered(tail, [id_column], order).limit(limit + 1 - len(rows))
+        rows += session.execute(tail).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(sort_by, order, last[sort_column.key], last[id_column.key])
+    return rows, next_cursor
+
+
+def count_rows(session, stmt, mode):
+    # 'exact' counts every match, 'estimate' stops counting at COUNT_ESTIMATE_CAP
+    if mode == 'exact':
+        counted = stmt.order_by(None).subquery()
+        return session.execute(select(func.count()).select_from(counted)).scalar(), True
+    if mode == 'estimate':
+        capped = stmt.order_by(None).limit(COUNT_ESTIMATE_CAP + 1).subquery()
+        total = session.execute(select(func.count()).select_from(capped)).scalar()
+        return min(total, COUNT_ESTIMATE_CAP), total <= COUNT_ESTIMATE_CAP
+    return None, None
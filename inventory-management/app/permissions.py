@@ -0,0 +1,93 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import User, UserPermission
+
+RESOURCES = ('items', 'categories', 'locations', 'suppliers')
+ACTIONS = ('view', 'create', 'edit', 'delete')
+METHOD_ACTIONS = {'GET': 'view', 'POST': 'create', 'PUT': 'edit', 'PATCH': 'edit', 'DELETE': 'delete'}
+
+
+def default_permissions(role):
+    return {
+        'view': True,
+        'create': role in ['admin', 'manager'],
+        'edit': role in ['admin', 'manager'],
+        'delete': role == 'admin',
+    }
+
+
+def load_permissions(session, user_id):
+    user = session.get(User, user_id)
+    if user is None:
+        return None
+    resources = {resource: default_permissions(user.role) for resource in RESOURCES}
+    for row in session.query(UserPermission).filter_by(user_id=user_id):
+        resources[row.resource] = {
+            'view': bool(row.can_view),
+            'create': bool(row.can_create),
+            'edit': bool(row.can_edit),
+            'delete': bool(row.can_delete),
+        }
+    return {'role': user.role, 'is_active': bool(user.is_active), 'resources': resources}
+
+
+def is_allowed(permissions, resource, action):
+    if permissions is None or not permissions['is_active']:
+        return False
+    if permissions['role'] == 'admin':
+        return True
+    return permissions['resources'].get(resource, {}).get(action, False)
+
+
+class PermissionCache:
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, loader):
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        permissions = loader()
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, permissions)
+        return permissions
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+permission_cache = PermissionCache()
+
+
+# Drop cached permissions once a change to a user or their permissions commits
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault('permission_users', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+        elif isinstance(obj, UserPermission):
+            changed.add(obj.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('permission_users', ()):
+        permission_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_users(session):
+    session.info.pop('permission_users', None)
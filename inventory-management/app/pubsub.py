@@ -0,0 +1,245 @@
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Item, StockMovement, Alert
+import aggregates
+
+logger = logging.getLogger(__name__)
+
+# In-process pub/sub behind the /api/stream server-sent events channel.
+# Writers publish after their transaction commits (ORM commits through the
+# session hooks below, Core writers by calling publish_* themselves); the hub
+# serializes each event once and fans it out to every subscription on its
+# topic. Each subscription has a bounded queue: a client that falls that far
+# behind is sent a "resync" event and disconnected instead of buffering
+# without limit. Dashboard counters are recomputed at most once per interval
+# after a change, for all connected dashboards together, and only while one
+# is connected.
+
+TOPICS = ('movements', 'alerts', 'dashboard')
+
+
+class HubFull(Exception):
+    pass
+
+
+def parse_topics(raw):
+    if not raw:
+        return list(TOPICS)
+    topics = [topic.strip() for topic in raw.split(',') if topic.strip()]
+    unknown = [topic for topic in topics if topic not in TOPICS]
+    if unknown:
+        raise ValueError(f"Unknown topic(s): {', '.join(unknown)}")
+    return topics
+
+
+def _format(event_id, kind, payload):
+    return f'id: {event_id}\nevent: {kind}\ndata: {payload}\n\n'
+
+
+class Subscription:
+    def __init__(self, topics, max_queue):
+        self.topics = frozenset(topics)
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=max_queue)
+
+    def offer(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Hub:
+    def __init__(self, max_clients=500, max_queue=256, heartbeat=15.0):
+        self.max_clients = max_clients
+        self.max_queue = max_queue
+        self.heartbeat = heartbeat
+        self._subscriptions = set()
+        self._retained = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def configure(self, max_clients=None, max_queue=None, heartbeat=None):
+        if max_clients is not None:
+            self.max_clients = max_clients
+        if max_queue is not None:
+            self.max_queue = max_queue
+        if heartbeat is not None:
+            self.heartbeat = heartbeat
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def subscribe(self, topics):
+        with self._lock:
+            if len(self._subscriptions) >= self.max_clients:
+                raise HubFull('Too many open streams')
+            subscription = Subscription(topics, self.max_queue)
+            self._subscriptions.add(subscription)
+            # The latest state event of a topic is replayed to new subscribers
+            for topic in subscription.topics:
+                if topic in self._retained:
+                    subscription.offer(self._retained[topic])
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def subscribers(self, topic):
+        with self._lock:
+            return sum(1 for subscription in self._subscriptions if topic in subscription.topics)
+
+    def retained(self, topic):
+        return topic in self._retained
+
+    def forget(self, topic):
+        with self._lock:
+            self._retained.pop(topic, None)
+
+    def publish(self, topic, kind, data, retain=False):
+        message = _format(next(self._ids), kind, json.dumps(data, default=str, separators=(',', ':')))
+        with self._lock:
+            if retain:
+                self._retained[topic] = message
+            targets = [subscription for subscription in self._subscriptions if topic in subscription.topics]
+        for subscription in targets:
+            subscription.offer(message)
+
+    def stream(self, subscription):
+        # SSE body; a heartbeat comment keeps proxies from timing the stream
+        # out and lets a closed connection surface within one interval
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                if subscription.overflowed:
+                    yield _format(next(self._ids), 'resync', '{"reason":"client too slow"}')
+                    return
+                message = subscription.get(self.heartbeat)
+                yield message if message is not None else ': heartbeat\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+
+class DashboardPublisher:
+    def __init__(self, hub, interval=1.0):
+        self.hub = hub
+        self.engine = None
+        self.interval = interval
+        self._dirty = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def configure(self, engine, interval=None):
+        self.engine = engine
+        if interval is not None:
+            self.interval = interval
+
+    def mark_dirty(self):
+        if self.engine is None:
+            return
+        self._dirty.set()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='dashboard-publisher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._dirty.wait()
+            # Changes arriving during the interval are folded into one recompute
+            time.sleep(self.interval)
+            self._dirty.clear()
+            if not self.hub.subscribers('dashboard'):
+                # Nobody is watching; the next subscriber triggers a fresh summary
+                self.hub.forget('dashboard')
+                continue
+            try:
+                with Session(self.engine) as session:
+                    summary = aggregates.dashboard_summary(session)
+                self.hub.publish('dashboard', 'dashboard.summary', summary, retain=True)
+            except Exception as e:
+                logger.error(f"Dashboard publish failed: {str(e)}")
+
+
+hub = Hub()
+dashboard_publisher = DashboardPublisher(hub)
+
+
+def open_stream(topics):
+    subscription = hub.subscribe(topics)
+    if 'dashboard' in subscription.topics and not hub.retained('dashboard'):
+        dashboard_publisher.mark_dirty()
+    return subscription
+
+
+def publish_movements(movements):
+    for movement in movements:
+        hub.publish('movements', 'movement.recorded', movement)
+    if movements:
+        dashboard_publisher.mark_dirty()
+
+
+def publish_transfer(transfer):
+    hub.publish('movements', 'stock.transferred', transfer)
+
+
+def publish_alert_summary(summary):
+    # summary: built by alert_engine.alert_summary, every alert type in both maps
+    if any(summary['raised'].values()) or any(summary['resolved'].values()):
+        hub.publish('alerts', 'alerts.evaluated', summary)
+        dashboard_publisher.mark_dirty()
+
+
+def stage(session, events=(), dashboard=True):
+    session.info.setdefault('stream_events', []).extend(events)
+    if dashboard:
+        session.info['stream_dashboard'] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_stream_events(session, flush_context):
+    events = []
+    dashboard = False
+    for obj in session.new:
+        if isinstance(obj, StockMovement):
+            events.append(('movements', 'movement.recorded', obj.to_dict()))
+        elif isinstance(obj, Alert):
+            events.append(('alerts', 'alert.created', obj.to_dict()))
+        dashboard = dashboard or isinstance(obj, (Item, StockMovement, Alert))
+    for obj in session.dirty:
+        if isinstance(obj, Alert) and session.is_modified(obj):
+            events.append(('alerts', 'alert.updated', obj.to_dict()))
+        dashboard = dashboard or (isinstance(obj, (Item, Alert)) and session.is_modified(obj))
+    for obj in session.deleted:
+        dashboard = dashboard or isinstance(obj, (Item, StockMovement, Alert))
+    if events or dashboard:
+        stage(session, events, dashboard)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    for topic, kind, data in session.info.pop('stream_events', ()):
+        hub.publish(topic, kind, data)
+    if session.info.pop('stream_dashboard', False):
+        dashboard_publisher.mark_dirty()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_uncommitted(session):
+    session.info.pop('stream_events', None)
+    session.info.pop('stream_dashboard', None)
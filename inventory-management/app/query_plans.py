@@ -0,0 +1,218 @@
+import os
+import re
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+# Query-plan regression check. Seeds a scratch database, drives the API
+# endpoints through the Flask test client, captures every statement they
+# issue and runs EXPLAIN on it. Any full table scan outside the small
+# reference tables is a failure.
+#
+#   python -m pytest                     # from inventory-management/
+#   python app/query_plans.py            # SQLite scratch database
+#   QUERY_PLAN_DATABASE_URL=postgresql://... python app/query_plans.py
+#
+# test_query_plans.py runs it as one test per endpoint; run directly it
+# exits non-zero when a regression is found.
+
+SEED_ITEMS = 2000
+SEED_MOVEMENTS = 5000
+
+# Tables that are small by nature and fine to read in full
+ALLOWED_SCANS = {
+    'category', 'location', 'supplier', 'category_stat', 'stat_counter',
+    'schema_version', 'user_permission', 'sqlite_master',
+}
+
+ENDPOINTS = [
+    ('GET', '/api/search?category=cat-3&limit=20'),
+    ('GET', '/api/search?location=loc-2&limit=20'),
+    ('GET', '/api/search?supplier=4&limit=20'),
+    ('GET', '/api/search?sort_by=name&limit=20'),
+    ('GET', '/api/search?sort_by=created_at&order=desc&limit=20'),
+    ('GET', '/api/search?q=widget&limit=20'),
+    ('GET', '/api/search/suggest?q=wid'),
+    ('GET', '/api/items/expiring?within=7'),
+    ('GET', '/api/items/changes?since=1000&limit=50'),
+    ('GET', '/api/statistics'),
+    ('GET', '/api/dashboard/summary'),
+    ('GET', '/api/reports/inventory?range=quarter'),
+    ('GET', '/api/reports/movements?range=quarter'),
+    ('GET', '/api/reports/movements?range=month&item_id=7'),
+    ('GET', '/api/reports/alerts?range=quarter'),
+    ('GET', '/api/reports/alerts?range=quarter&location=loc-2'),
+    ('GET', '/api/reports/locations?location=loc-2'),
+    ('GET', '/api/items/7/stock'),
+    ('GET', '/api/alerts?status=active'),
+    ('GET', '/api/audit-logs?days=7'),
+    ('GET', '/api/export?resource=stock_movements&format=ndjson&since={recent}'),
+    ('GET', '/api/export?resource=alerts&format=csv&since={recent}'),
+    ('POST', '/api/stock/movement', {'item_id': 7, 'quantity_changed': 3, 'movement_type': 'out'}),
+    ('POST', '/api/stock/movement', {'item_id': 7, 'quantity_changed': 2, 'movement_type': 'in', 'location': 'loc-1'}),
+    ('POST', '/api/stock/transfer', {'item_id': 7, 'from_location': 'loc-6', 'to_location': 'loc-1', 'quantity': 1}),
+]
+
+SCAN_PATTERN = re.compile(r'^SCAN (\w+)')
+
+
+def seed(conn, items=SEED_ITEMS, movements=SEED_MOVEMENTS):
+    from models import Item, StockMovement, Alert, AuditLog, Supplier, Location
+
+    now = datetime.utcnow()
+    conn.execute(Supplier.__table__.insert(), [{'name': f'supplier-{i}'} for i in range(20)])
+    conn.execute(Location.__table__.insert(), [{'name': f'loc-{i}'} for i in range(10)])
+    conn.execute(Item.__table__.insert(), [{
+        'name': f'Widget {i}', 'sku': f'SKU-{i:06d}', 'quantity': i % 50,
+        'category': f'cat-{i % 25}', 'location': f'loc-{i % 10}', 'description': f'widget number {i}',
+        'minimum_stock': 5, 'maximum_stock': 45, 'unit_price': 1.0 + i % 13, 'supplier_id': 1 + i % 20,
+        'barcode': f'BC{i:08d}', 'created_at': now - timedelta(days=i % 365),
+        'expiration_date': now + timedelta(days=i % 400) if i % 4 == 0 else None,
+    } for i in range(items)])
+    conn.execute(StockMovement.__table__.insert(), [{
+        'item_id': 1 + i % items, 'quantity_changed': 1 + i % 5, 'movement_type': 'in' if i % 2 else 'out',
+        'timestamp': now - timedelta(hours=i), 'created_by': 'seed',
+    } for i in range(movements)])
+    conn.execute(Alert.__table__.insert(), [{
+        'item_id': 1 + i, 'alert_type': 'low_stock', 'message': 'seeded',
+        'status': 'active' if i % 3 else 'resolved', 'created_at': now - timedelta(days=i),
+    } for i in range(300)])
+    conn.execute(AuditLog.__table__.insert(), [{
+        'action': 'update', 'table_name': 'item', 'record_id': 1 + i % items,
+        'timestamp': now - timedelta(hours=i), 'user': 'seed',
+    } for i in range(2000)])
+
+
+@contextmanager
+def capture_statements(engine):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(' ', 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE', 'INSERT'):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def sqlite_full_scans(conn, statement, parameters):
+    plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        match = SCAN_PATTERN.match(detail)
+        if match and 'USING' not in detail and 'VIRTUAL TABLE' not in detail \
+                and match.group(1) not in ALLOWED_SCANS:
+            scans.append(detail)
+    return scans
+
+
+def postgres_full_scans(conn, statement, parameters):
+    conn.exec_driver_sql('SET enable_seqscan = off')
+    plan = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    scans = []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') not in ALLOWED_SCANS:
+            scans.append(f"Seq Scan on {node.get('Relation Name')}")
+        nodes += node.get('Plans', [])
+    return scans
+
+
+@contextmanager
+def scratch_database():
+    # QUERY_PLAN_DATABASE_URL if set, else a temporary SQLite file
+    database_url = os.getenv('QUERY_PLAN_DATABASE_URL')
+    if database_url:
+        yield database_url
+        return
+    scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    scratch.close()
+    try:
+        yield f'sqlite:///{scratch.name}'
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(scratch.name + suffix):
+                os.unlink(scratch.name + suffix)
+
+
+@contextmanager
+def plan_checker(database_url):
+    # Seeds the database and yields a function that runs one endpoint and
+    # returns its failures as (problem, statement) pairs. Endpoints must be
+    # run in ENDPOINTS order; later ones rely on data written by earlier ones.
+    # The engine is configured from DATABASE_URL when the app module loads
+    os.environ['DATABASE_URL'] = database_url
+    import app as api
+    from aggregates import reconcile, rebuild_movement_days
+    from flask_jwt_extended import create_access_token
+    from migrations import migrate
+    from models import db, User
+    from stock_ledger import backfill as backfill_item_stock
+
+    with api.app.app_context():
+        engine = db.engine
+        migrate(engine)
+        with engine.begin() as conn:
+            seed(conn)
+            reconcile(conn)
+            rebuild_movement_days(conn)
+            backfill_item_stock(conn)
+        admin = User(username='plan-check', email='plan-check@example.com', role='admin')
+        admin.set_password('plan-check')
+        db.session.add(admin)
+        db.session.commit()
+        migrate(engine)
+        with engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE')
+
+        client = api.app.test_client()
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity=admin.id)}
+        recent = (datetime.utcnow() - timedelta(days=2)).isoformat()
+        explain = sqlite_full_scans if engine.dialect.name == 'sqlite' else postgres_full_scans
+
+        def scans(endpoint):
+            method, path, *body = endpoint
+            path = path.format(recent=recent)
+            with capture_statements(engine) as statements:
+                response = client.open(path, method=method, headers=headers, json=body[0] if body else None)
+                response.get_data()
+            if response.status_code >= 400:
+                return [(f'HTTP {response.status_code}', response.get_data(as_text=True))]
+            failures = []
+            with engine.connect() as conn:
+                for statement, parameters in statements:
+                    for scan in explain(conn, statement, parameters):
+                        failures.append((scan, ' '.join(statement.split())))
+            return failures
+
+        yield scans
+
+
+def check(database_url):
+    failures = []
+    with plan_checker(database_url) as scans:
+        for endpoint in ENDPOINTS:
+            failures.extend((endpoint[1], problem, statement) for problem, statement in scans(endpoint))
+    return failures
+
+
+def main():
+    with scratch_database() as database_url:
+        failures = check(database_url)
+
+    for path, problem, statement in failures:
+        print(f'FAIL {path}: {problem}\n    {statement}')
+    print(f'{len(ENDPOINTS)} endpoints checked, {len(failures)} full scans')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import hashlib
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Category, Location, Supplier
+
+# In-process cache for reference lists (categories, locations, suppliers).
+# Each resource has a version that is bumped whenever a change to it
+# commits; cached bodies from an older version are never served. The TTL
+# bounds how long another worker process can serve a stale list.
+
+REFERENCE_MODELS = {
+    Category: 'categories',
+    Location: 'locations',
+    Supplier: 'suppliers',
+}
+
+
+class ReferenceCache:
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._versions = defaultdict(int)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, resource, key, loader):
+        # Returns (etag, body); loader() builds the body on a miss
+        version = self._versions[resource]
+        entry = self._entries.get((resource, key))
+        if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+            return entry[2], entry[3]
+
+        body = loader()
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            self._entries[(resource, key)] = (version, time.monotonic() + self.ttl, etag, body)
+        return etag, body
+
+    def bump(self, resource):
+        with self._lock:
+            self._versions[resource] += 1
+            for key in [key for key in self._entries if key[0] == resource]:
+                del self._entries[key]
+
+    def version(self, resource):
+        return self._versions[resource]
+
+
+reference_cache = ReferenceCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_resources(session, flush_context):
+    changed = session.info.setdefault('reference_resources', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        resource = REFERENCE_MODELS.get(type(obj))
+        if resource:
+            changed.add(resource)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_changed_resources(session):
+    for resource in session.info.pop('reference_resources', ()):
+        reference_cache.bump(resource)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_resources(session):
+    session.info.pop('reference_resources', None)
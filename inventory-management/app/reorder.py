@@ -0,0 +1,228 @@
+import math
+from datetime import datetime, timedelta
+from statistics import NormalDist
+
+import numpy as np
+from sqlalchemy import select
+
+from models import Item, Supplier, MovementDayStat
+
+# Reorder planner. Item state and daily outbound history (from the
+# movement_day_stat rollups, not raw stock_movement rows) are loaded as
+# columns and the whole catalog is planned in one vectorized pass:
+#
+#   daily rate     exponentially weighted mean of daily outbound quantity
+#   safety stock   z(service level) * daily std dev * sqrt(lead time)
+#   reorder point  item.reorder_point, else rate * lead time + safety stock
+#   target level   item.maximum_stock, else rate * (lead time + review period) + safety stock
+#   suggestion     target - on hand, for items at or below their reorder point
+
+DEFAULT_PARAMETERS = {
+    'lead_time_days': 7.0,
+    'review_days': 14.0,
+    'service_level': 0.95,
+    'history_days': 90,
+    'half_life_days': 30.0,
+}
+
+
+class PlanError(ValueError):
+    pass
+
+
+def plan_parameters(values):
+    params = dict(DEFAULT_PARAMETERS)
+    for key, default in DEFAULT_PARAMETERS.items():
+        if values.get(key) is not None:
+            try:
+                params[key] = type(default)(values[key])
+            except (TypeError, ValueError):
+                raise PlanError(f'{key} must be a number')
+    if not 0.5 <= params['service_level'] < 1:
+        raise PlanError('service_level must be between 0.5 and 1')
+    if params['history_days'] < 1 or params['lead_time_days'] < 0 or params['review_days'] < 0 \
+            or params['half_life_days'] <= 0:
+        raise PlanError('history_days, lead_time_days, review_days and half_life_days must be positive')
+    return params
+
+
+def load_items(conn, supplier_id=None):
+    items = Item.__table__
+    query = select(
+        items.c.id, items.c.quantity, items.c.minimum_stock, items.c.maximum_stock,
+        items.c.reorder_point, items.c.unit_price, items.c.supplier_id,
+    ).order_by(items.c.id)
+    if supplier_id is not None:
+        query = query.where(items.c.supplier_id == supplier_id)
+    rows = conn.execute(query).all()
+    columns = list(zip(*rows)) if rows else [()] * 7
+    # As float64 a NULL becomes NaN, so "not set" survives into the vector maths
+    return {
+        'id': np.array(columns[0], dtype=np.int64),
+        'quantity': np.array(columns[1], dtype=np.float64),
+        'minimum_stock': np.array(columns[2], dtype=np.float64),
+        'maximum_stock': np.array(columns[3], dtype=np.float64),
+        'reorder_point': np.array(columns[4], dtype=np.float64),
+        'unit_price': np.array(columns[5], dtype=np.float64),
+        'supplier_id': np.array(columns[6], dtype=np.float64),
+    }
+
+
+def load_history(conn, since):
+    days = MovementDayStat.__table__
+    rows = conn.execute(
+        select(days.c.item_id, days.c.day, days.c.out_quantity)
+        .where(days.c.day >= since, days.c.out_quantity > 0)
+    ).all()
+    if not rows:
+        return np.array([], dtype=np.int64), np.array([], dtype='datetime64[D]'), np.array([], dtype=np.float64)
+    item_ids, day_values, quantities = zip(*rows)
+    return (
+        np.array(item_ids, dtype=np.int64),
+        np.array(day_values, dtype='datetime64[D]'),
+        np.array(quantities, dtype=np.float64),
+    )
+
+
+def compute_plan(items, history, params, today):
+    ids = items['id']
+    count = len(ids)
+    history_ids, history_days, history_quantity = history
+
+    # Map history rows onto item positions; rows for deleted items drop out
+    positions = np.searchsorted(ids, history_ids)
+    known = positions < count
+    known[known] = ids[positions[known]] == history_ids[known]
+    positions = positions[known]
+    age = (np.datetime64(today, 'D') - history_days[known]).astype(np.float64)
+    quantity = history_quantity[known]
+
+    # Exponentially weighted daily mean and variance; days without movement count as zero
+    decay = math.log(2) / params['half_life_days']
+    window = np.arange(params['history_days'], dtype=np.float64)
+    weight_total = np.exp(-decay * window).sum()
+    weights = np.exp(-decay * age)
+    rate = np.bincount(positions, weights=weights * quantity, minlength=count) / weight_total
+    second_moment = np.bincount(positions, weights=weights * quantity ** 2, minlength=count) / weight_total
+    std = np.sqrt(np.maximum(second_moment - rate ** 2, 0))
+
+    lead_time = params['lead_time_days']
+    z = NormalDist().inv_cdf(params['service_level'])
+    safety_stock = z * std * math.sqrt(lead_time)
+
+    on_hand = np.nan_to_num(items['quantity'], nan=0.0)
+    reorder_point = np.where(np.isnan(items['reorder_point']), rate * lead_time + safety_stock, items['reorder_point'])
+    # Never below the item's own minimum
+    reorder_point = np.fmax(reorder_point, items['minimum_stock'])
+    target = np.where(
+        np.isnan(items['maximum_stock']),
+        rate * (lead_time + params['review_days']) + safety_stock,
+        items['maximum_stock'],
+    )
+    target = np.maximum(target, reorder_point)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(rate > 0, on_hand / rate, np.inf)
+    suggested = np.where(on_hand <= reorder_point, np.ceil(np.maximum(target - on_hand, 0)), 0)
+    needs_reorder = suggested > 0
+    cost = suggested * np.nan_to_num(items['unit_price'], nan=0.0)
+
+    return {
+        'id': ids,
+        'quantity': on_hand,
+        'daily_rate': rate,
+        'demand_std': std,
+        'days_of_cover': days_of_cover,
+        'reorder_point': reorder_point,
+        'target_level': target,
+        'suggested_quantity': suggested,
+        'cost': cost,
+        'needs_reorder': needs_reorder,
+        'supplier_id': items['supplier_id'],
+        'unit_price': items['unit_price'],
+    }
+
+
+def _finite(value, digits=2):
+    return round(float(value), digits) if math.isfinite(value) else None
+
+
+def purchase_lists(conn, plan, include_all=False):
+    # Groups the plan per supplier; only rows needing a reorder unless include_all
+    selected = np.arange(len(plan['id'])) if include_all else np.flatnonzero(plan['needs_reorder'])
+    if not len(selected):
+        return []
+    items = Item.__table__
+    selected_ids = plan['id'][selected].tolist()
+    details = {}
+    for start in range(0, len(selected_ids), 5000):
+        chunk = selected_ids[start:start + 5000]
+        details.update({
+            row.id: row for row in conn.execute(
+                select(items.c.id, items.c.sku, items.c.name).where(items.c.id.in_(chunk))
+            )
+        })
+    suppliers = Supplier.__table__
+    names = dict(conn.execute(select(suppliers.c.id, suppliers.c.name)).all())
+
+    groups = {}
+    # Most urgent first within each supplier
+    for index in selected[np.argsort(plan['days_of_cover'][selected], kind='stable')]:
+        supplier = plan['supplier_id'][index]
+        supplier_id = None if np.isnan(supplier) else int(supplier)
+        group = groups.setdefault(supplier_id, {
+            'supplier_id': supplier_id,
+            'supplier_name': names.get(supplier_id),
+            'total_quantity': 0,
+            'total_cost': 0.0,
+            'items': [],
+        })
+        item_id = int(plan['id'][index])
+        detail = details.get(item_id)
+        suggested = int(plan['suggested_quantity'][index])
+        group['total_quantity'] += suggested
+        group['total_cost'] += float(plan['cost'][index])
+        group['items'].append({
+            'id': item_id,
+            'sku': detail.sku if detail else None,
+            'name': detail.name if detail else None,
+            'quantity': int(plan['quantity'][index]),
+            'daily_rate': _finite(plan['daily_rate'][index], 3),
+            'days_of_cover': _finite(plan['days_of_cover'][index], 1),
+            'reorder_point': _finite(plan['reorder_point'][index]),
+            'target_level': _finite(plan['target_level'][index]),
+            'suggested_quantity': suggested,
+            'unit_price': _finite(plan['unit_price'][index]),
+            'cost': round(float(plan['cost'][index]), 2),
+        })
+    for group in groups.values():
+        group['total_cost'] = round(group['total_cost'], 2)
+    return sorted(groups.values(), key=lambda group: -group['total_cost'])
+
+
+def reorder_suggestions(conn, values=None, now=None):
+    values = values or {}
+    params = plan_parameters(values)
+    supplier_id = values.get('supplier_id')
+    if supplier_id is not None:
+        try:
+            supplier_id = int(supplier_id)
+        except (TypeError, ValueError):
+            raise PlanError('supplier_id must be an integer')
+    today = (now or datetime.utcnow()).date()
+    since = today - timedelta(days=params['history_days'] - 1)
+
+    items = load_items(conn, supplier_id)
+    plan = compute_plan(items, load_history(conn, since), params, today)
+    suppliers = purchase_lists(conn, plan, include_all=bool(values.get('include_all')))
+    return {
+        'generated_at': datetime.utcnow().isoformat(),
+        'parameters': params,
+        'summary': {
+            'items_evaluated': int(len(plan['id'])),
+            'items_to_reorder': int(plan['needs_reorder'].sum()),
+            'total_quantity': int(plan['suggested_quantity'].sum()),
+            'total_cost': round(float(plan['cost'].sum()), 2),
+        },
+        'suppliers': suppliers,
+    }
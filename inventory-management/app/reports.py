@@ -0,0 +1,187 @@
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import func, select
+
+from models import Alert, Item, ItemStock, CategoryStat, CategoryMovementDayStat, MovementDayStat
+from aggregates import ensure_reconciled, movement_day
+from stock_ledger import stocked_at
+
+# Time-range reports for the reports dashboard. Movement figures come from the
+# daily rollups (one row per day and category, or day and item), never from
+# stock_movement; a quarter is ~90 rows per category whatever the volume.
+# Stock by location reads the stock ledger, which holds current levels only;
+# the rollups carry no location, so the inventory and movements reports can't
+# be filtered by one. The alerts report filters on items stocked there.
+# The chart series use the keys the dashboard binds to: barChartData items
+# are {name, value}, lineChartData items are {date, value}.
+
+REPORT_RANGES = {'week': 7, 'month': 30, 'quarter': 90, 'year': 365}
+
+
+class ReportError(ValueError):
+    pass
+
+
+def report_window(time_range, now=None):
+    if time_range not in REPORT_RANGES:
+        raise ReportError(f"Unknown range '{time_range}', expected one of: {', '.join(REPORT_RANGES)}")
+    end = (now or datetime.utcnow()).date()
+    return end - timedelta(days=REPORT_RANGES[time_range] - 1), end
+
+
+def _days(start, end):
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def _series(start, end, values):
+    return [{'date': day.isoformat(), 'value': values.get(day, 0)} for day in _days(start, end)]
+
+
+def _day_totals(session, start, end, category=None, item_id=None):
+    # {day: (in_quantity, in_count, out_quantity, out_count)}
+    table = (MovementDayStat if item_id is not None else CategoryMovementDayStat).__table__
+    query = select(
+        table.c.day,
+        func.sum(table.c.in_quantity), func.sum(table.c.in_count),
+        func.sum(table.c.out_quantity), func.sum(table.c.out_count),
+    ).where(table.c.day >= start, table.c.day <= end).group_by(table.c.day)
+    if item_id is not None:
+        query = query.where(table.c.item_id == item_id)
+    elif category is not None:
+        query = query.where(table.c.category == category)
+    return {row[0]: tuple(int(value or 0) for value in row[1:]) for row in session.execute(query)}
+
+
+def _no_location(report_type, location):
+    if location is not None:
+        raise ReportError(f"The {report_type} report can't be filtered by location; "
+                          f"use the locations report for stock per location")
+
+
+def inventory_report(session, start, end, category=None, item_id=None, location=None):
+    _no_location('inventory', location)
+    ensure_reconciled(session)
+    stats = CategoryStat.__table__
+    query = select(stats.c.category, stats.c.total_quantity, stats.c.total_value, stats.c.item_count) \
+        .where(stats.c.item_count > 0).order_by(stats.c.category)
+    if category is not None:
+        query = query.where(stats.c.category == category)
+    rows = session.execute(query).all()
+
+    # Walk back from today's stock level using each day's net movement
+    net = {day: totals[0] - totals[2] for day, totals in _day_totals(session, start, end, category).items()}
+    level = sum(row.total_quantity for row in rows)
+    levels = {}
+    for day in reversed(_days(start, end)):
+        levels[day] = level
+        level -= net.get(day, 0)
+
+    return {
+        'summary': {
+            'total_items': sum(row.item_count for row in rows),
+            'total_quantity': sum(row.total_quantity for row in rows),
+            'total_value': round(sum(row.total_value for row in rows), 2),
+        },
+        'barChartData': [{'name': row.category, 'value': row.total_quantity} for row in rows],
+        'lineChartData': _series(start, end, levels),
+    }
+
+
+def movements_report(session, start, end, category=None, item_id=None, location=None):
+    _no_location('movements', location)
+    days = _day_totals(session, start, end, category, item_id)
+    table = CategoryMovementDayStat.__table__
+    query = select(
+        table.c.category, func.sum(table.c.in_quantity + table.c.out_quantity)
+    ).where(table.c.day >= start, table.c.day <= end).group_by(table.c.category).order_by(table.c.category)
+    if category is not None:
+        query = query.where(table.c.category == category)
+    by_category = [] if item_id is not None else session.execute(query).all()
+
+    return {
+        'summary': {
+            'in_quantity': sum(totals[0] for totals in days.values()),
+            'in_count': sum(totals[1] for totals in days.values()),
+            'out_quantity': sum(totals[2] for totals in days.values()),
+            'out_count': sum(totals[3] for totals in days.values()),
+        },
+        'barChartData': [{'name': row[0], 'value': int(row[1] or 0)} for row in by_category],
+        'lineChartData': _series(start, end, {day: totals[1] + totals[3] for day, totals in days.items()}),
+    }
+
+
+def alerts_report(session, start, end, category=None, item_id=None, location=None):
+    # Alerts are low-volume; the created_at index bounds the range scan. With a
+    # location, only alerts for items stocked there count.
+    alerts = Alert.__table__
+    day = movement_day(session.connection(), alerts.c.created_at)
+    query = select(day, alerts.c.alert_type, func.count()).where(
+        alerts.c.created_at >= datetime.combine(start, time.min),
+        alerts.c.created_at < datetime.combine(end + timedelta(days=1), time.min),
+    ).group_by(day, alerts.c.alert_type)
+    if item_id is not None:
+        query = query.where(alerts.c.item_id == item_id)
+    elif category is not None:
+        items = Item.__table__
+        query = query.join_from(alerts, items, items.c.id == alerts.c.item_id).where(items.c.category == category)
+    if location is not None:
+        query = query.where(alerts.c.item_id.in_(stocked_at(location)))
+
+    by_type = {}
+    by_day = {}
+    for created, alert_type, count in session.execute(query):
+        if isinstance(created, str):
+            created = date.fromisoformat(created)
+        by_type[alert_type] = by_type.get(alert_type, 0) + count
+        by_day[created] = by_day.get(created, 0) + count
+
+    return {
+        'summary': {'total_alerts': sum(by_type.values()), 'by_type': by_type},
+        'barChartData': [{'name': alert_type, 'value': count} for alert_type, count in sorted(by_type.items())],
+        'lineChartData': _series(start, end, by_day),
+    }
+
+
+def locations_report(session, start, end, category=None, item_id=None, location=None):
+    # Current stock per location; for a single location, per category there
+    stock = ItemStock.__table__
+    items = Item.__table__
+    group = items.c.category if location is not None else stock.c.location
+    query = select(
+        group, func.count(), func.sum(stock.c.quantity),
+        func.coalesce(func.sum(stock.c.quantity * items.c.unit_price), 0),
+    ).join_from(stock, items, items.c.id == stock.c.item_id) \
+        .where(stock.c.quantity != 0).group_by(group).order_by(group)
+    if location is not None:
+        query = query.where(stock.c.location == location)
+    if item_id is not None:
+        query = query.where(stock.c.item_id == item_id)
+    elif category is not None:
+        query = query.where(items.c.category == category)
+    rows = session.execute(query).all()
+
+    return {
+        'summary': {
+            'stocked_items': sum(row[1] for row in rows),
+            'total_quantity': int(sum(row[2] for row in rows)),
+            'total_value': round(sum(row[3] for row in rows), 2),
+        },
+        'barChartData': [{'name': row[0], 'value': int(row[2])} for row in rows],
+        'lineChartData': [],
+    }
+
+
+REPORTS = {
+    'inventory': inventory_report,
+    'movements': movements_report,
+    'alerts': alerts_report,
+    'locations': locations_report,
+}
+
+
+def build_report(session, report_type, time_range='week', now=None, category=None, item_id=None, location=None):
+    if report_type not in REPORTS:
+        raise ReportError(f"Unknown report '{report_type}', expected one of: {', '.join(REPORTS)}")
+    start, end = report_window(time_range, now)
+    report = REPORTS[report_type](session, start, end, category=category, item_id=item_id, location=location)
+    return dict(report, type=report_type, range=time_range, start=start.isoformat(), end=end.isoformat())
@@ -0,0 +1,165 @@
+import re
+
+from sqlalchemy import text, select, func, literal_column
+
+# Full-text index over item name, sku and description, created by a migration.
+# SQLite uses an external-content FTS5 table kept in sync by triggers,
+# Postgres uses a GIN tsvector expression index for words plus pg_trgm indexes
+# that serve substring matches on name and sku (e.g. part of a SKU).
+
+SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS item_fts USING fts5(
+        name, sku, description,
+        content='item', content_rowid='id', prefix='2 3 4'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS item_fts_ai AFTER INSERT ON item BEGIN
+        INSERT INTO item_fts(rowid, name, sku, description)
+        VALUES (new.id, new.name, new.sku, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS item_fts_ad AFTER DELETE ON item BEGIN
+        INSERT INTO item_fts(item_fts, rowid, name, sku, description)
+        VALUES ('delete', old.id, old.name, old.sku, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS item_fts_au AFTER UPDATE OF name, sku, description ON item BEGIN
+        INSERT INTO item_fts(item_fts, rowid, name, sku, description)
+        VALUES ('delete', old.id, old.name, old.sku, old.description);
+        INSERT INTO item_fts(rowid, name, sku, description)
+        VALUES (new.id, new.name, new.sku, new.description);
+    END""",
+]
+
+PG_DOCUMENT = "to_tsvector('simple', coalesce(name, '') || ' ' || sku || ' ' || coalesce(description, ''))"
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_item_search_tsv ON item USING gin (({PG_DOCUMENT}))",
+    "CREATE INDEX IF NOT EXISTS ix_item_name_trgm ON item USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_item_sku_trgm ON item USING gin (sku gin_trgm_ops)",
+]
+
+# engine url -> whether the index exists
+_available = {}
+
+
+def _tokens(query):
+    return re.findall(r'\w+', query, re.UNICODE)
+
+
+def create_search_index(conn):
+    # Returns False on databases without a search index
+    if conn.dialect.name == 'sqlite':
+        existed = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'item_fts'"
+        )).first()
+        for statement in SQLITE_FTS_DDL:
+            conn.execute(text(statement))
+        # Index the rows that were already there before the triggers
+        if not existed:
+            conn.execute(text("INSERT INTO item_fts(item_fts) VALUES ('rebuild')"))
+    elif conn.dialect.name == 'postgresql':
+        for statement in POSTGRES_DDL:
+            conn.execute(text(statement))
+    else:
+        return False
+    return True
+
+
+def ensure_search_index(engine):
+    with engine.begin() as conn:
+        created = create_search_index(conn)
+    if created:
+        _available[str(engine.url)] = True
+    return created
+
+
+def rebuild_search_index(engine):
+    if not search_index_available(engine):
+        return False
+    if engine.dialect.name == 'sqlite':
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO item_fts(item_fts) VALUES ('rebuild')"))
+    # The Postgres index is an expression index and never drifts
+    return True
+
+
+def search_index_available(engine):
+    key = str(engine.url)
+    if key not in _available:
+        with engine.connect() as conn:
+            if engine.dialect.name == 'sqlite':
+                found = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'item_fts'"
+                )).first()
+            elif engine.dialect.name == 'postgresql':
+                found = conn.execute(text(
+                    "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_item_search_tsv'"
+                )).first()
+            else:
+                found = None
+        _available[key] = found is not None
+    return _available[key]
+
+
+def _fts_query(tokens):
+    # Every term must match, the last one as a prefix for typeahead
+    terms = ['"%s"' % token for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _tsquery(tokens):
+    return ' & '.join(token + ':*' for token in tokens)
+
+
+def _ilike_filter(items, query):
+    return (
+        (items.name.ilike(f'%{query}%')) |
+        (items.sku.ilike(f'%{query}%')) |
+        (items.description.ilike(f'%{query}%'))
+    )
+
+
+def _substring_filter(items, query):
+    # Served by the trigram indexes on Postgres
+    return items.name.ilike(f'%{query}%') | items.sku.ilike(f'%{query}%')
+
+
+def text_filter(engine, items, query):
+    # WHERE clause for free-text search, falling back to ILIKE without an index
+    tokens = _tokens(query)
+    if not search_index_available(engine):
+        return _ilike_filter(items, query)
+    if engine.dialect.name == 'sqlite':
+        if not tokens:
+            return _ilike_filter(items, query)
+        matches = select(literal_column('rowid')).select_from(text('item_fts')) \
+            .where(text('item_fts MATCH :fts_query').bindparams(fts_query=_fts_query(tokens)))
+        return items.id.in_(matches)
+    # Words through the tsvector, substrings of name and sku through the trigram indexes
+    if not tokens:
+        return _substring_filter(items, query)
+    return literal_column(PG_DOCUMENT).op('@@')(func.to_tsquery('simple', _tsquery(tokens))) \
+        | _substring_filter(items, query)
+
+
+def ranked_matches(engine, session, items, query, limit):
+    # Best matches first, for typeahead; returns (id, name, sku) rows
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+    if not search_index_available(engine):
+        stmt = select(items.id, items.name, items.sku) \
+            .where(_ilike_filter(items, query)).order_by(items.name).limit(limit)
+    elif engine.dialect.name == 'sqlite':
+        stmt = text(
+            "SELECT item.id, item.name, item.sku FROM item_fts "
+            "JOIN item ON item.id = item_fts.rowid "
+            "WHERE item_fts MATCH :fts_query ORDER BY bm25(item_fts, 10.0, 5.0, 1.0) LIMIT :limit"
+        ).bindparams(fts_query=_fts_query(tokens), limit=limit)
+    else:
+        tsquery = func.to_tsquery('simple', _tsquery(tokens))
+        document = literal_column(PG_DOCUMENT)
+        stmt = select(items.id, items.name, items.sku) \
+            .where(document.op('@@')(tsquery) | _substring_filter(items, query)) \
+            .order_by(func.ts_rank(document, tsquery).desc(), items.id).limit(limit)
+    return session.execute(stmt).all()
@@ -0,0 +1,65 @@
+from functools import lru_cache
+
+from sqlalchemy import DateTime, select
+
+from models import Item, Category, Location, Supplier, StockMovement, Alert, AuditLog
+
+# Builds response rows straight from Core result tuples: no ORM entities,
+# no identity map and no per-object to_dict(). ?fields=a,b,c narrows both
+# the SELECT list and the output.
+
+
+class FieldError(ValueError):
+    pass
+
+
+@lru_cache(maxsize=8192)
+def format_datetime(value):
+    return value.isoformat()
+
+
+def parse_fields(raw):
+    if not raw:
+        return None
+    return [field.strip() for field in raw.split(',') if field.strip()]
+
+
+class RowSerializer:
+    def __init__(self, model, exclude=()):
+        self.table = model.__table__
+        self.fields = [column.name for column in self.table.c if column.name not in exclude]
+
+    def columns(self, fields=None, required=()):
+        names = list(fields) if fields else list(self.fields)
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise FieldError(f"Unknown field(s): {', '.join(unknown)}")
+        names += [name for name in required if name not in names]
+        return [self.table.c[name] for name in names]
+
+    def select(self, fields=None, required=()):
+        return select(*self.columns(fields, required))
+
+    def row_values(self, rows, columns):
+        # Lists of JSON-ready values, in column order
+        datetimes = [index for index, column in enumerate(columns) if isinstance(column.type, DateTime)]
+        for row in rows:
+            values = list(row)
+            for index in datetimes:
+                value = values[index]
+                if value is not None:
+                    values[index] = format_datetime(value)
+            yield values
+
+    def to_dicts(self, rows, columns):
+        keys = [column.name for column in columns]
+        return [dict(zip(keys, values)) for values in self.row_values(rows, columns)]
+
+
+item_serializer = RowSerializer(Item)
+category_serializer = RowSerializer(Category)
+location_serializer = RowSerializer(Location)
+supplier_serializer = RowSerializer(Supplier)
+movement_serializer = RowSerializer(StockMovement)
+alert_serializer = RowSerializer(Alert)
+audit_log_serializer = RowSerializer(AuditLog)
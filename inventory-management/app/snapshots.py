@@ -0,0 +1,247 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import case, func, literal, select
+
+from models import Item, StockMovement, InventorySnapshot, InventorySnapshotItem
+
+logger = logging.getLogger(__name__)
+
+# Periodic inventory snapshots. Each snapshot copies per-item quantity and
+# unit_price for every stocked item in one INSERT ... SELECT. Stock as of a
+# timestamp is the latest snapshot at or before it plus the movements recorded
+# in between, so the replay never covers more than one snapshot interval.
+# Before the first snapshot the replay runs backwards from the oldest snapshot
+# (or from the live item table). Quantity set directly on an item (imports)
+# is not a movement and only shows up from the next snapshot on.
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def _hold_item_writers(conn):
+    # Waits for transactions that write items to commit and keeps new ones
+    # out until this transaction ends
+    if conn.dialect.name == 'postgresql':
+        conn.exec_driver_sql('LOCK TABLE item IN SHARE MODE')
+    elif conn.dialect.name == 'sqlite' and not conn.connection.in_transaction:
+        # SQLite has one writer; an open write transaction already holds the lock
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def take_snapshot(conn, now=None):
+    # Movements are stamped while they hold their item write locks, so once
+    # writers are held off every movement stamped before `now` is committed
+    # and copied below, and every later one is replayed on top
+    _hold_item_writers(conn)
+    now = now or datetime.utcnow()
+    items = Item.__table__
+    snapshots = InventorySnapshot.__table__
+    snapshot_items = InventorySnapshotItem.__table__
+
+    snapshot_id = conn.execute(snapshots.insert().values(taken_at=now)).inserted_primary_key[0]
+    conn.execute(snapshot_items.insert().from_select(
+        ['snapshot_id', 'item_id', 'quantity', 'unit_price'],
+        select(literal(snapshot_id), items.c.id, items.c.quantity, items.c.unit_price)
+        .where(items.c.quantity != 0)
+    ))
+    item_count, total_quantity, total_value = conn.execute(select(
+        func.count(), func.coalesce(func.sum(snapshot_items.c.quantity), 0),
+        func.coalesce(func.sum(snapshot_items.c.quantity * snapshot_items.c.unit_price), 0),
+    ).where(snapshot_items.c.snapshot_id == snapshot_id)).one()
+    conn.execute(snapshots.update().where(snapshots.c.id == snapshot_id).values(
+        item_count=item_count, total_quantity=total_quantity, total_value=total_value
+    ))
+    return {
+        'id': snapshot_id,
+        'taken_at': now.isoformat(),
+        'item_count': item_count,
+        'total_quantity': total_quantity,
+        'total_value': round(total_value, 2),
+    }
+
+
+def prune_snapshots(conn, keep_days, keep_months, now=None):
+    # Keeps every snapshot from the last keep_days, then the first snapshot of
+    # each month for keep_months months; the rest are deleted
+    now = now or datetime.utcnow()
+    snapshots = InventorySnapshot.__table__
+    snapshot_items = InventorySnapshotItem.__table__
+    recent = now - timedelta(days=keep_days)
+    oldest_month = (now.year * 12 + now.month - 1) - keep_months
+
+    rows = conn.execute(
+        select(snapshots.c.id, snapshots.c.taken_at)
+        .where(snapshots.c.taken_at < recent).order_by(snapshots.c.taken_at)
+    ).all()
+    kept_months = set()
+    stale = []
+    for snapshot_id, taken_at in rows:
+        month = taken_at.year * 12 + taken_at.month - 1
+        if month > oldest_month and month not in kept_months:
+            kept_months.add(month)
+        else:
+            stale.append(snapshot_id)
+    for start in range(0, len(stale), 500):
+        chunk = stale[start:start + 500]
+        conn.execute(snapshot_items.delete().where(snapshot_items.c.snapshot_id.in_(chunk)))
+        conn.execute(snapshots.delete().where(snapshots.c.id.in_(chunk)))
+    return len(stale)
+
+
+def _movement_deltas(conn, after, until, item_id=None):
+    # Net quantity change per item for movements in (after, until]
+    movements = StockMovement.__table__
+    signed = case(
+        (movements.c.movement_type == 'in', movements.c.quantity_changed),
+        else_=-movements.c.quantity_changed,
+    )
+    query = select(movements.c.item_id, func.sum(signed), func.count()) \
+        .where(movements.c.timestamp > after, movements.c.timestamp <= until) \
+        .group_by(movements.c.item_id)
+    if item_id is not None:
+        query = query.where(movements.c.item_id == item_id)
+    deltas = {}
+    replayed = 0
+    for row_item_id, delta, count in conn.execute(query):
+        deltas[row_item_id] = delta
+        replayed += count
+    return deltas, replayed
+
+
+def _base(conn, ts):
+    # Latest snapshot at or before ts, else the oldest snapshot after it
+    snapshots = InventorySnapshot.__table__
+    before = conn.execute(
+        select(snapshots.c.id, snapshots.c.taken_at).where(snapshots.c.taken_at <= ts)
+        .order_by(snapshots.c.taken_at.desc()).limit(1)
+    ).first()
+    if before:
+        return before
+    return conn.execute(
+        select(snapshots.c.id, snapshots.c.taken_at).where(snapshots.c.taken_at > ts)
+        .order_by(snapshots.c.taken_at).limit(1)
+    ).first()
+
+
+def stock_as_of(conn, ts, category=None, item_id=None, include_items=False, now=None):
+    now = now or datetime.utcnow()
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    if ts > now:
+        raise SnapshotError('ts must not be in the future')
+    items = Item.__table__
+    snapshot_items = InventorySnapshotItem.__table__
+
+    base = _base(conn, ts)
+    scope = [items.c.id == item_id] if item_id is not None else []
+    if base is None:
+        # No snapshots yet: start from the live table and undo later movements
+        base_at = now
+        stock = {
+            row.id: (row.quantity or 0, row.unit_price) for row in conn.execute(
+                select(items.c.id, items.c.quantity, items.c.unit_price).where(*scope)
+            )
+        }
+    else:
+        base_at = base.taken_at
+        rows = conn.execute(
+            select(snapshot_items.c.item_id, snapshot_items.c.quantity, snapshot_items.c.unit_price)
+            .where(snapshot_items.c.snapshot_id == base.id,
+                   *([snapshot_items.c.item_id == item_id] if item_id is not None else []))
+        )
+        stock = {row.item_id: (row.quantity, row.unit_price) for row in rows}
+
+    forward = base_at <= ts
+    deltas, replayed = _movement_deltas(conn, *((base_at, ts) if forward else (ts, base_at)), item_id=item_id)
+    details = {
+        row.id: row for row in conn.execute(
+            select(items.c.id, items.c.sku, items.c.name, items.c.category, items.c.unit_price, items.c.created_at)
+            .where(*scope)
+        )
+    }
+
+    quantities = {item: quantity for item, (quantity, _) in stock.items()}
+    for item, delta in deltas.items():
+        quantities[item] = quantities.get(item, 0) + (delta if forward else -delta)
+
+    by_category = defaultdict(lambda: {'item_count': 0, 'total_quantity': 0, 'total_value': 0.0})
+    stocked = []
+    for item, quantity in quantities.items():
+        if not quantity:
+            continue
+        detail = details.get(item)
+        if not forward and detail and detail.created_at and detail.created_at > ts:
+            # Replaying backwards: the item did not exist yet
+            continue
+        item_category = detail.category if detail else None
+        if category is not None and item_category != category:
+            continue
+        # Price as recorded in the snapshot; items it does not cover use today's price
+        unit_price = stock[item][1] if item in stock else (detail.unit_price if detail else None)
+        value = quantity * unit_price if unit_price is not None else 0.0
+        totals = by_category[item_category]
+        totals['item_count'] += 1
+        totals['total_quantity'] += quantity
+        totals['total_value'] += value
+        if include_items:
+            stocked.append({
+                'id': item,
+                'sku': detail.sku if detail else None,
+                'name': detail.name if detail else None,
+                'category': item_category,
+                'quantity': quantity,
+                'unit_price': unit_price,
+                'value': round(value, 2),
+            })
+
+    categories = [
+        dict(totals, category=name, total_value=round(totals['total_value'], 2))
+        for name, totals in sorted(by_category.items(), key=lambda pair: pair[0] or '')
+    ]
+    result = {
+        'as_of': ts.isoformat(),
+        'base': {
+            'snapshot_id': base.id if base else None,
+            'taken_at': base_at.isoformat(),
+            'direction': 'forward' if forward else 'backward',
+        },
+        'movements_replayed': replayed,
+        'summary': {
+            'item_count': sum(totals['item_count'] for totals in categories),
+            'total_quantity': sum(totals['total_quantity'] for totals in categories),
+            'total_value': round(sum(totals['total_value'] for totals in categories), 2),
+        },
+        'categories': categories,
+    }
+    if include_items:
+        result['items'] = sorted(stocked, key=lambda entry: entry['id'])
+    return result
+
+
+def start_snapshot_scheduler(engine, interval, keep_days, keep_months):
+    # Takes a snapshot whenever the latest one is `interval` old, then prunes
+    def run():
+        while True:
+            try:
+                with engine.begin() as conn:
+                    latest = conn.execute(select(func.max(InventorySnapshot.__table__.c.taken_at))).scalar()
+                    if latest is None or datetime.utcnow() - latest >= interval:
+                        snapshot = take_snapshot(conn)
+                        latest = datetime.fromisoformat(snapshot['taken_at'])
+                        pruned = prune_snapshots(conn, keep_days, keep_months, latest)
+                        logger.info(f"Inventory snapshot {snapshot['id']} taken, {pruned} old snapshots pruned")
+                wait = (latest + interval - datetime.utcnow()).total_seconds()
+            except Exception as e:
+                logger.error(f"Inventory snapshot failed: {str(e)}")
+                wait = 60
+            if stop.wait(max(wait, 1)):
+                return
+
+    stop = threading.Event()
+    thread = threading.Thread(target=run, name='inventory-snapshots', daemon=True)
+    thread.start()
+    return stop
@@ -0,0 +1,176 @@
+from datetime import datetime
+
+from sqlalchemy import event, exists, inspect, select
+from sqlalchemy.orm import Session
+
+from models import Item, ItemStock, Location, StockTransfer
+from aggregates import bump
+
+# Stock ledger: one row per (item, location) holding the quantity stored
+# there. Item.quantity stays the item's total, kept equal to the sum of its
+# rows by every write path in the same transaction: movements and transfers
+# name a location (the item's own location by default), while a quantity set
+# directly on the item (imports, ORM edits) is booked at the item's own
+# location. The ORM hook below covers session writes; Core writers call
+# apply_stock_deltas / apply_item_stock themselves. Movements and transfers
+# never take more than a location holds (InsufficientStock); a quantity set
+# directly can leave the item's own row negative, and such rows don't count
+# as stock at the location.
+
+
+class LedgerError(ValueError):
+    pass
+
+
+class ItemNotFound(LookupError):
+    pass
+
+
+class UnknownLocation(LedgerError):
+    pass
+
+
+class InsufficientStock(LedgerError):
+    pass
+
+
+def known_locations(conn, names):
+    locations = Location.__table__
+    names = {name for name in names if name}
+    if not names:
+        return set()
+    return set(conn.execute(select(locations.c.name).where(locations.c.name.in_(names))).scalars())
+
+
+def _prune(conn, keys, homes):
+    # Rows away from the item's own location are dropped once empty
+    stock = ItemStock.__table__
+    for item_id, location in keys:
+        if location != homes.get(item_id):
+            conn.execute(stock.delete().where(
+                stock.c.item_id == item_id, stock.c.location == location, stock.c.quantity <= 0
+            ))
+
+
+def take_stock(conn, item_id, location, quantity):
+    # The decrement only applies when enough stock is there, so two writers
+    # can't both take the last units
+    stock = ItemStock.__table__
+    taken = conn.execute(stock.update().where(
+        stock.c.item_id == item_id, stock.c.location == location, stock.c.quantity >= quantity
+    ).values(quantity=stock.c.quantity - quantity)).rowcount
+    if not taken:
+        raise InsufficientStock(f"Less than {quantity} of item {item_id} at {location}")
+
+
+def apply_stock_deltas(conn, deltas, homes, checked=False):
+    # deltas: {(item_id, location): quantity delta}; homes: {item_id: item location}.
+    # With checked, a decrement raises InsufficientStock rather than overdraw
+    # the location; quantities set directly on an item are booked unchecked.
+    stock = ItemStock.__table__
+    for (item_id, location), delta in deltas.items():
+        if checked and delta < 0:
+            take_stock(conn, item_id, location, -delta)
+        else:
+            bump(conn, stock, {'item_id': item_id, 'location': location}, {'quantity': delta})
+    _prune(conn, deltas, homes)
+
+
+def apply_item_stock(conn, changes):
+    # changes: (before, after) item rows with id, quantity and location; None
+    # for a created or deleted item. A change in quantity is booked at the
+    # item's location, and moving the item keeps a row at its new location.
+    stock = ItemStock.__table__
+    deltas = {}
+    homes = {}
+    moved = []
+    for before, after in changes:
+        if after is None:
+            conn.execute(stock.delete().where(stock.c.item_id == before['id']))
+            continue
+        homes[after['id']] = after['location']
+        key = (after['id'], after['location'])
+        deltas[key] = deltas.get(key, 0) + (after['quantity'] or 0) - ((before['quantity'] or 0) if before else 0)
+        if before and before['location'] != after['location']:
+            moved.append((before['id'], before['location']))
+    if deltas:
+        apply_stock_deltas(conn, deltas, homes)
+    _prune(conn, moved, homes)
+
+
+def transfer_stock(conn, item_id, from_location, to_location, quantity, reason=None, created_by=None, now=None):
+    if quantity <= 0:
+        raise LedgerError('quantity must be positive')
+    if from_location == to_location:
+        raise LedgerError('from_location and to_location must differ')
+    items = Item.__table__
+    home = conn.execute(select(items.c.location).where(items.c.id == item_id)).scalar()
+    if home is None:
+        raise ItemNotFound(f"Item {item_id} not found")
+    if to_location != home and to_location not in known_locations(conn, [to_location]):
+        raise UnknownLocation(f"Unknown location {to_location!r}")
+
+    take_stock(conn, item_id, from_location, quantity)
+    apply_stock_deltas(conn, {(item_id, to_location): quantity}, {item_id: home})
+    _prune(conn, [(item_id, from_location)], {item_id: home})
+
+    row = {
+        'item_id': item_id,
+        'from_location': from_location,
+        'to_location': to_location,
+        'quantity': quantity,
+        'reason': reason,
+        'timestamp': now or datetime.utcnow(),
+        'created_by': created_by,
+    }
+    row['id'] = conn.execute(StockTransfer.__table__.insert().values(**row)).inserted_primary_key[0]
+    return row
+
+
+def item_stock(conn, item_id):
+    stock = ItemStock.__table__
+    return conn.execute(
+        select(stock.c.location, stock.c.quantity).where(stock.c.item_id == item_id).order_by(stock.c.location)
+    ).all()
+
+
+def stocked_at(location):
+    # Item ids with stock at the location, for filtering item queries
+    stock = ItemStock.__table__
+    return select(stock.c.item_id).where(stock.c.location == location, stock.c.quantity > 0)
+
+
+def backfill(conn):
+    # Books each item's quantity at its own location, for items with no rows yet
+    items = Item.__table__
+    stock = ItemStock.__table__
+    conn.execute(stock.insert().from_select(
+        ['item_id', 'location', 'quantity'],
+        select(items.c.id, items.c.location, items.c.quantity)
+        .where(~exists().where(stock.c.item_id == items.c.id))
+    ))
+
+
+@event.listens_for(Session, 'after_flush')
+def _book_orm_changes(session, flush_context):
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Item):
+            changes.append((None, {'id': obj.id, 'quantity': obj.quantity, 'location': obj.location}))
+    for obj in session.dirty:
+        if isinstance(obj, Item) and session.is_modified(obj):
+            state = inspect(obj)
+            quantity = state.attrs.quantity.history
+            location = state.attrs.location.history
+            if quantity.has_changes() or location.has_changes():
+                before = {
+                    'id': obj.id,
+                    'quantity': quantity.deleted[0] if quantity.deleted else obj.quantity,
+                    'location': location.deleted[0] if location.deleted else obj.location,
+                }
+                changes.append((before, {'id': obj.id, 'quantity': obj.quantity, 'location': obj.location}))
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            changes.append(({'id': obj.id}, None))
+    if changes:
+        apply_item_stock(session.connection(), changes)
@@ -0,0 +1,15 @@
+import pytest
+
+import query_plans
+
+
+@pytest.fixture(scope='module')
+def scans():
+    with query_plans.scratch_database() as database_url, query_plans.plan_checker(database_url) as scans:
+        yield scans
+
+
+# Parametrized cases run in list order, which the endpoints depend on
+@pytest.mark.parametrize('endpoint', query_plans.ENDPOINTS, ids=lambda endpoint: f'{endpoint[0]} {endpoint[1]}')
+def test_no_full_scans(scans, endpoint):
+    assert scans(endpoint) == []